@@ -0,0 +1,71 @@
+import threading
+
+from locks import lock_state
+from standings import ROUND_ORDER, round_key
+
+CONTRARIANS_SHOWN = 25
+
+# contest_id -> (key, result). The key is the lock state (schedule version
+# plus how many games have locked) and the contest's picks_version, so a
+# kickoff or a pick write is the only thing that recomputes it.
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _compute(conn, schedule, locked):
+    ids = sorted(locked)
+    marks = ','.join('?' * len(ids))
+    # One grouped pass over the locked games' picks, read from the covering
+    # idx_picks_game_pick without touching the table.
+    counts = {}
+    for r in conn.execute(f'SELECT game_id, pick, COUNT(*) AS n FROM picks WHERE game_id IN ({marks}) '
+                          'GROUP BY game_id, pick', ids):
+        counts.setdefault(r['game_id'], [0, 0])[r['pick'] == 'team2'] = r['n']
+
+    games, by_round = [], {}
+    for g in schedule.picks_order:
+        if g.id not in locked:
+            continue
+        t1, t2 = counts.get(g.id, (0, 0))
+        total = t1 + t2
+        share = (t1 / total, t2 / total) if total else (None, None)
+        games.append({'id': g.id, 'bowl_name': g.bowl_name, 'team1': g.team1, 'team2': g.team2,
+                      'winner': g.winner, 'picks': total, 'team1_pct': share[0], 'team2_pct': share[1]})
+        if total:
+            by_round.setdefault(round_key(g.cfp_round), []).append(max(share))
+
+    # Consensus: how strongly the pool agreed, as the average majority share.
+    rounds = [{'round': r, 'games': len(by_round[r]), 'consensus': sum(by_round[r]) / len(by_round[r])}
+              for r in ROUND_ORDER if r in by_round]
+
+    # Contrarian score: the average share of the pool that picked the other
+    # side, over the player's picks in locked games.
+    contrarians = [dict(r) for r in conn.execute(
+        f"""WITH dist AS (
+                SELECT game_id, COUNT(*) AS n, SUM(pick='team1') AS t1 FROM picks
+                WHERE game_id IN ({marks}) GROUP BY game_id
+            )
+            SELECT p.user_id, u.display_name, COUNT(*) AS picks,
+                   AVG(1.0 - (CASE WHEN p.pick='team1' THEN d.t1 ELSE d.n - d.t1 END) * 1.0 / d.n) AS score
+            FROM dist d CROSS JOIN picks p ON p.game_id = d.game_id
+            JOIN users u ON u.id = p.user_id
+            GROUP BY p.user_id ORDER BY score DESC, u.display_name""", ids)]
+    return {'games': games, 'rounds': rounds, 'contrarians': contrarians}
+
+
+def pick_distribution(conn, schedule):
+    # Games are revealed only once locked, so nobody can copy the pool.
+    lock = lock_state(schedule)
+    picks_version = conn.execute('SELECT picks_version FROM contests WHERE id=?',
+                                 (schedule.contest_id,)).fetchone()['picks_version']
+    key = (lock.key, picks_version)
+    cached = _cache.get(schedule.contest_id)
+    if cached and cached[0] == key:
+        return cached[1]
+    if lock.locked:
+        result = _compute(conn, schedule, lock.locked)
+    else:
+        result = {'games': [], 'rounds': [], 'contrarians': []}
+    with _cache_lock:
+        _cache[schedule.contest_id] = (key, result)
+    return result
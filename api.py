@@ -0,0 +1,146 @@
+from flask import Blueprint, request, jsonify, make_response
+
+from db import get_conn
+from pickset import PICK_VALUES
+import pick_journal
+from schedule import get_schedule
+from snapshot import read_conn
+import standings
+import users
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+STANDINGS_PAGE = 100
+STANDINGS_MAX_PAGE = 1000
+
+API_GAME_FIELDS = ('id', 'bowl_name', 'team1', 'team2', 'game_date', 'game_time_et', 'network', 'location',
+                   'is_cfp', 'cfp_round', 'points_per_win', 'kickoff_ts', 'lock_ts', 'winner')
+
+
+def _error(message, status):
+    return jsonify({'error': message}), status
+
+
+def _not_modified(etag):
+    # Checked before any payload query runs; the tag itself costs one
+    # primary-key lookup of the version counters.
+    if request.if_none_match.contains(etag):
+        resp = make_response('', 304)
+        resp.set_etag(etag)
+        return resp
+    return None
+
+
+def _respond(payload, etag):
+    resp = jsonify(payload)
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
+
+
+def _contest_versions(contest_id):
+    # Read from the same place as the payload, so the tag matches it.
+    return read_conn().execute(
+        'SELECT schedule_version, standings_version FROM contests WHERE id=?', (contest_id,)).fetchone()
+
+
+def _picks_etag(user_id):
+    # Points awarded move with standings_version; picks with picks_version.
+    row = get_conn().execute(
+        'SELECT u.picks_version, c.standings_version FROM users u JOIN contests c ON c.id=u.contest_id WHERE u.id=?',
+        (user_id,)).fetchone()
+    return f'p{user_id}-{row["picks_version"]}-{row["standings_version"]}' if row else None
+
+
+@api.get('/contests/<int:contest_id>/games')
+def games(contest_id):
+    versions = _contest_versions(contest_id)
+    if versions is None:
+        return _error('contest not found', 404)
+    etag = f'g{contest_id}-{versions["schedule_version"]}'
+    cached = _not_modified(etag)
+    if cached:
+        return cached
+    schedule = get_schedule(read_conn(), contest_id)
+    payload = []
+    for game in schedule.games:
+        row = {f: game[f] for f in API_GAME_FIELDS}
+        # CFP slots filled by an earlier game's winner: {"team1": game_id}.
+        if game.id in schedule.bracket.feeds:
+            row['feeds'] = schedule.bracket.feeds[game.id]
+        payload.append(row)
+    return _respond({'contest_id': contest_id, 'version': schedule.version, 'games': payload}, etag)
+
+
+@api.get('/contests/<int:contest_id>/standings')
+def contest_standings(contest_id):
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(max(int(request.args.get('limit', STANDINGS_PAGE)), 1), STANDINGS_MAX_PAGE)
+    except ValueError:
+        return _error('offset and limit must be integers', 400)
+    versions = _contest_versions(contest_id)
+    if versions is None:
+        return _error('contest not found', 404)
+    etag = f's{contest_id}-{versions["standings_version"]}-{offset}-{limit}'
+    cached = _not_modified(etag)
+    if cached:
+        return cached
+    rows = standings.get_standings(read_conn(), contest_id)
+    return _respond({
+        'contest_id': contest_id,
+        'version': versions['standings_version'],
+        'total': len(rows),
+        'offset': offset,
+        'limit': limit,
+        'rows': [{'user_id': r['user_id'], 'name': r['display_name'], 'rank': r['rank'], 'points': r['points'],
+                  'correct': r['correct'], 'rounds': r['round_points'], 'max_points': r['max_points'],
+                  'eliminated': r['eliminated'], 'win_prob': r['win_prob']} for r in rows[offset:offset + limit]],
+    }, etag)
+
+
+@api.get('/me/picks')
+def my_picks():
+    user = users.current_user(get_conn)
+    if user is None:
+        return _error('login required', 401)
+    etag = _picks_etag(user['id'])
+    cached = _not_modified(etag)
+    if cached:
+        return cached
+    rows = get_conn().execute('SELECT game_id, pick, points_awarded FROM picks WHERE user_id=?', (user['id'],)).fetchall()
+    return _respond({
+        'contest_id': user['contest_id'],
+        'picks': {str(r['game_id']): r['pick'] for r in rows},
+        'points': {str(r['game_id']): r['points_awarded'] for r in rows if r['points_awarded']},
+    }, etag)
+
+
+@api.put('/me/picks')
+def put_my_picks():
+    # Body: {"picks": {"<game_id>": "team1" | "team2", ...}}. Each game is
+    # accepted or rejected on its own; the report says which and why.
+    user = users.current_user(get_conn)
+    if user is None:
+        return _error('login required', 401)
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('picks'), dict):
+        return _error('expected {"picks": {game_id: "team1"|"team2"}}', 400)
+    conn = get_conn()
+    schedule = get_schedule(conn, user['contest_id'])
+    submitted, invalid = {}, []
+    for key, pick in body['picks'].items():
+        gid = int(key) if str(key).isdigit() else None
+        if gid not in schedule.by_id or pick not in PICK_VALUES:
+            invalid.append(key)
+        else:
+            submitted[gid] = pick
+    if invalid:
+        return _error(f'unknown game or pick: {", ".join(map(str, invalid))}', 400)
+    try:
+        accepted, report = pick_journal.save(conn, schedule, user['id'], submitted)
+    except pick_journal.NotConfirmed as e:
+        return _error(str(e), 503)
+    resp = jsonify({'accepted': len(accepted), 'report': {str(gid): status for gid, status in report.items()}})
+    resp.set_etag(_picks_etag(user['id']))
+    return resp
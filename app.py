@@ -1,75 +1,174 @@
-
-import os
-from datetime import datetime
-from zoneinfo import ZoneInfo
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-from db import init_db, get_conn
 import logging
+import os
+from flask import Blueprint, Flask, Response, current_app, render_template, request, redirect, url_for, session, flash, g
+import db
+from db import get_conn, pool
+from pickset import form_picks, ACCEPTED, LOCKED, NEEDS_PRIOR_PICK
+import standings
+import jobs
+import scoring
+import users
+import live
+import analytics
+import bulk
+import metrics
+import pick_journal
+import seasons
+import snapshot
+from snapshot import read_conn
+from api import api
+from locks import lock_state
+from schedule import get_schedule, stats as schedule_stats
+
+# Import the scrape stack (requests, bs4, pandas) and numpy while building
+# the app rather than on first use. Under gunicorn --preload that happens
+# once in the master and workers share it; otherwise every worker pays at boot.
+PRELOAD_IMPORTS = os.getenv('PRELOAD_IMPORTS', '0') == '1'
+# Most recent contests whose schedule and standings are cached at startup.
+WARM_CONTESTS = int(os.getenv('WARM_CONTESTS', '8'))
+# With AUTO_MIGRATE=0 a worker refuses to start on an old schema instead of
+# migrating it; run `python db.py` as a release step.
+AUTO_MIGRATE = os.getenv('AUTO_MIGRATE', '1') == '1'
+
+log = logging.getLogger(__name__)
+
+web = Blueprint('web', __name__)
+
+metrics.gauges.append(lambda: {f'db_pool_{k}': v for k, v in pool.stats().items()})
+metrics.gauges.append(snapshot.gauges)
+metrics.gauges.append(pick_journal.gauges)
+
+
+def create_app():
+    app = Flask(__name__, template_folder='templates', static_folder='static')
+    app.secret_key = os.getenv('SECRET_KEY', 'dev-secret-key')
+    metrics.init_app(app)
+    snapshot.init_app(app)
+    db.init_app(app)
+    app.register_blueprint(web)
+    app.register_blueprint(api)
+    check_schema()
+    if PRELOAD_IMPORTS:
+        preload_imports()
+    warm(app)
+    # Connections opened above must not be inherited by forked workers. Nor
+    # may threads, which a fork does not copy: the background workers (jobs,
+    # the live broadcaster, the pick journal, the outlook queue) start on
+    # first use, never here.
+    pool.clear()
+    return app
+
+
+def check_schema():
+    conn = pool.acquire()
+    try:
+        if db.schema_current(conn):
+            return
+        if not AUTO_MIGRATE:
+            raise RuntimeError(f'database schema is behind version {db.LATEST_VERSION}; run `python db.py`')
+        log.info('migrated schema: %s', db.migrate(conn))
+    finally:
+        conn.close()
 
-# app.py
 
-from flask import Flask
+def preload_imports():
+    import scrape  # noqa: F401
+    import results  # noqa: F401
+    try:
+        import simulate  # noqa: F401
+    except ImportError:
+        pass
+
+
+def warm(app):
+    # Compiled templates and the busiest contests' schedule and standings,
+    # cached before any request (and, with --preload, before the fork, so
+    # workers share the pages copy-on-write until a version moves).
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    if WARM_CONTESTS <= 0:
+        return
+    conn = pool.acquire()
+    try:
+        for row in conn.execute('SELECT id FROM contests ORDER BY created_at DESC, id DESC LIMIT ?',
+                                (WARM_CONTESTS,)).fetchall():
+            get_schedule(conn, row['id'])
+            standings.get_standings(conn, row['id'])
+    finally:
+        conn.close()
 
-app = Flask(__name__, template_folder="templates", static_folder="static")
 
-# --- Health check route (GET & HEAD) ---
-@app.route("/healthz", methods=["GET", "HEAD"])
-def healthz():
-    return "ok", 200
+def __getattr__(name):
+    # `app.app` (gunicorn app:app, tests) is built on first access, so
+    # gunicorn 'app:create_app()' and importing this module build no extra app.
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
-PT = ZoneInfo('America/Los_Angeles')
 
-app = Flask(__name__)
-app.secret_key = os.getenv('SECRET_KEY', 'dev-secret-key')
+@web.route('/healthz', methods=['GET', 'HEAD'])
+def healthz():
+    return 'ok', 200
 
 
-@app.get("/debug/routes")
+@web.get("/debug/routes")
 def debug_routes():
     # returns a list of (endpoint, methods, rule) so you can confirm /healthz exists
     rules = []
-    for rule in app.url_map.iter_rules():
+    for rule in current_app.url_map.iter_rules():
         rules.append({
             "endpoint": rule.endpoint,
             "methods": sorted(m for m in rule.methods if m not in {"HEAD", "OPTIONS"}),
             "rule": str(rule)
                })
+    return {"routes": rules}, 200
 
 
-# Initialize the database when the app is created (Flask 3.x safe)
-with app.app_context():
-    init_db()
+@web.get("/debug/pool")
+def debug_pool():
+    return pool.stats(), 200
+
+
+@web.get("/debug/caches")
+def debug_caches():
+    return {"schedule": schedule_stats, "users": users.stats, "live": live.broadcaster.stats,
+            "snapshot": snapshot.snapshot.report(), "pick_journal": pick_journal.journal.stats,
+            "outlook": standings.outlook.stats}, 200
 
 
 # Helpers
 
+@web.before_app_request
+def fill_session():
+    # contest_id and role ride in the signed session, so routes that only
+    # need those never look the user up. Sessions issued before they were
+    # stored get them filled in from the user once.
+    if session.get('user_id') and not ('contest_id' in session and 'role' in session):
+        user = current_user()
+        if user is not None:
+            session.setdefault('contest_id', user['contest_id'])
+            session.setdefault('role', user['role'])
+
 def current_user():
-    uid = session.get('user_id')
-    if not uid:
-        return None
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM users WHERE id=?', (uid,))
-    user = cur.fetchone()
-    conn.close()
-    return user
+    return users.current_user(get_conn)
 
 def require_manager():
-    user = current_user()
-    if not user or user['role'] != 'manager':
+    if session.get('role') != 'manager' or not session.get('user_id'):
         flash('Manager access required.', 'error')
         return False
     return True
 
 # Routes
 
-@app.get("/")
+@web.get("/")
 def landing():
     try:
         conn = get_conn()
         cur = conn.cursor()
         cur.execute("SELECT id, name FROM contests ORDER BY created_at DESC")
         contests = cur.fetchall()
-        conn.close()
 
         # HEAD-safe: return headers quickly without rendering (optional)
         if request.method == "HEAD":
@@ -84,31 +183,35 @@ def landing():
 
 
 
-@app.get('/contest/create')
+@web.get('/contest/create')
 def create_contest_form():
-    return render_template('create_contest.html')
+    seasons_list = get_conn().execute('SELECT id, name FROM seasons ORDER BY id DESC').fetchall()
+    return render_template('create_contest.html', seasons=seasons_list)
 
-@app.post('/contest/create')
+@web.post('/contest/create')
 def create_contest():
     name = request.form.get('name')
     access_code = request.form.get('access_code')
     admin_code = request.form.get('admin_code')
     if not all([name, access_code, admin_code]):
         flash('All fields are required.', 'error')
-        return redirect(url_for('create_contest_form'))
+        return redirect(url_for('.create_contest_form'))
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute('INSERT INTO contests (name, access_code, admin_code) VALUES (?, ?, ?)', (name, access_code, admin_code))
+    season_id = request.form.get('season_id', type=int)
+    cur.execute('INSERT INTO contests (name, access_code, admin_code, season_id) VALUES (?, ?, ?, ?)',
+                (name, access_code, admin_code, season_id))
+    if season_id is not None:
+        seasons.materialize(conn, cur.lastrowid)
     conn.commit()
-    conn.close()
     flash(f'Contest "{name}" created. Share the access code with players.')
-    return redirect(url_for('landing'))
+    return redirect(url_for('.landing'))
 
-@app.get('/admin')
+@web.get('/admin')
 def admin_login_form():
     return render_template('admin_login.html')
 
-@app.post('/admin')
+@web.post('/admin')
 def admin_login():
     contest_id = request.form.get('contest_id')
     admin_code = request.form.get('admin_code')
@@ -118,20 +221,21 @@ def admin_login():
     contest = cur.fetchone()
     if not contest:
         flash('Invalid admin code or contest.', 'error')
-        return redirect(url_for('admin_login_form'))
+        return redirect(url_for('.admin_login_form'))
     cur.execute('INSERT INTO users (contest_id, display_name, role) VALUES (?, ?, ?)', (contest['id'], 'Manager', 'manager'))
+    standings.add_player(cur, contest['id'], cur.lastrowid)
     conn.commit()
+    users.invalidate(cur.lastrowid)
     session['user_id'] = cur.lastrowid
     session['contest_id'] = contest['id']
     session['role'] = 'manager'
-    conn.close()
-    return redirect(url_for('manage_games'))
+    return redirect(url_for('.manage_games'))
 
-@app.get('/join')
+@web.get('/join')
 def join_form():
     return render_template('join.html')
 
-@app.post('/join')
+@web.post('/join')
 def join():
     display_name = request.form.get('display_name')
     access_code = request.form.get('access_code')
@@ -142,181 +246,180 @@ def join():
     contest = cur.fetchone()
     if not contest:
         flash('Invalid access code or contest.', 'error')
-        return redirect(url_for('join_form'))
+        return redirect(url_for('.join_form'))
     cur.execute('INSERT INTO users (contest_id, display_name, role) VALUES (?, ?, ?)', (contest['id'], display_name, 'player'))
+    standings.add_player(cur, contest['id'], cur.lastrowid)
     conn.commit()
+    users.invalidate(cur.lastrowid)
     session['user_id'] = cur.lastrowid
     session['contest_id'] = contest['id']
     session['role'] = 'player'
-    conn.close()
-    return redirect(url_for('picks'))
+    return redirect(url_for('.picks'))
 
 # Picks page
-@app.get('/picks')
+@web.get('/picks')
 def picks():
     user = current_user()
     if not user:
-        return redirect(url_for('join_form'))
+        return redirect(url_for('.join_form'))
     contest_id = user['contest_id']
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute('SELECT * FROM games WHERE contest_id=? ORDER BY is_cfp ASC, game_date, id', (contest_id,))
-    games = cur.fetchall()
+    schedule = get_schedule(conn, contest_id)
     cur.execute('SELECT game_id, pick FROM picks WHERE user_id=?', (user['id'],))
     picks_map = {row['game_id']: row['pick'] for row in cur.fetchall()}
 
-    cur.execute('SELECT game_id, slot, depends_on_game_id FROM cfp_links WHERE game_id IN (SELECT id FROM games WHERE contest_id=?)', (contest_id,))
-    links = cur.fetchall()
-    link_map = {}
-    for l in links:
-        link_map.setdefault(l['game_id'], []).append({'slot': l['slot'], 'depends_on': l['depends_on_game_id']})
-
-    def resolved_team_name(dep_game_id):
-        earlier_pick = picks_map.get(dep_game_id)
-        if not earlier_pick:
-            return None
-        for g in games:
-            if g['id'] == dep_game_id:
-                return g['team1'] if earlier_pick == 'team1' else g['team2']
-        return None
-
+    resolved = schedule.bracket.resolve(picks_map)
+    locked = lock_state(schedule).locked
     display_games = []
-    for g in games:
-        t1, t2 = g['team1'], g['team2']
-        if g['is_cfp'] == 1:
-            for l in link_map.get(g['id'], []):
-                if l['slot'] == 'team1':
-                    rt = resolved_team_name(l['depends_on'])
-                    if rt:
-                        t1 = rt
-                elif l['slot'] == 'team2':
-                    rt = resolved_team_name(l['depends_on'])
-                    if rt:
-                        t2 = rt
-        display_games.append({**dict(g), 'disp_team1': t1, 'disp_team2': t2})
-
-    conn.close()
+    for g in schedule.picks_order:
+        t1, t2 = resolved[g.id]
+        display_games.append({**g._asdict(), 'disp_team1': t1, 'disp_team2': t2, 'locked': g.id in locked})
+
     return render_template('picks.html', games=display_games, picks_map=picks_map)
 
-@app.post('/picks')
+@web.post('/picks')
 def save_picks():
     user = current_user()
     if not user:
-        return redirect(url_for('join_form'))
-    now_pt = datetime.now(PT)
+        return redirect(url_for('.join_form'))
     conn = get_conn()
-    cur = conn.cursor()
-
-    cur.execute('SELECT * FROM games WHERE contest_id=?', (user['contest_id'],))
-    all_games = cur.fetchall()
-
-    cur.execute('SELECT game_id, slot, depends_on_game_id FROM cfp_links WHERE game_id IN (SELECT id FROM games WHERE contest_id=?)', (user['contest_id'],))
-    links = cur.fetchall()
-    dep_map = {}
-    for l in links:
-        dep_map.setdefault(l['game_id'], []).append({'slot': l['slot'], 'depends_on': l['depends_on_game_id']})
-
-    for g in all_games:
-        pid = f"pick_{g['id']}"
-        pick = request.form.get(pid)
-        if pick not in ('team1','team2'):
-            continue
-        lock_pt = g['lock_pt']
-        if lock_pt:
-            try:
-                lock_dt = datetime.fromisoformat(lock_pt)
-                if now_pt >= lock_dt:
-                    continue
-            except Exception:
-                pass
-        if g['is_cfp'] == 1:
-            deps = dep_map.get(g['id'], [])
-            for d in deps:
-                if d['slot'] == pick:
-                    cur.execute('SELECT pick FROM picks WHERE user_id=? AND game_id=?', (user['id'], d['depends_on']))
-                    if not cur.fetchone():
-                        pick = None
-                        break
-            if pick is None:
-                continue
-        try:
-            cur.execute('INSERT INTO picks (user_id, game_id, pick) VALUES (?, ?, ?)', (user['id'], g['id'], pick))
-        except Exception:
-            cur.execute('UPDATE picks SET pick=? WHERE user_id=? AND game_id=?', (pick, user['id'], g['id']))
-
-    conn.commit()
-    conn.close()
-    flash('Picks saved!', 'success')
-    return redirect(url_for('picks'))
-
-@app.get('/manage/games')
+    schedule = get_schedule(conn, user['contest_id'])
+    submitted = form_picks(request.form, schedule.games)
+    try:
+        accepted, report = pick_journal.save(conn, schedule, user['id'], submitted)
+    except pick_journal.NotConfirmed as e:
+        flash(str(e), 'error')
+        return redirect(url_for('.picks'))
+
+    flash(f'Picks saved! ({len(accepted)} of {len(submitted)} accepted)', 'success')
+    rejected = {gid: status for gid, status in report.items() if status != ACCEPTED}
+    if rejected:
+        names = {g.id: g.bowl_name for g in schedule.games}
+        reasons = {LOCKED: 'locked', NEEDS_PRIOR_PICK: 'pick the earlier round first'}
+        flash('Not saved: ' + '; '.join(f'{names[gid]} ({reasons[status]})' for gid, status in rejected.items()), 'warning')
+    return redirect(url_for('.picks'))
+
+@web.get('/manage/games')
 def manage_games():
     if not require_manager():
-        return redirect(url_for('admin_login_form'))
+        return redirect(url_for('.admin_login_form'))
     contest_id = session.get('contest_id')
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM games WHERE contest_id=? ORDER BY game_date, id', (contest_id,))
-    games = cur.fetchall()
-    conn.close()
+    games = get_schedule(get_conn(), contest_id).games
     return render_template('manage_games.html', games=games)
 
-@app.post('/manage/games')
+@web.post('/manage/games')
 def update_winners():
     if not require_manager():
-        return redirect(url_for('admin_login_form'))
+        return redirect(url_for('.admin_login_form'))
     contest_id = session.get('contest_id')
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute('SELECT id, points_per_win FROM games WHERE contest_id=?', (contest_id,))
-
-    for row in cur.fetchall():
-        gid = str(row['id'])
-        winner = request.form.get(f'winner_{gid}')
-        if winner in ('team1', 'team2'):
-            cur.execute('UPDATE games SET winner=? WHERE id=?', (winner, gid))
-            cur.execute('UPDATE picks SET points_awarded=CASE WHEN pick=? THEN ? ELSE 0 END WHERE game_id=?', (winner, row['points_per_win'], gid))
+    season_id = cur.execute('SELECT season_id FROM contests WHERE id=?', (contest_id,)).fetchone()['season_id']
+    cur.execute('SELECT id, season_game_id FROM games WHERE contest_id=?', (contest_id,))
+    rows = cur.fetchall()
+    if season_id is not None:
+        # A result belongs to the season: every contest on it is scored.
+        submitted = {row['season_game_id']: request.form.get(f"winner_{row['id']}") for row in rows}
+        results = seasons.set_winners(conn, season_id, submitted)
+    else:
+        submitted = {row['id']: request.form.get(f"winner_{row['id']}") for row in rows}
+        results = {contest_id: scoring.apply_winners(conn, contest_id, submitted)}
     conn.commit()
-    conn.close()
-    flash('Winners updated and points awarded.', 'success')
-    return redirect(url_for('manage_games'))
-
-@app.get('/scoreboard')
+    # The outlook simulation runs on the worker's background thread; the
+    # scoreboard shows new points now and new odds a moment later.
+    standings.outlook.mark(*(cid for cid, changed in results.items() if changed))
+    live.broadcaster.notify()
+    changed = results.get(contest_id, [])
+    others = sum(1 for cid, ids in results.items() if ids and cid != contest_id)
+    flash(f'Winners updated for {len(changed)} games and points awarded'
+          + (f' (and in {others} other contests on this season).' if others else '.'), 'success')
+    return redirect(url_for('.manage_games'))
+
+@web.get('/scoreboard')
 def scoreboard():
     contest_id = session.get('contest_id')
-    conn = get_conn()
+    conn = read_conn()
     cur = conn.cursor()
     if not contest_id:
         cur.execute('SELECT id FROM contests ORDER BY created_at DESC LIMIT 1')
         row = cur.fetchone()
         contest_id = row['id'] if row else None
-    rows = []
-    if contest_id:
-        cur.execute(
-            'SELECT u.display_name, COALESCE(SUM(p.points_awarded),0) AS points FROM users u LEFT JOIN picks p ON p.user_id=u.id WHERE u.contest_id=? GROUP BY u.id ORDER BY points DESC, u.display_name',
-            (contest_id,)
-        )
-        rows = cur.fetchall()
-    conn.close()
-    return render_template('scoreboard.html', rows=rows)
-
-@app.post('/admin/scrape')
+    rows = standings.get_standings(conn, contest_id) if contest_id else ()
+    rounds = [r for r in standings.ROUND_ORDER if any(row['round_points'].get(r) for row in rows)]
+    return render_template('scoreboard.html', rows=rows, rounds=rounds, contest_id=contest_id)
+
+@web.get('/contests/<int:contest_id>/scoreboard/stream')
+def scoreboard_stream(contest_id):
+    # Server-sent events: a snapshot, then standings deltas as winners are
+    # entered. Each open stream holds a worker thread, so run with threaded
+    # workers (e.g. gunicorn -k gthread).
+    conn = get_conn()
+    if conn.execute('SELECT 1 FROM contests WHERE id=?', (contest_id,)).fetchone() is None:
+        return {'error': 'contest not found'}, 404
+    sub, version, rows = live.broadcaster.subscribe(conn, contest_id)
+    return Response(live.stream(sub, version, rows), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@web.get('/analytics')
+def pick_analytics():
+    contest_id = session.get('contest_id')
+    conn = read_conn()
+    if not contest_id:
+        row = conn.execute('SELECT id FROM contests ORDER BY created_at DESC LIMIT 1').fetchone()
+        contest_id = row['id'] if row else None
+    if not contest_id:
+        return render_template('analytics.html', games=[], rounds=[], contrarians=[], me=None)
+    # Picks are not in the read snapshot; the result is cached per picks_version.
+    dist = analytics.pick_distribution(get_conn(), get_schedule(conn, contest_id))
+    contrarians = dist['contrarians']
+    me = session.get('user_id')
+    shown = contrarians[:analytics.CONTRARIANS_SHOWN]
+    shown += [c for c in contrarians[analytics.CONTRARIANS_SHOWN:] if c['user_id'] == me]
+    return render_template('analytics.html', games=dist['games'], rounds=dist['rounds'], contrarians=shown, me=me)
+
+def scrape_job(progress, contest_id, force):
+    from scrape import sync_from_url, NCAA_URL
+    return sync_from_url(contest_id, NCAA_URL, force=force, progress=progress)
+
+@web.post('/admin/scrape')
 def admin_scrape():
     if not require_manager():
-        return redirect(url_for('admin_login_form'))
-    from scrape import scrape_ncaa, NCAA_URL, load_into_db, build_cfp_links
+        return redirect(url_for('.admin_login_form'))
     contest_id = session.get('contest_id')
-    df = scrape_ncaa(NCAA_URL)
-    load_into_db(contest_id, df)
-    build_cfp_links(contest_id)
-    flash(f'Loaded {len(df)} games from NCAA and rebuilt CFP links.', 'success')
-    return redirect(url_for('manage_games'))
-
-if __name__ == '__main__':
-    app.run(debug=True)
-
-
-@app.get("/debug/templates")
+    job_id, started = jobs.submit(contest_id, 'scrape', scrape_job, contest_id, bool(request.form.get('force')))
+    if not started:
+        flash('A scrape is already running for this contest.', 'info')
+    return redirect(url_for('.job_status', job_id=job_id))
+
+@web.get('/manage/export/<kind>.<fmt>')
+def export(kind, fmt):
+    # Streamed download of the pick matrix or standings, built batch by batch.
+    if not require_manager():
+        return redirect(url_for('.admin_login_form'))
+    if kind not in bulk.EXPORTS or fmt not in bulk.FORMATS:
+        return {'error': 'not found'}, 404
+    contest_id = session.get('contest_id')
+    try:
+        body = bulk.export_stream(contest_id, kind, fmt)
+    except ImportError:
+        flash('Parquet export needs pyarrow installed on the server; CSV is available.', 'error')
+        return redirect(url_for('.manage_games'))
+    return Response(body, mimetype=bulk.MIMETYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename=contest-{contest_id}-{kind}.{fmt}'})
+
+@web.get('/admin/jobs/<int:job_id>')
+def job_status(job_id):
+    if not require_manager():
+        return redirect(url_for('.admin_login_form'))
+    job = jobs.get_job(get_conn(), job_id)
+    if not job or job['contest_id'] != session.get('contest_id'):
+        return {'error': 'not found'}, 404
+    if request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json':
+        return job, 200
+    return render_template('job_status.html', job=job)
+
+@web.get("/debug/templates")
 def debug_templates():
     import os
     root = os.getcwd()  # on Render, this should be /opt/render/project/src
@@ -327,15 +430,6 @@ def debug_templates():
         files = [f"<error: {e}>"]
     return {"cwd": root, "templates_list": files}, 200
 
-@app.get("/debug/routes")
-def debug_routes():
-       rules = []
-    for rule in app.url_map.iter_rules():
-        rules.append({
-            "endpoint": rule.endpoint,
-            "methods": sorted(m for m in rule.methods if m not in {"HEAD", "OPTIONS"}),
-            "rule": str(rule)
-        })
-
-
 
+if __name__ == '__main__':
+    create_app().run(debug=True)
@@ -0,0 +1,102 @@
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import seasons
+from scrape import iter_records, page_lines
+
+WORKERS = int(os.getenv('BACKFILL_WORKERS', '0')) or os.cpu_count() or 2
+
+# First 19xx/20xx in a file name, e.g. schedule-2023-24.html -> 2023.
+YEAR_RE = re.compile(r'(?<!\d)(?:19|20)\d\d(?!\d)')
+
+
+def season_year(path):
+    m = YEAR_RE.search(os.path.basename(path))
+    if not m:
+        raise ValueError(f'{path}: no season year in the file name; pass --year')
+    return int(m.group())
+
+
+def season_name(year):
+    return f'{year}-{(year + 1) % 100:02d}'
+
+
+def parse_page(job):
+    # Runs in a worker process. Only the records cross back, not the soup.
+    path, year = job
+    with open(path, encoding='utf-8', errors='replace') as f:
+        html = f.read()
+    return list(iter_records(page_lines(html), year))
+
+
+def parsed_pages(jobs, workers=WORKERS):
+    # (path, year, records) in argument order, parsed `workers` at a time, so
+    # loading one page overlaps parsing the next ones.
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield job + (parse_page(job),)
+        return
+    with ProcessPoolExecutor(min(workers, len(jobs))) as pool:
+        for job, records in zip(jobs, pool.map(parse_page, jobs)):
+            yield job + (records,)
+
+
+def season_id_for(conn, name, create=True):
+    row = conn.execute('SELECT id FROM seasons WHERE name=?', (name,)).fetchone()
+    if row:
+        return row['id']
+    return seasons.create_season(conn.cursor(), name) if create else None
+
+
+def backfill(conn, jobs, workers=WORKERS, dry_run=False, progress=print):
+    # Loads each archived page into the season catalog named for its year,
+    # one transaction per page; contests on those seasons follow. A page that
+    # parses to nothing is reported and skipped. Returns per-page results.
+    results = []
+    for path, year, records in parsed_pages(jobs, workers):
+        name = season_name(year)
+        result = {'path': path, 'season': name, 'games': len(records)}
+        if not records:
+            result['error'] = 'no games parsed'
+        elif not dry_run:
+            try:
+                season_id = season_id_for(conn, name)
+                result.update(seasons.sync_season(conn, season_id, records), season_id=season_id)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                result['error'] = str(e)
+        results.append(result)
+        progress(result)
+    return results
+
+
+if __name__ == '__main__':
+    from db import init_db, get_conn
+
+    parser = argparse.ArgumentParser(description='Load archived schedule pages into season catalogs.')
+    parser.add_argument('pages', nargs='+', help='saved schedule HTML, one season per file')
+    parser.add_argument('--year', type=int, help='season start year for every page (default: from each file name)')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='parser processes')
+    parser.add_argument('--dry-run', action='store_true', help='parse and report without writing')
+    args = parser.parse_args()
+
+    try:
+        jobs = [(path, args.year or season_year(path)) for path in args.pages]
+    except ValueError as e:
+        parser.error(str(e))
+    init_db()
+    conn = get_conn()
+    start = time.perf_counter()
+    results = backfill(conn, jobs, args.workers, args.dry_run, progress=lambda r: print(
+        f"{r['season']}: {r['games']} games" + (f" ({r['error']})" if 'error' in r else
+        '' if args.dry_run else f", {r['inserted']} inserted, {r['updated']} updated, {r['deleted']} deleted, "
+        + (f"{r['links']} CFP links" if r['links'] is not None else 'no bracket template, no CFP links'))
+        + f"  {r['path']}"))
+    elapsed = time.perf_counter() - start
+    print(f'{len(results)} pages, {sum(r["games"] for r in results)} games in {elapsed:.2f}s'
+          f' ({sum("error" in r for r in results)} failed)')
+    conn.close()
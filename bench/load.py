@@ -0,0 +1,165 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+parser = argparse.ArgumentParser(description='Drive the Flask app against a synthetic contest and report latency and SQL counts.')
+parser.add_argument('--players', type=int, default=2000)
+parser.add_argument('--bowls', type=int, default=35)
+parser.add_argument('--requests', type=int, default=200, help='requests per scenario and mode')
+parser.add_argument('--threads', type=int, default=8, help='client threads for the concurrent run')
+parser.add_argument('--scenarios', default='picks_get,picks_post,scoreboard,manage_post')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--db', help='scratch database (default: a temp file)')
+parser.add_argument('--out', help='results file (default: bench/results/load-<timestamp>.json)')
+args = parser.parse_args()
+
+os.environ['DB_PATH'] = args.db or os.path.join(tempfile.mkdtemp(), 'load.db')
+
+import db  # noqa: E402  (DB_PATH must be set first)
+
+# Statements per request: every pooled connection reports to the counter of
+# whichever thread runs the statement.
+_counter = threading.local()
+
+
+def _count_statements(conn):
+    def trace(sql):
+        _counter.n = getattr(_counter, 'n', 0) + 1
+    conn.set_trace_callback(trace)
+
+
+from app import app  # noqa: E402
+from bench.synth import generate_contest  # noqa: E402
+
+# After the app is built, so this trace callback replaces the one metrics
+# installs; building it leaves no pooled connection without the hook.
+db.connect_hooks.append(_count_statements)
+
+db.init_db()
+conn = db.get_conn()
+t0 = time.perf_counter()
+contest_id = generate_contest(conn, players=args.players, bowls=args.bowls, seed=args.seed)
+setup_s = time.perf_counter() - t0
+cur = conn.cursor()
+cur.execute("INSERT INTO users (contest_id, display_name, role) VALUES (?, 'Manager', 'manager')", (contest_id,))
+manager_id = cur.lastrowid
+conn.commit()
+player_ids = [r['id'] for r in conn.execute("SELECT id FROM users WHERE contest_id=? AND role='player'", (contest_id,)).fetchall()]
+game_ids = [r['id'] for r in conn.execute('SELECT id FROM games WHERE contest_id=?', (contest_id,)).fetchall()]
+conn.close()
+
+
+def client_for(user_id, role):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['contest_id'] = contest_id
+        sess['role'] = role
+    return client
+
+
+def picks_get(rng):
+    return client_for(rng.choice(player_ids), 'player'), 'GET', '/picks', None
+
+
+def picks_post(rng):
+    form = {f'pick_{gid}': rng.choice(('team1', 'team2')) for gid in game_ids}
+    return client_for(rng.choice(player_ids), 'player'), 'POST', '/picks', form
+
+
+def scoreboard(rng):
+    return client_for(rng.choice(player_ids), 'player'), 'GET', '/scoreboard', None
+
+
+def manage_post(rng):
+    return client_for(manager_id, 'manager'), 'POST', '/manage/games', {f'winner_{rng.choice(game_ids)}': rng.choice(('team1', 'team2'))}
+
+
+SCENARIOS = {'picks_get': picks_get, 'picks_post': picks_post, 'scoreboard': scoreboard, 'manage_post': manage_post}
+
+
+def one_request(make, rng):
+    client, method, path, form = make(rng)
+    _counter.n = 0
+    start = time.perf_counter()
+    resp = client.open(path, method=method, data=form)
+    elapsed = time.perf_counter() - start
+    if resp.status_code >= 400:
+        raise RuntimeError(f'{method} {path} -> {resp.status_code}')
+    return elapsed, _counter.n
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def summarize(samples, wall_s):
+    latencies = sorted(s[0] * 1000 for s in samples)
+    statements = [s[1] for s in samples]
+    return {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / wall_s, 1),
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(latencies[-1], 2),
+        'sql_per_request': round(statistics.fmean(statements), 1),
+        'sql_max': max(statements),
+    }
+
+
+def run(make, threads):
+    samples = []
+    lock = threading.Lock()
+    per_thread = max(1, args.requests // threads)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        local = [one_request(make, rng) for _ in range(per_thread)]
+        with lock:
+            samples.extend(local)
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(args.seed * 1000 + i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return summarize(samples, time.perf_counter() - start)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+results = {}
+for name in args.scenarios.split(','):
+    make = SCENARIOS[name]
+    results[name] = {'sequential': run(make, 1), 'concurrent': run(make, args.threads)}
+    print(f"{name:12s} seq p50 {results[name]['sequential']['p50_ms']:8.2f} ms  "
+          f"conc p95 {results[name]['concurrent']['p95_ms']:8.2f} ms  "
+          f"{results[name]['concurrent']['throughput_rps']:7.1f} rps  "
+          f"{results[name]['sequential']['sql_per_request']:5.1f} sql/req")
+
+report = {
+    'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    'revision': git_revision(),
+    'config': {k: v for k, v in vars(args).items() if k not in ('db', 'out')},
+    'setup_s': round(setup_s, 2),
+    'results': results,
+}
+out = args.out or os.path.join(os.path.dirname(__file__), 'results', f"load-{datetime.now():%Y%m%d-%H%M%S}.json")
+os.makedirs(os.path.dirname(out), exist_ok=True)
+with open(out, 'w') as f:
+    json.dump(report, f, indent=2)
+print(f'wrote {out}')
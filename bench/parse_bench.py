@@ -0,0 +1,123 @@
+import argparse
+import glob
+import json
+import os
+import time
+
+import bracket_templates
+from scrape import DATE_RE, FALLBACK_RE, KICKOFF_RE, LINE_RE, iter_records, page_lines
+
+FIXTURES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'fixtures', 'schedule-*.html')))
+
+# Lines LINE_RE cannot match: with no kickoff time it tries every split of
+# team1/team2 before failing, which is why iter_records checks KICKOFF_RE
+# first. line_re_us is the pattern alone, parse_us the guarded path.
+WORST_CASE = (
+    'College Football Playoff preview: ' + ' vs. '.join(f'Team {i}' for i in range(40)) + ' | ESPN',
+    'Bowl ' * 200 + 'A vs. B TBA | ESPN',
+)
+
+# Records the bundled pages must parse to, by position on the page, so a
+# timing is never reported for a parser that splits lines wrongly.
+EXPECTED = {
+    'schedule-2025-26.html': {
+        0: ('Salute to Veterans Bowl', 'Nevada', 'Troy', None),
+        3: ('LA Bowl', 'Iowa State', 'Northwestern', None),
+        14: ('College Football Playoff First Round', 'Oregon', 'James Madison', 'first'),
+        18: ('College Football Playoff First Round', 'Texas A&M', 'Miami', 'first'),
+        46: ('College Football Playoff Quarterfinal at the Rose Bowl', 'Indiana', 'TBD', 'quarter'),
+        50: ('College Football Playoff National Championship', 'TBD', 'TBD', 'final'),
+    },
+    'schedule-2024-25.html': {
+        0: ('Salute to Veterans Bowl', 'South Alabama', 'Western Michigan', None),
+        7: ('College Football Playoff First Round', 'No. 10 Indiana', 'No. 7 Notre Dame', 'first'),
+        26: ('Snoop Dogg Arizona Bowl', 'Miami (Ohio)', 'Colorado State', None),
+        37: ('Rose Bowl Game presented by Prudential (College Football Playoff Quarterfinal)',
+             'No. 1 Oregon', 'TBD', 'quarter'),
+        43: ('Capital One Orange Bowl (College Football Playoff Semifinal)', 'TBD', 'TBD', 'semi'),
+        45: ('College Football Playoff National Championship', 'TBD', 'TBD', 'final'),
+    },
+}
+EXPECTED_ROUNDS = {'first': 4, 'quarter': 4, 'semi': 2, 'final': 1}
+
+
+def check(name, records):
+    # Fields of the known lines, and a full bracket that the season's
+    # template (schedule-2024-25.html -> brackets/2024-25.json) links up.
+    for i, want in EXPECTED.get(name, {}).items():
+        r = records[i]
+        got = (r['bowl_name'], r['team1'], r['team2'], r['cfp_round'])
+        assert got == want, f'{name}: game {i} parsed as {got}, expected {want}'
+    rounds = {}
+    for r in records:
+        if r['cfp_round']:
+            rounds[r['cfp_round']] = rounds.get(r['cfp_round'], 0) + 1
+    assert rounds == EXPECTED_ROUNDS, f'{name}: playoff games by round {rounds}'
+    template = bracket_templates.for_season(name[len('schedule-'):-len('.html')])
+    assert template is not None, f'{name}: no bracket template for its season'
+    rows = [dict(r, id=i) for i, r in enumerate(records)]
+    links = template.link_rows(rows)
+    want = sum(len(g['feeds']) for g in template.games)
+    assert len(links) == want, f'{name}: {len(links)} of {want} bracket links built'
+    return len(links)
+
+
+parser = argparse.ArgumentParser(description='Time schedule page parsing: soup, regexes and record building.')
+parser.add_argument('pages', nargs='*', default=FIXTURES, help='saved schedule pages (default: bench/fixtures)')
+parser.add_argument('--repeat', type=int, default=50)
+args = parser.parse_args()
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def match_all(lines):
+    # What iter_records asks of the regexes, without building records.
+    n = 0
+    for line in lines:
+        if DATE_RE.match(line):
+            continue
+        if 'vs.' in line and KICKOFF_RE.search(line) and (LINE_RE.match(line) or FALLBACK_RE.search(line)):
+            n += 1
+    return n
+
+
+pages = []
+for path in args.pages:
+    with open(path, encoding='utf-8') as f:
+        html = f.read()
+    soup_s, lines = timed(lambda: page_lines(html), args.repeat)
+    regex_s, matched = timed(lambda: match_all(lines), args.repeat)
+    records_s, records = timed(lambda: list(iter_records(lines)), args.repeat)
+    pages.append({
+        'page': os.path.basename(path),
+        'bytes': len(html),
+        'lines': len(lines),
+        'games': len(records),
+        'cfp_links': check(os.path.basename(path), records) if path in FIXTURES else None,
+        'soup_ms': round(soup_s * 1000, 3),
+        'regex_ms': round(regex_s * 1000, 3),
+        'records_ms': round(records_s * 1000, 3),
+        'lines_per_sec': round(len(lines) / records_s) if records_s else None,
+    })
+    assert matched == len(records), f'{path}: {matched} lines matched but {len(records)} records'
+
+worst = []
+for line in WORST_CASE:
+    line_re_s, _ = timed(lambda: LINE_RE.match(line), args.repeat)
+    parse_s, _ = timed(lambda: match_all([line]), args.repeat)
+    worst.append({'chars': len(line), 'line_re_us': round(line_re_s * 1e6, 1), 'parse_us': round(parse_s * 1e6, 1)})
+
+total_lines = sum(p['lines'] for p in pages)
+total_s = sum(p['records_ms'] for p in pages) / 1000
+print(json.dumps({
+    'repeat': args.repeat,
+    'pages': pages,
+    'lines_per_sec': round(total_lines / total_s) if total_s else None,
+    'regex_share': round(sum(p['regex_ms'] for p in pages) / 1000 / total_s, 3) if total_s else None,
+    'worst_case_lines': worst,
+}, indent=2))
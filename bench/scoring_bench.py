@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser(description='Time winner updates through scoring.apply_winners on a synthetic contest.')
+parser.add_argument('--players', type=int, default=10000)
+parser.add_argument('--bowls', type=int, default=35)
+parser.add_argument('--flips', type=int, default=10, help='extra updates that change an already-set First Round winner')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--db', help='scratch database (default: a temp file)')
+args = parser.parse_args()
+
+os.environ['DB_PATH'] = args.db or os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+import db  # noqa: E402  (DB_PATH must be set first)
+import scoring  # noqa: E402
+import standings  # noqa: E402
+from bench.synth import generate_contest  # noqa: E402
+from schedule import load_schedule  # noqa: E402
+
+db.init_db()
+conn = db.get_conn()
+t0 = time.perf_counter()
+contest_id = generate_contest(conn, players=args.players, bowls=args.bowls, seed=args.seed)
+setup_s = time.perf_counter() - t0
+
+rng = random.Random(args.seed)
+bracket = load_schedule(conn, contest_id, None).bracket
+first_round = [gid for gid in bracket.order if not bracket.feeds.get(gid) and gid in bracket.fed_by]
+
+
+def timed(gid, winner):
+    start = time.perf_counter()
+    scoring.apply_winners(conn, contest_id, {gid: winner})
+    conn.commit()
+    return (time.perf_counter() - start) * 1000
+
+
+updates = [timed(gid, rng.choice(('team1', 'team2'))) for gid in bracket.order]
+flips = []
+for _ in range(args.flips):
+    gid = rng.choice(first_round)
+    current = conn.execute('SELECT winner FROM games WHERE id=?', (gid,)).fetchone()['winner']
+    flips.append(timed(gid, 'team2' if current == 'team1' else 'team1'))
+
+mismatches = standings.verify(conn.cursor(), contest_id)
+
+
+def summary(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.fmean(samples), 2),
+        'p50_ms': round(ordered[len(ordered) // 2], 2),
+        'p95_ms': round(ordered[int(len(ordered) * 0.95) - 1], 2),
+        'max_ms': round(ordered[-1], 2),
+    }
+
+
+print(json.dumps({
+    'players': args.players,
+    'games': len(bracket.order),
+    'setup_s': round(setup_s, 2),
+    'winner_update': summary(updates),
+    'cascading_flip': summary(flips),
+    'standings_mismatches': len(mismatches),
+}, indent=2))
+sys.exit(1 if mismatches else 0)
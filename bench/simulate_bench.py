@@ -0,0 +1,47 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+parser = argparse.ArgumentParser(description='Time simulate.refresh on a synthetic contest as winners come in.')
+parser.add_argument('--players', type=int, default=10000)
+parser.add_argument('--bowls', type=int, default=35)
+parser.add_argument('--runs', type=int, default=2000)
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--db', help='scratch database (default: a temp file)')
+args = parser.parse_args()
+
+os.environ['DB_PATH'] = args.db or os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+import db  # noqa: E402  (DB_PATH must be set first)
+import scoring  # noqa: E402
+import simulate  # noqa: E402
+from bench.synth import generate_contest  # noqa: E402
+from schedule import load_schedule  # noqa: E402
+
+db.init_db()
+conn = db.get_conn()
+contest_id = generate_contest(conn, players=args.players, bowls=args.bowls, seed=args.seed)
+rng = random.Random(args.seed)
+order = load_schedule(conn, contest_id, None).bracket.order
+
+# Refresh at a few points of the season: nothing decided, then after each quarter of the games.
+stages = []
+marks = [0] + [len(order) * q // 4 for q in (1, 2, 3, 4)]
+for done, upto in zip(marks, marks[1:] + [None]):
+    start = time.perf_counter()
+    simulate.refresh(conn, contest_id, args.runs)
+    conn.commit()
+    elapsed = (time.perf_counter() - start) * 1000
+    row = conn.execute('SELECT MAX(win_prob) AS top, SUM(eliminated) AS out FROM standings WHERE contest_id=?',
+                       (contest_id,)).fetchone()
+    stages.append({'decided': done, 'refresh_ms': round(elapsed, 1), 'top_win_prob': row['top'], 'eliminated': row['out']})
+    if upto is None:
+        break
+    for gid in order[done:upto]:
+        scoring.apply_winners(conn, contest_id, {gid: rng.choice(('team1', 'team2'))})
+    conn.commit()
+
+print(json.dumps({'players': args.players, 'games': len(order), 'runs': args.runs, 'stages': stages}, indent=2))
@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+parser = argparse.ArgumentParser(description='Time worker startup and first-request latency in fresh processes.')
+parser.add_argument('--players', type=int, default=2000)
+parser.add_argument('--runs', type=int, default=5, help='fresh processes per configuration')
+parser.add_argument('--db', help='scratch database (default: a temp file)')
+args = parser.parse_args()
+
+os.environ['DB_PATH'] = args.db or os.path.join(tempfile.mkdtemp(), 'startup.db')
+
+# What each worker does from exec to its first responses; timings in ms.
+CHILD = '''
+import json, time
+t0 = time.perf_counter()
+import app as appmod
+t1 = time.perf_counter()
+app = appmod.app
+t2 = time.perf_counter()
+client = app.test_client()
+with client.session_transaction() as s:
+    s.update(user_id=USER_ID, contest_id=CONTEST_ID, role='player')
+out = {'import_ms': (t1 - t0) * 1000, 'create_app_ms': (t2 - t1) * 1000}
+for path in ('/scoreboard', '/picks', '/analytics'):
+    for label in ('first', 'second'):
+        start = time.perf_counter()
+        assert client.get(path).status_code == 200, path
+        out[f'{label}{path.replace("/", "_")}_ms'] = (time.perf_counter() - start) * 1000
+start = time.perf_counter()
+import scrape
+out['scrape_import_ms'] = (time.perf_counter() - start) * 1000
+print(json.dumps(out))
+'''
+
+CONFIGS = {
+    'default': {},
+    'no_warm': {'WARM_CONTESTS': '0'},
+    'preload_imports': {'PRELOAD_IMPORTS': '1'},
+}
+
+import db  # noqa: E402  (DB_PATH must be set first)
+from bench.synth import generate_contest  # noqa: E402
+
+db.init_db()
+conn = db.get_conn()
+contest_id = generate_contest(conn, players=args.players)
+user_id = conn.execute('SELECT MIN(id) FROM users WHERE contest_id=?', (contest_id,)).fetchone()[0]
+conn.close()
+db.pool.clear()
+
+code = CHILD.replace('USER_ID', str(user_id)).replace('CONTEST_ID', str(contest_id))
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+report = {'players': args.players, 'runs': args.runs, 'configs': {}}
+for name, env in CONFIGS.items():
+    samples = []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, '-c', code], cwd=root, env={**os.environ, **env},
+                             capture_output=True, text=True, check=True)
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    # Medians per measurement across the fresh processes.
+    report['configs'][name] = {k: round(statistics.median(s[k] for s in samples), 1) for k in samples[0]}
+
+print(json.dumps(report, indent=2))
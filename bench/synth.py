@@ -0,0 +1,90 @@
+import random
+
+import standings
+from bracket import SLOTS, Bracket
+from scrape import CFP_POINTS
+
+# 12-team playoff as build_cfp_links wires it: (round, bowl, feeds) where
+# feeds maps a slot to the index of the game whose winner fills it.
+CFP_LAYOUT = (
+    ('first', 'College Football Playoff First Round', {}),
+    ('first', 'College Football Playoff First Round', {}),
+    ('first', 'College Football Playoff First Round', {}),
+    ('first', 'College Football Playoff First Round', {}),
+    ('quarter', 'College Football Playoff Quarterfinal at the Orange Bowl', {'team2': 0}),
+    ('quarter', 'College Football Playoff Quarterfinal at the Rose Bowl', {'team2': 1}),
+    ('quarter', 'College Football Playoff Quarterfinal at the Sugar Bowl', {'team2': 2}),
+    ('quarter', 'College Football Playoff Quarterfinal at the Cotton Bowl', {'team2': 3}),
+    ('semi', 'College Football Playoff Semifinal at the Fiesta Bowl', {'team1': 4, 'team2': 7}),
+    ('semi', 'College Football Playoff Semifinal at the Peach Bowl', {'team1': 5, 'team2': 6}),
+    ('final', 'College Football Playoff National Championship', {'team1': 8, 'team2': 9}),
+)
+
+LOCK_PT = '2099-12-20T09:00:00-08:00'
+LOCK_TS = 4101469200
+
+
+def generate_contest(conn, players=1000, bowls=35, seed=0, name='Synthetic contest'):
+    # Writes a contest with `bowls` regular games, the full CFP bracket and
+    # `players` players who have picked every game. Returns the contest id.
+    rng = random.Random(seed)
+    cur = conn.cursor()
+    cur.execute('INSERT INTO contests (name, access_code, admin_code) VALUES (?, ?, ?)', (name, 'JOIN', 'ADMIN'))
+    contest_id = cur.lastrowid
+
+    games = []
+    for i in range(bowls):
+        games.append((contest_id, f'Bowl {i + 1}', f'Team {2 * i + 1}', f'Team {2 * i + 2}', '2099-12-20', 0, None, 1, LOCK_PT, LOCK_TS))
+    for i, (rnd, bowl, feeds) in enumerate(CFP_LAYOUT):
+        team1 = 'TBD' if 'team1' in feeds else f'Seed {i + 1}'
+        team2 = 'TBD' if 'team2' in feeds else f'Seed {i + 13}'
+        games.append((contest_id, bowl, team1, team2, '2099-12-27', 1, rnd, CFP_POINTS[rnd], LOCK_PT, LOCK_TS))
+    cur.executemany(
+        'INSERT INTO games (contest_id, bowl_name, team1, team2, game_date, is_cfp, cfp_round, points_per_win, lock_pt, lock_ts) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        games,
+    )
+    cur.execute('SELECT id, team1, team2, is_cfp FROM games WHERE contest_id=? ORDER BY id', (contest_id,))
+    rows = cur.fetchall()
+    cfp_ids = [r['id'] for r in rows if r['is_cfp']]
+    links = [{'game_id': cfp_ids[i], 'slot': slot, 'depends_on_game_id': cfp_ids[dep]}
+             for i, (_, _, feeds) in enumerate(CFP_LAYOUT) for slot, dep in feeds.items()]
+    cur.executemany('INSERT INTO cfp_links (game_id, slot, depends_on_game_id) VALUES (:game_id, :slot, :depends_on_game_id)', links)
+    bracket = Bracket(rows, links)
+
+    cur.executemany('INSERT INTO users (contest_id, display_name, role) VALUES (?, ?, ?)',
+                    [(contest_id, f'Player {i + 1}', 'player') for i in range(players)])
+    cur.execute('SELECT id FROM users WHERE contest_id=? ORDER BY id', (contest_id,))
+    user_ids = [r['id'] for r in cur.fetchall()]
+    picks = []
+    for uid in user_ids:
+        choice = {gid: rng.choice(SLOTS) for gid in bracket.order}
+        seats = bracket.picked_seats(choice)
+        picks.extend((uid, gid, pick, seats[gid]) for gid, pick in choice.items())
+        if len(picks) >= 50000:
+            cur.executemany('INSERT INTO picks (user_id, game_id, pick, seat) VALUES (?, ?, ?, ?)', picks)
+            picks = []
+    cur.executemany('INSERT INTO picks (user_id, game_id, pick, seat) VALUES (?, ?, ?, ?)', picks)
+    standings.rebuild(cur, contest_id)
+    conn.commit()
+    return contest_id
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description='Write a synthetic contest into a scratch database.')
+    parser.add_argument('db')
+    parser.add_argument('--players', type=int, default=1000)
+    parser.add_argument('--bowls', type=int, default=35)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ['DB_PATH'] = args.db
+    import db
+    db.pool.path = args.db
+    db.init_db()
+    conn = db.get_conn()
+    contest_id = generate_contest(conn, players=args.players, bowls=args.bowls, seed=args.seed)
+    print(f'contest {contest_id}: {args.players} players, {args.bowls} bowls + CFP bracket in {args.db}')
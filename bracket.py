@@ -0,0 +1,93 @@
+from collections import deque
+
+SLOTS = ('team1', 'team2')
+
+
+def seat(game_id, slot):
+    return f'{game_id}:{slot}'
+
+
+def pick_seat(game_id, pick, stored):
+    # The seat a stored pick backs. Picks saved before seats existed have
+    # none and name theirs by slot.
+    return stored or seat(game_id, pick)
+
+
+class Bracket:
+    def __init__(self, games, links):
+        self.teams = {g['id']: (g['team1'], g['team2']) for g in games}
+        # A seat names a team by where it enters the bracket rather than by
+        # its (possibly placeholder) name: "<game_id>:<slot>" of an unfed slot.
+        self.seats = {gid: (seat(gid, 'team1'), seat(gid, 'team2')) for gid in self.teams}
+        self.feeds = {}
+        for l in links:
+            if l['game_id'] in self.teams and l['depends_on_game_id'] in self.teams:
+                self.feeds.setdefault(l['game_id'], {})[l['slot']] = l['depends_on_game_id']
+        self.fed_by = {}
+        for gid, f in self.feeds.items():
+            for dep in f.values():
+                self.fed_by.setdefault(dep, []).append(gid)
+        self.order = self._topological_order()
+
+    def _topological_order(self):
+        # Kahn's algorithm over the feed edges, keeping schedule order among
+        # games that are ready at the same time.
+        waiting = {gid: len(f) for gid, f in self.feeds.items()}
+        ready = deque(gid for gid in self.teams if not waiting.get(gid))
+        order = []
+        while ready:
+            gid = ready.popleft()
+            order.append(gid)
+            for nxt in self.fed_by.get(gid, ()):
+                waiting[nxt] -= 1
+                if waiting[nxt] == 0:
+                    ready.append(nxt)
+        if len(order) != len(self.teams):
+            raise ValueError('cfp_links contain a cycle')
+        return order
+
+    def slot_teams(self, gid, picks, resolved, static=None):
+        # Teams in both slots of gid given picks, where resolved already holds
+        # every game feeding it. A fed slot is None until the feeder is picked.
+        static = static or self.teams
+        feeds = self.feeds.get(gid)
+        if not feeds:
+            return static[gid]
+        teams = []
+        for i, slot in enumerate(SLOTS):
+            dep = feeds.get(slot)
+            if dep is None:
+                teams.append(static[gid][i])
+                continue
+            pick = picks.get(dep)
+            teams.append(resolved[dep][SLOTS.index(pick)] if pick in SLOTS else None)
+        return tuple(teams)
+
+    def resolve(self, picks, static=None):
+        # {game_id: (team1, team2)} for the whole bracket in one pass.
+        resolved = {}
+        for gid in self.order:
+            resolved[gid] = self.slot_teams(gid, picks, resolved, static)
+        return resolved
+
+    def resolve_seats(self, picks):
+        # Same walk as resolve(), naming teams by seat. With the actual winners
+        # as picks this gives the seats really playing each game.
+        return self.resolve(picks, self.seats)
+
+    def picked_seats(self, picks):
+        # {game_id: seat of the team picked}, None where the slot is unresolved.
+        seats = self.resolve_seats(picks)
+        return {gid: seats[gid][SLOTS.index(pick)] for gid, pick in picks.items() if gid in seats and pick in SLOTS}
+
+    def downstream(self, game_ids):
+        # game_ids plus every game they feed, directly or through later rounds.
+        seen = set(game_ids)
+        stack = list(game_ids)
+        while stack:
+            for nxt in self.fed_by.get(stack.pop(), ()):
+                if nxt not in seen:
+                    seen.add(nxt)
+                    stack.append(nxt)
+        return seen
+
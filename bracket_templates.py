@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+
+from bracket import SLOTS
+
+log = logging.getLogger(__name__)
+
+BRACKETS_DIR = Path(os.getenv('BRACKETS_DIR', Path(__file__).with_name('brackets')))
+# Template for contests without a season.
+DEFAULT_BRACKET = os.getenv('BRACKET', '2025-26')
+
+ROUNDS = ('first', 'quarter', 'semi', 'final')
+
+
+class Template:
+    # A playoff bracket read from brackets/<name>.json:
+    #
+    #   {"name": ..., "seeds": {"1": "Indiana", ...},
+    #    "games": [{"key": "rose", "round": "quarter", "bowl": "Rose Bowl",
+    #               "feeds": {"team2": "first-8-9"}}, ...]}
+    #
+    # A game is found among a contest's games of its round by "bowl" (a
+    # substring of the bowl name), by "seeds" (every seed's team is in
+    # team1/team2), or, with neither, as the first game of the round. "feeds"
+    # maps a slot to the key of the game whose winner fills it. Any number of
+    # games per round, so 12-team and larger fields need only a new file.
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.title = spec.get('name', name)
+        seeds = {int(k): v for k, v in spec.get('seeds', {}).items()}
+        self.games = []
+        keys = set()
+        for g in spec['games']:
+            key, rnd = g['key'], g['round']
+            if key in keys:
+                raise ValueError(f'{name}: duplicate game key {key!r}')
+            if rnd not in ROUNDS:
+                raise ValueError(f'{name}: {key}: unknown round {rnd!r}')
+            missing = [s for s in g.get('seeds', ()) if s not in seeds]
+            if missing:
+                raise ValueError(f'{name}: {key}: no team for seeds {missing}')
+            keys.add(key)
+            self.games.append({'key': key, 'round': rnd, 'bowl': g.get('bowl'),
+                               'teams': tuple(seeds[s] for s in g.get('seeds', ())),
+                               'feeds': g.get('feeds', {})})
+        for g in self.games:
+            for slot, dep in g['feeds'].items():
+                if slot not in SLOTS or dep not in keys:
+                    raise ValueError(f'{name}: {g["key"]}: bad feed {slot!r} <- {dep!r}')
+
+        # Per round, one alternation of the bowl names and one of the seeded
+        # teams, longest first so 'Texas A&M' wins over a 'Texas'.
+        def alternation(words):
+            words = sorted(set(words), key=len, reverse=True)
+            return re.compile('|'.join(map(re.escape, words))) if words else None
+        self._bowl_re = {r: alternation(g['bowl'] for g in self.games if g['round'] == r and g['bowl'])
+                         for r in ROUNDS}
+        self._team_re = {r: alternation(t for g in self.games if g['round'] == r for t in g['teams'])
+                         for r in ROUNDS}
+
+    def match(self, rows):
+        # rows: games with id, bowl_name, team1, team2, cfp_round. One pass
+        # indexes them by round, by the template bowl name they contain and by
+        # the seeded teams they contain; returns {key: row}. Where several
+        # rows fit, the first wins.
+        by_round, by_bowl, by_team = {}, {}, {}
+        for r in rows:
+            rnd = r['cfp_round']
+            if rnd not in self._bowl_re:
+                continue
+            by_round.setdefault(rnd, r)
+            bowl_re, team_re = self._bowl_re[rnd], self._team_re[rnd]
+            if bowl_re is not None:
+                m = bowl_re.search(r['bowl_name'] or '')
+                if m:
+                    by_bowl.setdefault((rnd, m.group()), r)
+            if team_re is not None:
+                found = frozenset(team_re.findall(r['team1'] or '') + team_re.findall(r['team2'] or ''))
+                for team in found:
+                    by_team.setdefault((rnd, team), []).append((r, found))
+
+        matched = {}
+        for g in self.games:
+            rnd = g['round']
+            if g['bowl']:
+                row = by_bowl.get((rnd, g['bowl']))
+            elif g['teams']:
+                row = next((r for r, found in by_team.get((rnd, g['teams'][0]), ())
+                            if found.issuperset(g['teams'])), None)
+            else:
+                row = by_round.get(rnd)
+            if row is not None:
+                matched[g['key']] = row
+        return matched
+
+    def link_rows(self, rows):
+        # The (game_id, slot, depends_on_game_id) edges among rows.
+        matched = self.match(rows)
+        return [(matched[g['key']]['id'], slot, matched[dep]['id'])
+                for g in self.games if g['key'] in matched
+                for slot, dep in g['feeds'].items() if dep in matched]
+
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def load(name=DEFAULT_BRACKET):
+    # Parsed once per process; edit the file and restart to change it.
+    with _lock:
+        template = _cache.get(name)
+    if template is None:
+        with open(BRACKETS_DIR / f'{name}.json', encoding='utf-8') as f:
+            template = Template(name, json.load(f))
+        with _lock:
+            _cache[name] = template
+    return template
+
+
+def for_season(season_name):
+    # A season uses the file named after it; None when it has none, since
+    # another year's seeds and bowls would link the wrong games.
+    if not season_name:
+        return load()
+    if (BRACKETS_DIR / f'{season_name}.json').is_file():
+        return load(season_name)
+    log.warning('no bracket template %s; season %s gets no CFP links',
+                BRACKETS_DIR / f'{season_name}.json', season_name)
+    return None
@@ -0,0 +1,339 @@
+import csv
+import io
+import json
+import os
+import re
+from collections import Counter
+
+from bracket import pick_seat
+from db import pool
+from locks import open_game_ids
+from pickset import PICK_VALUES, UPSERT_PICK, pick_rows, validate_picks
+from schedule import get_schedule
+import standings
+
+EXPORT_BATCH = int(os.getenv('EXPORT_BATCH', '1000'))
+# Players per import transaction.
+IMPORT_CHUNK = int(os.getenv('IMPORT_CHUNK', '500'))
+
+MIMETYPES = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+STANDINGS_COLUMNS = (('rank', 'int64'), ('user_id', 'int64'), ('display_name', 'string'), ('points', 'int64'),
+                     ('correct', 'int64')) + tuple((f'{r}_points', 'int64') for r in standings.ROUND_ORDER) + (
+                    ('max_points', 'int64'), ('eliminated', 'bool'), ('win_prob', 'float64'))
+
+
+def game_column(game):
+    # Bowl names repeat across the First Round, so the id rides along.
+    return f'{game.bowl_name} #{game.id}'
+
+
+def pick_matrix(conn, schedule, batch=EXPORT_BATCH):
+    # Returns (columns, batches): one row per player with the team picked in
+    # each game, read in batches so the matrix is never held whole. A pick
+    # names the team of the seat it backs, i.e. where that team entered the
+    # bracket, which is what the player saw when picking.
+    games = schedule.picks_order
+    col = {g.id: j for j, g in enumerate(games, start=2)}
+    team = {f'{g.id}:{slot}': g[slot] for g in schedule.games for slot in PICK_VALUES}
+    columns = [('user_id', 'int64'), ('display_name', 'string')] + [(game_column(g), 'string') for g in games]
+
+    def batches():
+        cur = conn.execute(
+            'SELECT u.id, u.display_name, p.game_id, p.pick, p.seat FROM users u LEFT JOIN picks p ON p.user_id=u.id '
+            'WHERE u.contest_id=? ORDER BY u.id', (schedule.contest_id,))
+        # Rows arrive one per pick; a batch is `batch` finished players.
+        row, done = None, []
+        while True:
+            chunk = cur.fetchmany(batch)
+            if not chunk:
+                break
+            for uid, name, gid, pick, seat in chunk:
+                if row is None or row[0] != uid:
+                    if row is not None:
+                        done.append(row)
+                    row = [uid, name] + [None] * len(games)
+                if gid in col:
+                    row[col[gid]] = team.get(pick_seat(gid, pick, seat))
+            if len(done) >= batch:
+                yield done
+                done = []
+        if row is not None:
+            done.append(row)
+        if done:
+            yield done
+
+    return columns, batches()
+
+
+def standings_table(conn, contest_id, batch=EXPORT_BATCH):
+    def batches():
+        cur = conn.execute(
+            'SELECT s.rank, s.user_id, u.display_name, s.points, s.correct, s.round_points, '
+            's.max_points, s.eliminated, s.win_prob '
+            'FROM standings s JOIN users u ON u.id=s.user_id WHERE s.contest_id=? ORDER BY s.rank, u.display_name',
+            (contest_id,))
+        while True:
+            chunk = cur.fetchmany(batch)
+            if not chunk:
+                break
+            rows = []
+            for r in chunk:
+                rounds = json.loads(r['round_points'])
+                rows.append([r['rank'], r['user_id'], r['display_name'], r['points'], r['correct']]
+                            + [rounds.get(k, 0) for k in standings.ROUND_ORDER]
+                            + [r['max_points'], bool(r['eliminated']), r['win_prob']])
+            yield rows
+
+    return list(STANDINGS_COLUMNS), batches()
+
+
+EXPORTS = {'picks': lambda conn, contest_id: pick_matrix(conn, get_schedule(conn, contest_id)),
+           'standings': standings_table}
+
+
+def csv_chunks(columns, batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow([name for name, _ in columns])
+    for rows in batches:
+        writer.writerows(rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+class _Sink(io.RawIOBase):
+    # Write-only file handed to the Parquet writer; drain() takes what it has
+    # written since the last call.
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def parquet_chunks(columns, batches):
+    # One row group per batch through pandas + pyarrow, flushed as it is
+    # written; the footer goes out last.
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {'int64': pa.int64(), 'float64': pa.float64(), 'bool': pa.bool_(), 'string': pa.string()}
+    names = [name for name, _ in columns]
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in batches:
+            writer.write_table(pa.Table.from_pandas(pd.DataFrame(rows, columns=names), schema=schema, preserve_index=False))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+FORMATS = {'csv': csv_chunks, 'parquet': parquet_chunks}
+
+
+def export_stream(contest_id, kind, fmt):
+    # Body generator for a streamed download. It reads on its own pooled
+    # connection, since the request's goes back to the pool before the body
+    # is sent. Raises ImportError up front when Parquet support is missing.
+    if fmt == 'parquet':
+        import pyarrow  # noqa: F401
+
+    def body():
+        conn = pool.acquire()
+        try:
+            columns, batches = EXPORTS[kind](conn, contest_id)
+            yield from FORMATS[fmt](columns, batches)
+        finally:
+            conn.close()
+
+    return body()
+
+
+def read_frames(path, chunk=IMPORT_CHUNK):
+    # DataFrames of up to `chunk` players, every cell a stripped string or None.
+    import pandas as pd
+
+    if str(path).endswith('.parquet'):
+        import pyarrow.parquet as pq
+        frames = (b.to_pandas() for b in pq.ParquetFile(path).iter_batches(batch_size=chunk))
+    else:
+        frames = pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk)
+    for frame in frames:
+        yield frame.astype(object).where(frame.notna(), None).map(_cell)
+
+
+def _cell(value):
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+
+def game_columns(headers, schedule):
+    # {header: game_id}. A header is a game id, "<bowl> #<id>" as exported,
+    # or a bowl name used by only one game.
+    by_name = Counter(g.bowl_name for g in schedule.games)
+    ids = {g.bowl_name: g.id for g in schedule.games if by_name[g.bowl_name] == 1}
+    cols, unknown = {}, []
+    for h in headers:
+        if h in ('user_id', 'display_name'):
+            continue
+        m = re.fullmatch(r'(?:.*#)?\s*(\d+)', h.strip())
+        gid = int(m.group(1)) if m else ids.get(h.strip())
+        if gid in schedule.by_id:
+            cols[h] = gid
+        else:
+            unknown.append(h)
+    if unknown:
+        raise ValueError(f'columns match no game in this contest: {", ".join(unknown)}')
+    return cols
+
+
+def _submitted(bracket, open_ids, existing, cells, report):
+    # Turns a player's cells (team name or team1/team2) into slots, walking
+    # the bracket so a later-round team name is looked up in the slot the
+    # player's own earlier picks put it in. Unchanged picks are left out, so
+    # re-importing an export is a no-op even for locked games.
+    merged = dict(existing)
+    resolved, submitted = {}, {}
+    for gid in bracket.order:
+        resolved[gid] = bracket.slot_teams(gid, merged, resolved)
+        value = cells.get(gid)
+        if value is None:
+            continue
+        if value in PICK_VALUES:
+            slot = value
+        elif value in resolved[gid]:
+            slot = PICK_VALUES[resolved[gid].index(value)]
+        else:
+            report['unknown_team'] += 1
+            continue
+        if existing.get(gid) == slot:
+            report['unchanged'] += 1
+            continue
+        submitted[gid] = slot
+        if gid in open_ids:
+            merged[gid] = slot
+    return submitted
+
+
+def import_picks(conn, contest_id, frames, create_users=False, dry_run=False):
+    # Loads picks for many players at once with the same checks as the picks
+    # form: locked games and CFP picks without the earlier pick that puts the
+    # team there are rejected. Each frame is one transaction. Players are
+    # matched on user_id when given, else display name. Returns counts.
+    schedule = get_schedule(conn, contest_id)
+    bracket = schedule.bracket
+    report = Counter()
+    cur = conn.cursor()
+    known, by_name = set(), {}
+    for uid, name in cur.execute('SELECT id, display_name FROM users WHERE contest_id=? ORDER BY id', (contest_id,)):
+        known.add(uid)
+        by_name.setdefault(name, uid)
+    for frame in frames:
+        cols = game_columns(frame.columns, schedule)
+        open_ids = open_game_ids(conn, contest_id)
+        players = []
+        for rec in frame.to_dict('records'):
+            uid = int(rec['user_id']) if rec.get('user_id') else by_name.get(rec.get('display_name'))
+            if uid not in known:
+                if not (create_users and rec.get('display_name')) or rec.get('user_id'):
+                    report['unknown_players'] += 1
+                    continue
+                report['new_players'] += 1
+                uid = None
+                if not dry_run:
+                    cur.execute('INSERT INTO users (contest_id, display_name, role) VALUES (?, ?, ?)',
+                                (contest_id, rec['display_name'], 'player'))
+                    uid = cur.lastrowid
+                    standings.add_player(cur, contest_id, uid)
+                    known.add(uid)
+                    by_name[rec['display_name']] = uid
+            players.append((uid, {gid: rec[h] for h, gid in cols.items() if rec[h]}))
+        report['players'] += len(players)
+
+        existing, seats = {}, {}
+        ids = [uid for uid, _ in players if uid is not None]
+        if ids:
+            marks = ','.join('?' * len(ids))
+            for uid, gid, pick, seat in cur.execute(
+                    f'SELECT user_id, game_id, pick, seat FROM picks WHERE user_id IN ({marks})', ids):
+                existing.setdefault(uid, {})[gid] = pick
+                seats.setdefault(uid, {})[gid] = seat
+        rows, touched = [], []
+        for uid, cells in players:
+            before = existing.get(uid, {})
+            submitted = _submitted(bracket, open_ids, before, cells, report)
+            accepted, statuses = validate_picks(bracket, open_ids, before, submitted)
+            report.update(statuses.values())
+            new = pick_rows(bracket, uid, accepted, before, seats.get(uid, {}))
+            if new:
+                rows.extend(new)
+                touched.append((uid,))
+        report['rows'] += len(rows)
+        if dry_run:
+            continue
+        cur.executemany(UPSERT_PICK, rows)
+        if touched:
+            cur.executemany('UPDATE users SET picks_version=picks_version+1 WHERE id=?', touched)
+            cur.execute('UPDATE contests SET picks_version=picks_version+1 WHERE id=?', (contest_id,))
+        conn.commit()
+    if dry_run:
+        conn.rollback()
+    elif report['rows']:
+        standings.refresh_outlook(conn, contest_id)
+    return dict(report)
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    from db import init_db, get_conn
+
+    parser = argparse.ArgumentParser(description='Export or bulk-load picks.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('export', help='write the pick matrix or standings as CSV or Parquet')
+    p.add_argument('contest_id', type=int)
+    p.add_argument('kind', choices=sorted(EXPORTS))
+    p.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    p.add_argument('-o', '--output', help='file to write (default: stdout)')
+    p = sub.add_parser('import', help='load picks from a CSV or Parquet pick matrix')
+    p.add_argument('contest_id', type=int)
+    p.add_argument('path')
+    p.add_argument('--create-users', action='store_true', help='add players whose names are not in the contest')
+    p.add_argument('--dry-run', action='store_true', help='validate and report without writing')
+    p.add_argument('--chunk', type=int, default=IMPORT_CHUNK, help='players per transaction')
+    args = parser.parse_args()
+
+    init_db()
+    if args.command == 'export':
+        out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+        for part in export_stream(args.contest_id, args.kind, args.format):
+            out.write(part.encode() if isinstance(part, str) else part)
+        out.flush()
+    else:
+        conn = get_conn()
+        report = import_picks(conn, args.contest_id, read_frames(args.path, args.chunk), args.create_users, args.dry_run)
+        conn.close()
+        print(', '.join(f'{k}={v}' for k, v in sorted(report.items())) or 'nothing to import')
@@ -1,74 +1,461 @@
 
+import os
 import sqlite3
+import threading
+from datetime import datetime
 from pathlib import Path
 
-DB_PATH = Path('bowl_pickem.db')
+from flask import g, has_app_context
+
+DB_PATH = Path(os.getenv('DB_PATH', 'bowl_pickem.db'))
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+
+# Applied once when a connection is opened, not on every checkout.
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('busy_timeout', 5000),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16000),     # KiB when negative (~16 MB)
+    ('mmap_size', 134217728),
+)
+
+
+# Called with each new connection after the pragmas are applied, e.g. to
+# install trace callbacks. Register before the first connection is opened.
+connect_hooks = []
+
+
+class PooledConnection(sqlite3.Connection):
+    pool = None
+    bound = False  # True while owned by a request; close() is then a no-op
+
+    def close(self):
+        if self.bound:
+            return
+        if self.pool is None or not self.pool.release(self):
+            super().close()
+
+
+class ConnectionPool:
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._inherited = []
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for name, value in PRAGMAS:
+            conn.execute(f'PRAGMA {name}={value}')
+        conn.pool = self
+        for hook in connect_hooks:
+            hook(conn)
+        return conn
+
+    def acquire(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked with idle connections: SQLite handles must not cross
+                # a fork, and closing them here could drop the parent's locks,
+                # so they are set aside unused.
+                self._inherited += self._idle
+                self._idle = []
+                self._pid = os.getpid()
+            if self._idle:
+                self.hits += 1
+                return self._idle.pop()
+            self.misses += 1
+        return self._connect()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return True
+        return False
+
+    def clear(self):
+        # Closes the idle connections, e.g. before the process forks workers.
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            sqlite3.Connection.close(conn)
+
+    def stats(self):
+        with self._lock:
+            return {'size': self.size, 'idle': len(self._idle), 'hits': self.hits, 'misses': self.misses}
+
+
+pool = ConnectionPool(DB_PATH, POOL_SIZE)
+
 
 def get_conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Inside a request/app context every caller shares one pooled connection,
+    # handed back to the pool by close_request_conn at teardown.
+    if has_app_context():
+        conn = g.get('db_conn')
+        if conn is None:
+            conn = pool.acquire()
+            conn.bound = True
+            g.db_conn = conn
+        return conn
+    return pool.acquire()
 
-def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.executescript('''
-    CREATE TABLE IF NOT EXISTS contests(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        access_code TEXT NOT NULL,
-        admin_code TEXT NOT NULL,
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP
-    );
 
-    CREATE TABLE IF NOT EXISTS games(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        contest_id INTEGER NOT NULL,
-        bowl_name TEXT NOT NULL,
-        team1 TEXT NOT NULL,
-        team2 TEXT NOT NULL,
-        game_date TEXT,
-        game_time_et TEXT,
-        network TEXT,
-        location TEXT,
-        is_cfp INTEGER NOT NULL DEFAULT 0,
-        cfp_round TEXT,
-        points_per_win INTEGER NOT NULL DEFAULT 1,
-        kickoff_et TEXT,
-        kickoff_pt TEXT,
-        lock_pt TEXT,
-        winner TEXT,
-        FOREIGN KEY(contest_id) REFERENCES contests(id)
-    );
+def close_request_conn(exc=None):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn.bound = False
+        conn.close()
+
+
+def init_app(app):
+    app.teardown_appcontext(close_request_conn)
+
+# Ordered schema steps. Each entry is (version, name, steps) where steps is a
+# sequence of SQL statements or a callable taking the open connection. Never
+# edit a shipped step; append a new one instead.
+MIGRATIONS = [
+    (1, 'base schema', (
+        '''CREATE TABLE IF NOT EXISTS contests(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            access_code TEXT NOT NULL,
+            admin_code TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS games(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            contest_id INTEGER NOT NULL,
+            bowl_name TEXT NOT NULL,
+            team1 TEXT NOT NULL,
+            team2 TEXT NOT NULL,
+            game_date TEXT,
+            game_time_et TEXT,
+            network TEXT,
+            location TEXT,
+            is_cfp INTEGER NOT NULL DEFAULT 0,
+            cfp_round TEXT,
+            points_per_win INTEGER NOT NULL DEFAULT 1,
+            kickoff_et TEXT,
+            kickoff_pt TEXT,
+            lock_pt TEXT,
+            winner TEXT,
+            FOREIGN KEY(contest_id) REFERENCES contests(id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS users(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            contest_id INTEGER NOT NULL,
+            display_name TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'player',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(contest_id) REFERENCES contests(id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS picks(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            game_id INTEGER NOT NULL,
+            pick TEXT NOT NULL CHECK (pick IN ('team1','team2')),
+            points_awarded INTEGER NOT NULL DEFAULT 0,
+            UNIQUE(user_id, game_id),
+            FOREIGN KEY(user_id) REFERENCES users(id),
+            FOREIGN KEY(game_id) REFERENCES games(id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS cfp_links(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            game_id INTEGER NOT NULL,
+            slot TEXT NOT NULL CHECK (slot IN ('team1','team2')),
+            depends_on_game_id INTEGER NOT NULL,
+            FOREIGN KEY(game_id) REFERENCES games(id),
+            FOREIGN KEY(depends_on_game_id) REFERENCES games(id)
+        )''',
+    )),
+    (2, 'hot path indexes', (
+        'CREATE INDEX IF NOT EXISTS idx_games_contest ON games(contest_id)',
+        'CREATE INDEX IF NOT EXISTS idx_users_contest ON users(contest_id)',
+        'CREATE INDEX IF NOT EXISTS idx_cfp_links_game ON cfp_links(game_id)',
+        'CREATE INDEX IF NOT EXISTS idx_picks_game ON picks(game_id)',
+    )),
+    (3, 'materialized standings', lambda conn: _add_standings(conn)),
+    (4, 'schedule version', (
+        'ALTER TABLE contests ADD COLUMN schedule_version INTEGER NOT NULL DEFAULT 0',
+    )),
+    (5, 'scrape state', (
+        '''CREATE TABLE IF NOT EXISTS scrape_state(
+            contest_id INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT,
+            checked_at TEXT,
+            PRIMARY KEY(contest_id, url),
+            FOREIGN KEY(contest_id) REFERENCES contests(id)
+        )''',
+    )),
+    (6, 'background jobs', (
+        '''CREATE TABLE IF NOT EXISTS jobs(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            contest_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL CHECK (status IN ('queued','running','done','failed')),
+            progress TEXT,
+            result TEXT,
+            error TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            started_at TEXT,
+            finished_at TEXT,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(contest_id) REFERENCES contests(id)
+        )''',
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active ON jobs(contest_id, kind) WHERE status IN ('queued','running')",
+    )),
+    (7, 'pick seats', lambda conn: _add_pick_seats(conn)),
+    (8, 'numeric lock times', lambda conn: _add_lock_epochs(conn)),
+    (9, 'picks version', (
+        'ALTER TABLE users ADD COLUMN picks_version INTEGER NOT NULL DEFAULT 0',
+    )),
+    (10, 'standings outlook', (
+        'ALTER TABLE standings ADD COLUMN max_points INTEGER',
+        'ALTER TABLE standings ADD COLUMN eliminated INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE standings ADD COLUMN win_prob REAL',
+    )),
+    (11, 'pick distribution', (
+        'ALTER TABLE contests ADD COLUMN picks_version INTEGER NOT NULL DEFAULT 0',
+        # Covers per-game pick counts; still serves every game_id lookup, so
+        # the narrower index goes.
+        'CREATE INDEX IF NOT EXISTS idx_picks_game_pick ON picks(game_id, pick, user_id)',
+        'DROP INDEX IF EXISTS idx_picks_game',
+    )),
+    (12, 'season catalog', (
+        '''CREATE TABLE IF NOT EXISTS seasons(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS season_games(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            season_id INTEGER NOT NULL,
+            bowl_name TEXT NOT NULL,
+            team1 TEXT NOT NULL,
+            team2 TEXT NOT NULL,
+            game_date TEXT,
+            game_time_et TEXT,
+            network TEXT,
+            location TEXT,
+            is_cfp INTEGER NOT NULL DEFAULT 0,
+            cfp_round TEXT,
+            points_per_win INTEGER NOT NULL DEFAULT 1,
+            kickoff_et TEXT,
+            kickoff_pt TEXT,
+            lock_pt TEXT,
+            kickoff_ts INTEGER,
+            lock_ts INTEGER,
+            winner TEXT,
+            FOREIGN KEY(season_id) REFERENCES seasons(id)
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_season_games_season ON season_games(season_id)',
+        '''CREATE TABLE IF NOT EXISTS season_links(
+            season_game_id INTEGER NOT NULL,
+            slot TEXT NOT NULL CHECK (slot IN ('team1','team2')),
+            depends_on_season_game_id INTEGER NOT NULL,
+            PRIMARY KEY(season_game_id, slot),
+            FOREIGN KEY(season_game_id) REFERENCES season_games(id),
+            FOREIGN KEY(depends_on_season_game_id) REFERENCES season_games(id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS contest_overrides(
+            contest_id INTEGER NOT NULL,
+            season_game_id INTEGER NOT NULL,
+            points_per_win INTEGER,
+            excluded INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY(contest_id, season_game_id),
+            FOREIGN KEY(contest_id) REFERENCES contests(id),
+            FOREIGN KEY(season_game_id) REFERENCES season_games(id)
+        )''',
+        'ALTER TABLE contests ADD COLUMN season_id INTEGER REFERENCES seasons(id)',
+        'CREATE INDEX IF NOT EXISTS idx_contests_season ON contests(season_id)',
+        'ALTER TABLE games ADD COLUMN season_game_id INTEGER REFERENCES season_games(id)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_games_season_game ON games(season_game_id, contest_id)',
+    )),
+]
 
-    CREATE TABLE IF NOT EXISTS users(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _add_standings(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS standings(
+        user_id INTEGER PRIMARY KEY,
         contest_id INTEGER NOT NULL,
-        display_name TEXT NOT NULL,
-        role TEXT NOT NULL DEFAULT 'player',
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY(contest_id) REFERENCES contests(id)
-    );
-
-    CREATE TABLE IF NOT EXISTS picks(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        game_id INTEGER NOT NULL,
-        pick TEXT NOT NULL CHECK (pick IN ('team1','team2')),
-        points_awarded INTEGER NOT NULL DEFAULT 0,
-        UNIQUE(user_id, game_id),
+        points INTEGER NOT NULL DEFAULT 0,
+        correct INTEGER NOT NULL DEFAULT 0,
+        round_points TEXT NOT NULL DEFAULT '{}',
+        rank INTEGER NOT NULL DEFAULT 1,
         FOREIGN KEY(user_id) REFERENCES users(id),
-        FOREIGN KEY(game_id) REFERENCES games(id)
-    );
-
-    CREATE TABLE IF NOT EXISTS cfp_links(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        game_id INTEGER NOT NULL,
-        slot TEXT NOT NULL CHECK (slot IN ('team1','team2')),
-        depends_on_game_id INTEGER NOT NULL,
-        FOREIGN KEY(game_id) REFERENCES games(id),
-        FOREIGN KEY(depends_on_game_id) REFERENCES games(id)
-    );
-    ''')
+        FOREIGN KEY(contest_id) REFERENCES contests(id)
+    )''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_standings_contest ON standings(contest_id, rank)')
+    conn.execute('ALTER TABLE contests ADD COLUMN standings_version INTEGER NOT NULL DEFAULT 0')
+    # Totals per player and round from picks already scored, ranked with ties
+    # sharing a rank; players without scored picks get a zero row.
+    conn.execute('''INSERT INTO standings (user_id, contest_id, points, correct, round_points, rank)
+        SELECT u.id, u.contest_id, COALESCE(SUM(t.pts), 0), COALESCE(SUM(t.correct), 0),
+               COALESCE(json_group_object(t.rnd, t.pts) FILTER (WHERE t.rnd IS NOT NULL), '{}'),
+               RANK() OVER (PARTITION BY u.contest_id ORDER BY COALESCE(SUM(t.pts), 0) DESC)
+        FROM users u LEFT JOIN (
+            SELECT p.user_id, COALESCE(g.cfp_round, 'bowl') AS rnd,
+                   SUM(p.points_awarded) AS pts, SUM(p.points_awarded > 0) AS correct
+            FROM picks p JOIN games g ON g.id=p.game_id JOIN users pu ON pu.id=p.user_id
+            WHERE g.contest_id=pu.contest_id GROUP BY p.user_id, rnd
+        ) t ON t.user_id=u.id
+        GROUP BY u.id''')
+
+
+def _add_lock_epochs(conn):
+    # Steps below are frozen copies of the app code as of their version and
+    # read only columns that exist by then; later modules may move on.
+    conn.execute('ALTER TABLE games ADD COLUMN kickoff_ts INTEGER')
+    conn.execute('ALTER TABLE games ADD COLUMN lock_ts INTEGER')
+
+    def epoch(iso):
+        try:
+            return int(datetime.fromisoformat(iso).timestamp()) if iso else None
+        except ValueError:
+            return None
+    rows = conn.execute('SELECT id, kickoff_pt, lock_pt FROM games').fetchall()
+    conn.executemany('UPDATE games SET kickoff_ts=?, lock_ts=? WHERE id=?',
+                     [(epoch(r[1]), epoch(r[2]), r[0]) for r in rows])
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_games_lock ON games(contest_id, lock_ts)')
+
+
+def _add_pick_seats(conn):
+    conn.execute('ALTER TABLE picks ADD COLUMN seat TEXT')
+    for (contest_id,) in conn.execute('SELECT id FROM contests').fetchall():
+        game_ids = {r[0] for r in conn.execute('SELECT id FROM games WHERE contest_id=?', (contest_id,))}
+        feeds = {}
+        for gid, slot, dep in conn.execute(
+                'SELECT game_id, slot, depends_on_game_id FROM cfp_links WHERE game_id IN '
+                '(SELECT id FROM games WHERE contest_id=?)', (contest_id,)):
+            if dep in game_ids:
+                feeds.setdefault(gid, {})[slot] = dep
+        by_user = {}
+        for pid, uid, gid, pick in conn.execute(
+                'SELECT p.id, p.user_id, p.game_id, p.pick FROM picks p JOIN users u ON u.id=p.user_id '
+                'WHERE u.contest_id=?', (contest_id,)):
+            if gid in game_ids:
+                by_user.setdefault(uid, {})[gid] = (pid, pick)
+
+        # The seat of the team in gid's slot: "<game_id>:<slot>" where it
+        # enters the bracket, else whoever the player advanced into it.
+        def seat_of(picks, gid, slot, seen=()):
+            dep = feeds.get(gid, {}).get(slot)
+            if dep is None:
+                return f'{gid}:{slot}'
+            if dep in seen or dep not in picks:
+                return None
+            return seat_of(picks, dep, picks[dep][1], seen + (gid,))
+
+        conn.executemany('UPDATE picks SET seat=? WHERE id=?', [
+            (seat_of(picks, gid, pick), pid)
+            for picks in by_user.values() for gid, (pid, pick) in picks.items()
+        ])
+
+
+def schema_version(conn):
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def migrate(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version(
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )''')
     conn.commit()
+    if schema_version(conn) >= LATEST_VERSION:
+        return []
+
+    applied = []
+    # IMMEDIATE takes the write lock up front so concurrent workers starting
+    # together serialize here; re-read the version once we hold it.
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        current = schema_version(conn)
+        for version, name, steps in MIGRATIONS:
+            if version <= current:
+                continue
+            if callable(steps):
+                steps(conn)
+            else:
+                for sql in steps:
+                    conn.execute(sql)
+            conn.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)', (version, name))
+            applied.append(version)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return applied
+
+
+def schema_current(conn):
+    # One read and no write lock, unlike migrate(); for worker startup.
+    try:
+        return schema_version(conn) >= LATEST_VERSION
+    except sqlite3.OperationalError:
+        return False
+
+
+def init_db():
+    conn = get_conn()
+    if not schema_current(conn):
+        migrate(conn)
     conn.close()
+
+
+# Queries on the request path that must be served from an index. Parameters
+# only need the right shape; EXPLAIN QUERY PLAN does not run the statement.
+HOT_QUERIES = {
+    'scoreboard': (
+        'SELECT s.user_id, u.display_name, s.points, s.correct, s.round_points, s.rank '
+        'FROM standings s JOIN users u ON u.id=s.user_id WHERE s.contest_id=? ORDER BY s.rank, u.display_name', (1,)),
+    'picks_games': ('SELECT * FROM games WHERE contest_id=? ORDER BY is_cfp ASC, game_date, id', (1,)),
+    'picks_user': ('SELECT game_id, pick FROM picks WHERE user_id=?', (1,)),
+    'api_picks_etag': (
+        'SELECT u.picks_version, c.standings_version FROM users u JOIN contests c ON c.id=u.contest_id WHERE u.id=?', (1,)),
+    'open_games': ('SELECT id FROM games WHERE contest_id=? AND (lock_ts IS NULL OR lock_ts > ?)', (1, 0)),
+    'picks_links': (
+        'SELECT game_id, slot, depends_on_game_id FROM cfp_links WHERE game_id IN (SELECT id FROM games WHERE contest_id=?)', (1,)),
+    'score_game': ('SELECT game_id, pick, seat, points_awarded FROM picks WHERE game_id=?', (1,)),
+    'season_fanout': ('SELECT id, contest_id FROM games WHERE season_game_id IN (?, ?)', (1, 2)),
+    'pick_distribution': ('SELECT game_id, pick, COUNT(*) FROM picks WHERE game_id IN (?, ?) GROUP BY game_id, pick', (1, 2)),
+}
+
+
+def check_query_plans(conn, queries=HOT_QUERIES):
+    # Returns {name: [plan details]} for every query that scans a table
+    # instead of searching an index; an empty dict means all is well.
+    problems = {}
+    for name, (sql, params) in queries.items():
+        plan = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+        scans = [row['detail'] for row in plan if row['detail'].startswith('SCAN ') and 'CONSTANT ROW' not in row['detail']]
+        if scans:
+            problems[name] = scans
+    return problems
+
+
+if __name__ == '__main__':
+    import sys
+    init_db()
+    conn = get_conn()
+    problems = check_query_plans(conn)
+    for name, scans in problems.items():
+        print(f'{name}: ' + '; '.join(scans))
+    print(f'schema version {schema_version(conn)}; {len(HOT_QUERIES) - len(problems)}/{len(HOT_QUERIES)} hot queries indexed')
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,80 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from db import get_conn
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+# A queued/running job not heard from in this long is presumed lost with its
+# worker process and stops blocking new submissions.
+STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', '600'))
+
+ACTIVE = ('queued', 'running')
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+        return _executor
+
+
+def submit(contest_id, kind, fn, *args):
+    # Single-flight per (contest, kind): the partial unique index on active
+    # jobs rejects a second submission, across worker processes too.
+    # Returns (job_id, started); started is False if an active job was reused.
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE jobs SET status='failed', error='stalled', finished_at=CURRENT_TIMESTAMP "
+        "WHERE contest_id=? AND kind=? AND status IN ('queued','running') AND updated_at < datetime('now', ?)",
+        (contest_id, kind, f'-{STALE_SECONDS} seconds'),
+    )
+    try:
+        cur.execute("INSERT INTO jobs (contest_id, kind, status) VALUES (?, ?, 'queued')", (contest_id, kind))
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        cur.execute("SELECT id FROM jobs WHERE contest_id=? AND kind=? AND status IN ('queued','running')", (contest_id, kind))
+        row = cur.fetchone()
+        conn.close()
+        return row['id'], False
+    job_id = cur.lastrowid
+    conn.commit()
+    conn.close()
+    _get_executor().submit(_run, job_id, fn, args)
+    return job_id, True
+
+
+def _update(job_id, sql, params=()):
+    conn = get_conn()
+    conn.execute(f'UPDATE jobs SET {sql}, updated_at=CURRENT_TIMESTAMP WHERE id=?', (*params, job_id))
+    conn.commit()
+    conn.close()
+
+
+def _run(job_id, fn, args):
+    _update(job_id, "status='running', started_at=CURRENT_TIMESTAMP")
+    try:
+        result = fn(lambda message: _update(job_id, 'progress=?', (message,)), *args)
+    except Exception as e:
+        logging.exception('Job %s failed', job_id)
+        _update(job_id, "status='failed', error=?, finished_at=CURRENT_TIMESTAMP", (f'{type(e).__name__}: {e}',))
+    else:
+        _update(job_id, "status='done', result=?, finished_at=CURRENT_TIMESTAMP", (json.dumps(result),))
+
+
+def get_job(conn, job_id):
+    row = conn.execute('SELECT * FROM jobs WHERE id=?', (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    job['active'] = job['status'] in ACTIVE
+    return job
@@ -0,0 +1,153 @@
+import json
+import logging
+import os
+import queue
+import threading
+
+from db import pool
+import standings
+
+POLL_SECONDS = float(os.getenv('LIVE_POLL_SECONDS', '1'))
+HEARTBEAT_SECONDS = float(os.getenv('LIVE_HEARTBEAT_SECONDS', '15'))
+QUEUE_SIZE = int(os.getenv('LIVE_QUEUE_SIZE', '32'))
+
+log = logging.getLogger(__name__)
+
+
+def _row(r):
+    return {'user_id': r['user_id'], 'name': r['display_name'], 'rank': r['rank'], 'points': r['points'],
+            'correct': r['correct'], 'rounds': r['round_points'],
+            'max_points': r['max_points'], 'eliminated': r['eliminated'], 'win_prob': r['win_prob']}
+
+
+def event(name, version, payload):
+    return f'id: {version}\nevent: {name}\ndata: {json.dumps(payload, separators=(",", ":"))}\n\n'
+
+
+class Subscriber:
+    __slots__ = ('contest_id', 'queue', 'dropped')
+
+    def __init__(self, contest_id):
+        self.contest_id = contest_id
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.dropped = False
+
+    def send(self, version, message):
+        try:
+            self.queue.put_nowait((version, message))
+        except queue.Full:
+            # A client this far behind reconnects and starts from a snapshot.
+            self.dropped = True
+
+
+class Broadcaster:
+    # One per worker process. A single thread watches the shared database for
+    # standings changes in the contests someone is watching, computes each
+    # delta once and hands the same encoded event to every subscriber.
+    #
+    # Commits from other processes are seen through PRAGMA data_version on the
+    # thread's own connection, which only moves when another connection has
+    # written; a version query runs only then. notify() skips the wait for
+    # changes made in this process.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._subs = {}      # contest_id -> set of Subscriber
+        self._last = {}      # contest_id -> (standings_version, {user_id: row})
+        self._thread = None
+        self.stats = {'polls': 0, 'changes': 0, 'events': 0, 'dropped': 0}
+
+    def subscribe(self, conn, contest_id):
+        # Returns (subscriber, version, rows); rows are the snapshot to send
+        # first. Registered before the snapshot is read, so nothing committed
+        # after it can be missed.
+        sub = Subscriber(contest_id)
+        with self._lock:
+            self._subs.setdefault(contest_id, set()).add(sub)
+        version = conn.execute('SELECT standings_version FROM contests WHERE id=?', (contest_id,)).fetchone()[0]
+        rows = [_row(r) for r in standings.get_standings(conn, contest_id)]
+        with self._lock:
+            if contest_id not in self._last:
+                self._last[contest_id] = (version, {r['user_id']: r for r in rows})
+        self._start()
+        return sub, version, rows
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subs.get(sub.contest_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.contest_id]
+                    self._last.pop(sub.contest_id, None)
+
+    def notify(self):
+        self._wake.set()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='live-broadcaster', daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        conn = pool.acquire()
+        data_version = None
+        while True:
+            self._wake.wait(POLL_SECONDS)
+            self._wake.clear()
+            with self._lock:
+                watched = list(self._subs)
+            if not watched:
+                continue
+            try:
+                self.stats['polls'] += 1
+                current = conn.execute('PRAGMA data_version').fetchone()[0]
+                if current == data_version:
+                    continue
+                data_version = current
+                marks = ','.join('?' * len(watched))
+                versions = conn.execute(
+                    f'SELECT id, standings_version FROM contests WHERE id IN ({marks})', watched).fetchall()
+                for contest_id, version in versions:
+                    last = self._last.get(contest_id)
+                    if last is not None and last[0] != version:
+                        self._publish(conn, contest_id, version, last[1])
+            except Exception:
+                log.exception('live broadcaster poll failed')
+
+    def _publish(self, conn, contest_id, version, previous):
+        rows = {r['user_id']: _row(r) for r in standings.get_standings(conn, contest_id)}
+        changed = [r for uid, r in rows.items() if previous.get(uid) != r]
+        removed = [uid for uid in previous if uid not in rows]
+        message = event('delta', version, {'version': version, 'rows': changed, 'removed': removed})
+        with self._lock:
+            self._last[contest_id] = (version, rows)
+            subs = list(self._subs.get(contest_id, ()))
+        self.stats['changes'] += 1
+        for sub in subs:
+            sub.send(version, message)
+        self.stats['events'] += len(subs)
+
+
+broadcaster = Broadcaster()
+
+
+def stream(sub, version, rows):
+    # Generator for the text/event-stream body. Deltas at or below the
+    # snapshot's version are already reflected in it and are skipped.
+    try:
+        yield 'retry: 3000\n\n'
+        yield event('snapshot', version, {'version': version, 'rows': rows})
+        while not sub.dropped:
+            try:
+                delta_version, message = sub.queue.get(timeout=HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            if delta_version > version:
+                yield message
+        broadcaster.stats['dropped'] += 1
+    finally:
+        broadcaster.unsubscribe(sub)
@@ -0,0 +1,54 @@
+import threading
+import time
+from datetime import datetime
+
+
+def epoch(iso):
+    # ISO-8601 kickoff/lock string with offset -> integer epoch seconds.
+    if not iso:
+        return None
+    try:
+        return int(datetime.fromisoformat(iso).timestamp())
+    except ValueError:
+        return None
+
+
+def open_game_ids(conn, contest_id, now=None):
+    # Games still accepting picks, decided by SQLite on idx_games_lock.
+    now = int(time.time()) if now is None else now
+    cur = conn.execute(
+        'SELECT id FROM games WHERE contest_id=? AND (lock_ts IS NULL OR lock_ts > ?)',
+        (contest_id, now),
+    )
+    return {r['id'] for r in cur.fetchall()}
+
+
+class LockState:
+    __slots__ = ('version', 'locked', 'next_lock', 'key')
+
+    def __init__(self, schedule, now):
+        self.version = schedule.version
+        self.locked = frozenset(g.id for g in schedule.games if g.lock_ts is not None and g.lock_ts <= now)
+        upcoming = [g.lock_ts for g in schedule.games if g.lock_ts is not None and g.lock_ts > now]
+        self.next_lock = min(upcoming) if upcoming else None
+        # Changes only when the schedule does or a kickoff passes, so caches
+        # of lock-dependent data can key on it instead of on the clock.
+        self.key = (schedule.version, len(self.locked))
+
+    def current(self, version, now):
+        return version == self.version and (self.next_lock is None or now < self.next_lock)
+
+
+# contest_id -> LockState, recomputed only at the next lock boundary.
+_states = {}
+_lock = threading.Lock()
+
+
+def lock_state(schedule, now=None):
+    now = int(time.time()) if now is None else now
+    state = _states.get(schedule.contest_id)
+    if state is None or not state.current(schedule.version, now):
+        state = LockState(schedule, now)
+        with _lock:
+            _states[schedule.contest_id] = state
+    return state
@@ -0,0 +1,276 @@
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from flask import Response, g, request, before_render_template, template_rendered
+
+from db import connect_hooks
+
+SQL_ENABLED = os.getenv('METRICS_SQL', '1') != '0'
+# SQLite VM instructions between progress ticks; see _StatementTimer.
+SQL_TICK = int(os.getenv('METRICS_SQL_TICK', '1000'))
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '0'))
+SLOW_QUERIES_LOGGED = 5
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+log = logging.getLogger(__name__)
+
+
+class Histogram:
+    # Cumulative-bucket histogram keyed by a tuple of label values, rendered
+    # in the Prometheus text format. Per process, like the caches.
+
+    def __init__(self, name, help, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}    # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for labels, counts in sorted(series.items()):
+            base = _labels(self.labels, labels)
+            total = 0
+            for bound, n in zip(self.buckets + ('+Inf',), counts):
+                total += n
+                lines.append(f'{self.name}_bucket{_labels(self.labels + ("le",), labels + (bound,))} {total}')
+            lines.append(f'{self.name}_sum{base} {counts[-1]:.6f}')
+            lines.append(f'{self.name}_count{base} {total}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        lines += [f'{self.name}{_labels(self.labels, k)} {v:g}' for k, v in sorted(values.items())]
+        return lines
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    def esc(v):
+        return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{n}="{esc(v)}"' for n, v in zip(names, values)) + '}'
+
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Time to build a response, by endpoint.',
+                            ('endpoint', 'method'))
+REQUESTS = Counter('http_requests_total', 'Responses sent, by endpoint and status.', ('endpoint', 'method', 'status'))
+REQUEST_SQL_STATEMENTS = Histogram('http_request_sql_statements', 'SQL statements run per request.',
+                                   ('endpoint',), COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram('http_request_sql_seconds', 'SQLite time per request.', ('endpoint',))
+SQL_STATEMENTS = Counter('sql_statements_total', 'SQL statements run, requests and background threads alike.')
+SQL_SECONDS = Counter('sql_seconds_total', 'SQLite time, requests and background threads alike.')
+TEMPLATE_SECONDS = Histogram('template_render_seconds', 'Jinja render time, by template.', ('template',))
+SCRAPE_SECONDS = Histogram('scrape_phase_seconds', 'Schedule sync time, by phase.', ('phase',),
+                           LATENCY_BUCKETS + (30, 60))
+
+METRICS = [REQUEST_SECONDS, REQUESTS, REQUEST_SQL_STATEMENTS, REQUEST_SQL_SECONDS,
+           SQL_STATEMENTS, SQL_SECONDS, TEMPLATE_SECONDS, SCRAPE_SECONDS]
+
+# Callables returning {metric name: value}, rendered as gauges, e.g. pool stats.
+gauges = []
+
+# Statement text comes from the trace callback with parameters expanded;
+# literals are blanked so access codes stay out of the log and statements
+# that differ only in their values read alike.
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+_local = threading.local()
+
+
+class _RequestSQL:
+    __slots__ = ('statements', 'seconds', 'slowest')
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.slowest = []    # (seconds, sql), kept only for the slow-request log
+
+
+class _StatementTimer:
+    # sqlite3 has no end-of-statement hook. The trace callback marks each
+    # statement's start; the progress handler ticks every SQL_TICK VM
+    # instructions while SQLite works. A statement is charged from its start
+    # to its last tick, closed when the next statement starts on the
+    # connection or on the next look at the totals; statements too short to
+    # tick count as zero. Time the caller spends between fetches only counts
+    # when SQLite ticks again afterwards.
+    __slots__ = ('sql', 'start', 'last', 'owner', '__weakref__')
+
+    def __init__(self):
+        self.sql = None
+        self.start = self.last = 0.0
+        self.owner = None
+
+    def trace(self, sql):
+        now = time.perf_counter()
+        self.close()
+        self.sql, self.start, self.last = sql, now, now
+        self.owner = getattr(_local, 'sql', None)
+        SQL_STATEMENTS.inc()
+        if self.owner is not None:
+            self.owner.statements += 1
+
+    def tick(self):
+        self.last = time.perf_counter()
+        return 0
+
+    def close(self):
+        if self.sql is None:
+            return
+        seconds = self.last - self.start
+        if seconds:
+            SQL_SECONDS.inc(seconds)
+            if self.owner is not None:
+                self.owner.seconds += seconds
+                if SLOW_REQUEST_MS:
+                    self.owner.slowest.append((seconds, self.sql))
+        self.sql = None
+
+
+# Held weakly: a connection the pool discards takes its timer with it.
+_timers = weakref.WeakSet()
+_timers_lock = threading.Lock()
+
+
+def _install(conn):
+    timer = _StatementTimer()
+    conn.set_trace_callback(timer.trace)
+    conn.set_progress_handler(timer.tick, SQL_TICK)
+    with _timers_lock:
+        _timers.add(timer)
+
+
+def _close_statements(owner):
+    with _timers_lock:
+        timers = list(_timers)
+    for timer in timers:
+        if timer.owner is owner:
+            timer.close()
+
+
+@contextmanager
+def timed(histogram, *labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, *labels)
+
+
+def scrape_phase(phase):
+    return timed(SCRAPE_SECONDS, phase)
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    _local.sql = _RequestSQL()
+
+
+def _after_request(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _teardown_request(exc=None):
+    start = g.pop('metrics_start', None)
+    sql = getattr(_local, 'sql', None)
+    _local.sql = None
+    if start is None:
+        return
+    if sql is not None:
+        _close_statements(sql)
+    seconds = time.perf_counter() - start
+    # Unmatched URLs share one label so scanners cannot grow the series.
+    endpoint = request.endpoint or 'unmatched'
+    REQUEST_SECONDS.observe(seconds, endpoint, request.method)
+    REQUESTS.inc(1, endpoint, request.method, g.pop('metrics_status', 500))
+    if sql is not None:
+        REQUEST_SQL_STATEMENTS.observe(sql.statements, endpoint)
+        REQUEST_SQL_SECONDS.observe(sql.seconds, endpoint)
+    if SLOW_REQUEST_MS and seconds * 1000 >= SLOW_REQUEST_MS:
+        slowest = sorted(sql.slowest, reverse=True)[:SLOW_QUERIES_LOGGED] if sql else []
+        log.warning('slow request %s %s (%s): %.0f ms, %d statements, %.0f ms in SQLite%s',
+                    request.method, request.path, endpoint, seconds * 1000,
+                    sql.statements if sql else 0, sql.seconds * 1000 if sql else 0,
+                    ''.join(f'\n  {s * 1000:.1f} ms  {_LITERAL.sub("?", q)[:500]}' for s, q in slowest))
+
+
+def _template_started(sender, template, context, **extra):
+    stack = getattr(_local, 'templates', None)
+    if stack is None:
+        stack = _local.templates = []
+    stack.append(time.perf_counter())
+
+
+def _template_rendered(sender, template, context, **extra):
+    stack = getattr(_local, 'templates', None)
+    if stack:
+        TEMPLATE_SECONDS.observe(time.perf_counter() - stack.pop(), template.name or 'string')
+
+
+def render():
+    with _timers_lock:
+        timers = [t for t in _timers if t.owner is None]
+    for timer in timers:
+        # Background statements still open are charged up to their last tick.
+        timer.close()
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    for collect in gauges:
+        for name, value in collect().items():
+            lines += [f'# TYPE {name} gauge', f'{name} {value:g}']
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view():
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    # Call before the first database connection is opened so every pooled
+    # connection carries the SQL hooks.
+    if SQL_ENABLED and _install not in connect_hooks:
+        connect_hooks.append(_install)
+    app.before_request_funcs.setdefault(None, []).insert(0, _before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_rendered, app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
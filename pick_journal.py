@@ -0,0 +1,186 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from db import pool
+import metrics
+from pickset import store_picks
+from schedule import get_schedule
+import standings
+
+ENABLED = os.getenv('PICK_JOURNAL', '0') == '1'
+# How long the writer waits for more submissions after the first of a batch.
+WINDOW_SECONDS = float(os.getenv('PICK_JOURNAL_WINDOW_MS', '2')) / 1000
+MAX_BATCH = int(os.getenv('PICK_JOURNAL_MAX_BATCH', '256'))
+QUEUE_SIZE = int(os.getenv('PICK_JOURNAL_QUEUE_SIZE', '2048'))
+# How long a request waits for its batch to commit before giving up.
+ACK_TIMEOUT = float(os.getenv('PICK_JOURNAL_ACK_TIMEOUT', '30'))
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE = metrics.Histogram('pick_journal_batch_size', 'Submissions committed per transaction.', (),
+                               metrics.COUNT_BUCKETS)
+COMMIT_SECONDS = metrics.Histogram('pick_journal_commit_seconds', 'Time to validate, write and commit one batch.', ())
+WAIT_SECONDS = metrics.Histogram('pick_journal_wait_seconds', 'Time from enqueue to durable acknowledgment.', ())
+metrics.METRICS.extend([BATCH_SIZE, COMMIT_SECONDS, WAIT_SECONDS])
+
+
+class NotConfirmed(Exception):
+    # The journal could not confirm a save; the message is for the player.
+    pass
+
+
+class _Submission:
+    __slots__ = ('contest_id', 'user_id', 'picks', 'future', 'queued')
+
+    def __init__(self, contest_id, user_id, picks):
+        self.contest_id = contest_id
+        self.user_id = user_id
+        self.picks = picks
+        self.future = Future()
+        self.queued = time.perf_counter()
+
+
+class Journal:
+    # One writer thread per process owns a connection with synchronous=FULL
+    # and commits everything queued since its last commit as one transaction,
+    # so a surge of pick saves costs one fsync per batch instead of one per
+    # request, and requests no longer queue on SQLite's write lock.
+    #
+    # Locks are checked against the commit, not the enqueue: the batch is
+    # validated inside its write transaction, and if a game it accepted picks
+    # for has locked by the time it is about to commit, it is rolled back and
+    # validated again as of that moment.
+
+    def __init__(self):
+        self._queue = queue.Queue(QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {'batches': 0, 'submissions': 0, 'revalidated': 0, 'fallbacks': 0, 'errors': 0,
+                      'timeouts': 0, 'failed': 0}
+
+    def submit(self, contest_id, user_id, picks):
+        # Returns a Future of (accepted, report), set once the batch holding
+        # the submission has committed. Raises queue.Full when the writer is
+        # this far behind.
+        self._start()
+        sub = _Submission(contest_id, user_id, picks)
+        self._queue.put_nowait(sub)
+        return sub.future
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='pick-journal', daemon=True)
+                self._thread.start()
+
+    def _gather(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + WINDOW_SECONDS
+        while len(batch) < MAX_BATCH:
+            try:
+                batch.append(self._queue.get(timeout=max(deadline - time.perf_counter(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        conn = pool.acquire()
+        # The writer's commits are the acknowledgment, so make them durable.
+        conn.execute('PRAGMA synchronous=FULL')
+        while True:
+            batch = self._gather()
+            started = time.perf_counter()
+            try:
+                results = self._commit(conn, batch)
+            except Exception as e:
+                log.exception('pick journal batch failed')
+                if conn.in_transaction:
+                    conn.rollback()
+                self.stats['errors'] += 1
+                for sub in batch:
+                    sub.future.set_exception(e)
+                continue
+            done = time.perf_counter()
+            for sub, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    sub.future.set_exception(result)
+                else:
+                    sub.future.set_result(result)
+                WAIT_SECONDS.observe(done - sub.queued)
+            BATCH_SIZE.observe(len(batch))
+            COMMIT_SECONDS.observe(done - started)
+            self.stats['batches'] += 1
+            self.stats['submissions'] += len(batch)
+
+    def _commit(self, conn, batch):
+        now = time.time()
+        while True:
+            conn.execute('BEGIN IMMEDIATE')
+            results, accepted_locks = [], []
+            for sub in batch:
+                # One savepoint each, so a bad submission fails alone.
+                conn.execute('SAVEPOINT submission')
+                try:
+                    schedule = get_schedule(conn, sub.contest_id)
+                    accepted, report = store_picks(conn, schedule, sub.user_id, sub.picks, now)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO submission')
+                    results.append(e)
+                else:
+                    results.append((accepted, report))
+                    accepted_locks.extend(schedule.by_id[gid].lock_ts for gid in accepted)
+                conn.execute('RELEASE submission')
+            commit_at = time.time()
+            if any(lock is not None and lock <= commit_at for lock in accepted_locks):
+                # A kickoff passed while the batch was written.
+                conn.rollback()
+                self.stats['revalidated'] += 1
+                now = commit_at
+                continue
+            conn.commit()
+            return results
+
+
+journal = Journal()
+
+
+def save(conn, schedule, user_id, submitted):
+    # Stores one player's picks and returns (accepted, report) once they are
+    # committed: through the journal when PICK_JOURNAL=1, otherwise directly
+    # on the request's connection. Raises NotConfirmed when the journal
+    # times out, after which the batch may still commit, or fails it.
+    result = None
+    if ENABLED:
+        try:
+            result = journal.submit(schedule.contest_id, user_id, submitted).result(ACK_TIMEOUT)
+        except queue.Full:
+            journal.stats['fallbacks'] += 1
+            log.warning('pick journal queue full; writing directly')
+        except TimeoutError:
+            journal.stats['timeouts'] += 1
+            log.warning('pick journal did not confirm a save within %ss', ACK_TIMEOUT)
+            raise NotConfirmed('Your picks were not confirmed in time and may not be saved yet. '
+                               'Reload your picks to check before changing them.')
+        except Exception:
+            journal.stats['failed'] += 1
+            log.exception('pick journal could not save picks')
+            raise NotConfirmed('Your picks could not be saved. Please try again.')
+    if result is None:
+        result = store_picks(conn, schedule, user_id, submitted)
+        conn.commit()
+    if result[0] and any(g.winner for g in schedule.games):
+        # Max points and win odds follow the picks still in play.
+        standings.outlook.mark(schedule.contest_id)
+    return result
+
+
+def gauges():
+    return {'pick_journal_queue_depth': journal.depth()} if ENABLED else {}
+
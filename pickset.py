@@ -0,0 +1,78 @@
+from locks import open_game_ids
+
+PICK_VALUES = ('team1', 'team2')
+
+# Per-game outcomes reported back to the player.
+ACCEPTED = 'accepted'
+LOCKED = 'locked'
+NEEDS_PRIOR_PICK = 'needs_prior_pick'
+
+
+def form_picks(form, games):
+    submitted = {}
+    for g in games:
+        pick = form.get(f"pick_{g['id']}")
+        if pick in PICK_VALUES:
+            submitted[g['id']] = pick
+    return submitted
+
+
+def validate_picks(bracket, open_ids, existing, submitted):
+    # Walks the bracket once in round order, checking each submitted pick
+    # against its lock (open_ids: games not yet locked) and the teams the
+    # player's own picks put in that slot. Earlier-round picks from the same
+    # submission count.
+    merged = dict(existing)
+    resolved = {}
+    report = {}
+    for gid in bracket.order:
+        resolved[gid] = bracket.slot_teams(gid, merged, resolved)
+        pick = submitted.get(gid)
+        if pick is None:
+            continue
+        if gid not in open_ids:
+            report[gid] = LOCKED
+        elif resolved[gid][PICK_VALUES.index(pick)] is None:
+            report[gid] = NEEDS_PRIOR_PICK
+        else:
+            merged[gid] = pick
+            report[gid] = ACCEPTED
+    accepted = {gid: submitted[gid] for gid, status in report.items() if status == ACCEPTED}
+    return accepted, report
+
+
+UPSERT_PICK = ('INSERT INTO picks (user_id, game_id, pick, seat) VALUES (?, ?, ?, ?) '
+               'ON CONFLICT(user_id, game_id) DO UPDATE SET pick=excluded.pick, seat=excluded.seat')
+
+
+def pick_rows(bracket, user_id, accepted, existing, existing_seats):
+    # (user_id, game_id, pick, seat) rows to write, each pick with the seat it
+    # resolves to. Changing an early-round pick moves the seats of later
+    # picks, so those rows are rewritten too.
+    merged = {**existing, **accepted}
+    seats = bracket.picked_seats(merged)
+    return [(user_id, gid, pick, seats.get(gid)) for gid, pick in merged.items()
+            if existing.get(gid) != pick or existing_seats.get(gid) != seats.get(gid)]
+
+
+def upsert_picks(cur, bracket, user_id, accepted, existing, existing_seats):
+    rows = pick_rows(bracket, user_id, accepted, existing, existing_seats)
+    if rows:
+        cur.executemany(UPSERT_PICK, rows)
+        cur.execute('UPDATE users SET picks_version=picks_version+1 WHERE id=?', (user_id,))
+        cur.execute('UPDATE contests SET picks_version=picks_version+1 WHERE id=(SELECT contest_id FROM users WHERE id=?)',
+                    (user_id,))
+    return len(rows)
+
+
+def store_picks(conn, schedule, user_id, submitted, now=None):
+    # Validate and store one player's submission; the caller commits. Locks
+    # are checked as of `now` (default: the current time).
+    cur = conn.cursor()
+    cur.execute('SELECT game_id, pick, seat FROM picks WHERE user_id=?', (user_id,))
+    rows = cur.fetchall()
+    existing = {row['game_id']: row['pick'] for row in rows}
+    existing_seats = {row['game_id']: row['seat'] for row in rows}
+    accepted, report = validate_picks(schedule.bracket, open_game_ids(conn, schedule.contest_id, now), existing, submitted)
+    upsert_picks(cur, schedule.bracket, user_id, accepted, existing, existing_seats)
+    return accepted, report
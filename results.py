@@ -0,0 +1,347 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import time
+
+import requests
+
+from bracket import SLOTS, Bracket
+from db import get_conn
+from metrics import scrape_phase
+from schedule import get_schedule
+import scoring
+import seasons
+import standings
+
+RESULTS_URL = os.getenv('RESULTS_URL')
+POLL_SECONDS = float(os.getenv('RESULTS_POLL_SECONDS', '60'))
+MAX_BACKOFF_SECONDS = float(os.getenv('RESULTS_MAX_BACKOFF_SECONDS', '900'))
+
+# "Cure Bowl: Old Dominion 24, South Florida 10 (OT)" on a results page.
+RESULT_RE = re.compile(r'^(?P<bowl>[^:]+):\s*(?P<team1>.+?)\s+(?P<score1>\d+)\s*,\s*(?P<team2>.+?)\s+(?P<score2>\d+)'
+                       r'\s*(?:\(\w+\))?\s*(?:\|.*)?$')
+_RANKING = re.compile(r'^(?:no\.\s*\d+|#\d+|\(\d+\))\s+', re.IGNORECASE)
+
+log = logging.getLogger(__name__)
+
+
+def _key(name):
+    # Team and bowl names compared without case, spacing or a leading ranking.
+    if not name:
+        return None
+    return _RANKING.sub('', ' '.join(str(name).split())).casefold()
+
+
+def _result(bowl, date, team1, team2, winner):
+    return {'bowl_name': bowl, 'game_date': date, 'team1': team1, 'team2': team2, 'winner': winner}
+
+
+def parse_json(body):
+    # [{"bowl_name", "game_date", "team1", "team2", and either "winner" (a
+    # team name or team1/team2) or "team1_score"/"team2_score" with
+    # "status": "final"}], bare or under "games". Unfinished games are skipped.
+    data = json.loads(body)
+    games = data.get('games', []) if isinstance(data, dict) else data
+    if not isinstance(games, list):
+        raise FeedError('no list of games in the feed')
+    results = []
+    for g in games:
+        if not isinstance(g, dict):
+            continue
+        bowl = g.get('bowl_name') or g.get('bowl')
+        team1, team2 = g.get('team1'), g.get('team2')
+        winner = g.get('winner')
+        if winner in SLOTS:
+            winner = g.get(winner)
+        elif winner is None:
+            s1, s2 = g.get('team1_score'), g.get('team2_score')
+            final = g.get('final') is True or str(g.get('status', '')).lower().startswith('final')
+            if final and s1 is not None and s2 is not None and int(s1) != int(s2):
+                winner = team1 if int(s1) > int(s2) else team2
+        if bowl and team1 and team2 and winner:
+            results.append(_result(bowl, g.get('game_date') or g.get('date'), team1, team2, winner))
+    return results
+
+
+def parse_html(body, season=None):
+    # The NCAA schedule page once scores are posted: a game line turns from
+    # "Bowl: A vs. B 8 p.m. | ABC" into "Bowl: A 24, B 10". Read with the
+    # schedule scraper's line and date handling; season is the year the bowl
+    # season starts in (default SEASON_YEAR), as for a schedule scrape.
+    from scrape import DATE_RE, SEASON_YEAR, game_date, page_lines
+
+    season = season or SEASON_YEAR
+
+    results = []
+    month = day = None
+    for line in page_lines(body):
+        dm = DATE_RE.match(line)
+        if dm:
+            month, day = dm.group(2), dm.group(3)
+            continue
+        m = RESULT_RE.match(line)
+        if not m or 'vs.' in line:
+            continue
+        s1, s2 = int(m.group('score1')), int(m.group('score2'))
+        if s1 == s2:
+            continue
+        team1, team2 = m.group('team1').strip(), m.group('team2').strip()
+        results.append(_result(m.group('bowl').strip(), game_date(month, day, season), team1, team2,
+                               team1 if s1 > s2 else team2))
+    return results
+
+
+class FeedError(ValueError):
+    pass
+
+
+def parse(body, content_type='', fmt='auto', season=None):
+    if fmt == 'auto':
+        fmt = 'json' if 'json' in content_type or body.lstrip()[:1] in ('{', '[') else 'html'
+    try:
+        return parse_json(body) if fmt == 'json' else parse_html(body, season)
+    except FeedError:
+        raise
+    except Exception as e:
+        # Whatever the feed holds, a bad body fails this poll, not the poller.
+        raise FeedError(f'unreadable {fmt} feed: {e!r}') from e
+
+
+def season_year(conn, contest_ids=None):
+    # The year the polled contests' bowl season starts in: from their season
+    # catalog's name ("2024-25"), the latest if they span several, else
+    # SEASON_YEAR for contests on their own schedule.
+    from backfill import YEAR_RE
+    from scrape import SEASON_YEAR
+
+    where, params = ('WHERE c.id IN (%s)' % ','.join('?' * len(contest_ids)), list(contest_ids)) if contest_ids else ('', [])
+    years = [int(m.group()) for r in conn.execute(
+                 f'SELECT DISTINCT s.name FROM contests c JOIN seasons s ON s.id=c.season_id {where}', params)
+             for m in [YEAR_RE.search(r['name'])] if m]
+    return max(years, default=SEASON_YEAR)
+
+
+def match_results(games, bracket, results):
+    # Returns ({game_id: winning slot}, results matched to no game). A result
+    # matches a game with the same bowl (on the same date when both have one)
+    # whose slots hold its two teams, or failing a bowl match, the one game
+    # anywhere that does. CFP slots are filled from the winners
+    # already known plus those matched so far, so a quarterfinal can match in
+    # the same batch as the first-round game that decides its opponent.
+    by_bowl = {}
+    for g in games:
+        by_bowl.setdefault(_key(g['bowl_name']), []).append(g)
+    games = list(games)
+    known = {g['id']: g['winner'] for g in games if g['winner'] in SLOTS}
+    found, pending = {}, list(results)
+    while pending:
+        teams = bracket.resolve({**known, **found})
+        left = []
+        for r in pending:
+            # Failing the bowl name, both teams alone have to pick out the game.
+            hit = _match(by_bowl.get(_key(r['bowl_name'])) or games, teams, r)
+            if hit is None:
+                left.append(r)
+            else:
+                found[hit[0]] = hit[1]
+        if len(left) == len(pending):
+            break
+        pending = left
+    return found, pending
+
+
+def _match(candidates, teams, result):
+    dated = [g for g in candidates if result['game_date'] and g['game_date'] == result['game_date']]
+    winner = _key(result['winner'])
+    loser = _key(result['team2'] if _key(result['team1']) == winner else result['team1'])
+    hits = []
+    for g in dated or candidates:
+        names = [{_key(teams[g['id']][i]), _key(g[slot])} - {None, 'tbd'} for i, slot in enumerate(SLOTS)]
+        for i, slot in enumerate(SLOTS):
+            if winner in names[i] and loser in names[1 - i]:
+                hits.append((g['id'], slot))
+    return hits[0] if len(hits) == 1 else None
+
+
+def _catalogs(conn, contest_ids=None):
+    # (season_id, contest_id, games, bracket) for every season with a contest
+    # and every contest on its own schedule; a season is matched once for all
+    # of its contests.
+    where, params = ('WHERE id IN (%s)' % ','.join('?' * len(contest_ids)), list(contest_ids)) if contest_ids else ('', [])
+    rows = conn.execute(f'SELECT id, season_id FROM contests {where} ORDER BY id', params).fetchall()
+    for season_id in sorted({r['season_id'] for r in rows if r['season_id'] is not None}):
+        games = conn.execute('SELECT id, bowl_name, game_date, team1, team2, winner FROM season_games WHERE season_id=?',
+                             (season_id,)).fetchall()
+        links = conn.execute(
+            'SELECT l.season_game_id AS game_id, l.slot, l.depends_on_season_game_id AS depends_on_game_id '
+            'FROM season_links l JOIN season_games sg ON sg.id=l.season_game_id WHERE sg.season_id=?',
+            (season_id,)).fetchall()
+        yield season_id, None, games, Bracket(games, links)
+    for r in rows:
+        if r['season_id'] is None:
+            schedule = get_schedule(conn, r['id'])
+            yield None, r['id'], schedule.games, schedule.bracket
+
+
+def apply_results(conn, results, contest_ids=None):
+    # Matches results against every catalog and applies the winners in one
+    # transaction: one scoring batch for all contests on their own schedule,
+    # one set_winners per season. Only winners that differ from the stored
+    # ones are written, so re-reading an unchanged feed costs no writes.
+    batch, changed = {}, {}
+    matched = set()
+    for season_id, contest_id, games, bracket in _catalogs(conn, contest_ids):
+        found, left = match_results(games, bracket, results)
+        unmatched = {id(r) for r in left}
+        matched.update(id(r) for r in results if id(r) not in unmatched)
+        stored = {g['id']: g['winner'] for g in games}
+        found = {gid: w for gid, w in found.items() if stored.get(gid) != w}
+        if season_id is not None:
+            changed.update(seasons.set_winners(conn, season_id, found))
+        elif found:
+            batch[contest_id] = found
+    changed.update(scoring.apply_winners_batch(conn, batch))
+    conn.commit()
+    changed = {cid: ids for cid, ids in changed.items() if ids}
+    for contest_id in changed:
+        standings.refresh_outlook(conn, contest_id)
+    return {'results': len(results), 'unmatched': [r for r in results if id(r) not in matched],
+            'changed': changed}
+
+
+def pending(conn, now=None):
+    # Whether any game has kicked off without a winner; until one has there
+    # is nothing to look for.
+    now = int(time.time()) if now is None else now
+    return bool(conn.execute(
+        'SELECT EXISTS(SELECT 1 FROM games WHERE winner IS NULL AND (lock_ts IS NULL OR lock_ts <= ?)) '
+        'OR EXISTS(SELECT 1 FROM season_games WHERE winner IS NULL AND (lock_ts IS NULL OR lock_ts <= ?))',
+        (now, now)).fetchone()[0])
+
+
+class RetryLater(Exception):
+    def __init__(self, status, retry_after=None):
+        super().__init__(f'feed answered {status}')
+        self.retry_after = retry_after
+
+
+class Poller:
+    # Conditional GETs against the feed (If-None-Match / If-Modified-Since,
+    # then a content hash), so an unchanged feed is neither parsed nor
+    # matched. Failures back off exponentially up to max_backoff, honouring
+    # Retry-After on 429/503.
+
+    def __init__(self, url, fmt='auto', interval=POLL_SECONDS, max_backoff=MAX_BACKOFF_SECONDS, contest_ids=None,
+                 season=None):
+        self.url = url
+        self.fmt = fmt
+        self.season = season
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.contest_ids = contest_ids
+        self.etag = self.last_modified = self.content_hash = None
+        self.failures = 0
+
+    def poll_once(self, conn):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        with scrape_phase('results_fetch'):
+            resp = requests.get(self.url, headers=headers, timeout=30)
+        if resp.status_code == 304:
+            return {'status': 'not_modified'}
+        if resp.status_code in (429, 503):
+            retry_after = resp.headers.get('Retry-After')
+            raise RetryLater(resp.status_code, float(retry_after) if retry_after and retry_after.isdigit() else None)
+        resp.raise_for_status()
+        content_hash = hashlib.sha256(resp.content).hexdigest()
+        if content_hash == self.content_hash:
+            return {'status': 'unchanged'}
+        season = self.season or season_year(conn, self.contest_ids)
+        with scrape_phase('results_apply'):
+            summary = apply_results(conn, parse(resp.text, resp.headers.get('Content-Type', ''), self.fmt, season),
+                                    self.contest_ids)
+        # Remembered only once applied, so a failed apply is retried in full.
+        self.etag = resp.headers.get('ETag')
+        self.last_modified = resp.headers.get('Last-Modified')
+        self.content_hash = content_hash
+        return {'status': 'applied', **summary}
+
+    def next_delay(self, error=None):
+        if error is None:
+            self.failures = 0
+            return self.interval
+        self.failures += 1
+        delay = min(self.interval * 2 ** self.failures, self.max_backoff)
+        if getattr(error, 'retry_after', None):
+            delay = max(delay, error.retry_after)
+        # Jitter keeps several workers from retrying in step.
+        return delay * random.uniform(0.8, 1.2)
+
+    def run(self, once=False):
+        while True:
+            conn = get_conn()
+            error = summary = None
+            try:
+                if once or pending(conn):
+                    summary = self.poll_once(conn)
+                    _log_summary(summary)
+                else:
+                    log.debug('no games awaiting a result')
+            except (requests.RequestException, RetryLater, ValueError, sqlite3.Error) as e:
+                error = e
+                log.warning('results poll failed: %s', e)
+            except Exception as e:
+                # Anything else backs off and retries too, rather than
+                # ending the poller.
+                error = e
+                log.exception('results poll failed')
+            finally:
+                conn.close()
+            if once:
+                return summary, error
+            time.sleep(self.next_delay(error))
+
+
+def _log_summary(summary):
+    if summary['status'] != 'applied':
+        log.info('results feed %s', summary['status'].replace('_', ' '))
+        return
+    log.info('results feed: %d results, %d games changed in %d contests, %d unmatched',
+             summary['results'], sum(len(ids) for ids in summary['changed'].values()), len(summary['changed']),
+             len(summary['unmatched']))
+    for r in summary['unmatched']:
+        log.info('  unmatched: %s (%s) %s vs. %s', r['bowl_name'], r['game_date'], r['team1'], r['team2'])
+
+
+if __name__ == '__main__':
+    import argparse
+    from db import init_db
+
+    parser = argparse.ArgumentParser(description='Poll a scores feed and set winners as games finish.')
+    parser.add_argument('--url', default=RESULTS_URL, help='feed URL (default: $RESULTS_URL)')
+    parser.add_argument('--format', choices=('auto', 'json', 'html'), default='auto')
+    parser.add_argument('--contest', type=int, action='append', dest='contest_ids',
+                        help='only these contests (repeatable; default: all)')
+    parser.add_argument('--interval', type=float, default=POLL_SECONDS)
+    parser.add_argument('--season-year', type=int,
+                        help="year the bowl season starts in, for HTML dates (default: the contests' season, else $SEASON_YEAR)")
+    parser.add_argument('--once', action='store_true', help='poll once, even with no game awaiting a result, and exit')
+    args = parser.parse_args()
+    if not args.url:
+        parser.error('give --url or set RESULTS_URL')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    init_db()
+    poller = Poller(args.url, args.format, args.interval, contest_ids=args.contest_ids, season=args.season_year)
+    try:
+        summary, error = poller.run(once=args.once)
+        raise SystemExit(1 if error else 0)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,79 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+from bracket import Bracket
+
+CACHE_SIZE = int(os.getenv('SCHEDULE_CACHE_SIZE', '32'))
+
+GAME_FIELDS = (
+    'id', 'contest_id', 'bowl_name', 'team1', 'team2', 'game_date', 'game_time_et', 'network', 'location',
+    'is_cfp', 'cfp_round', 'points_per_win', 'kickoff_et', 'kickoff_pt', 'lock_pt', 'winner',
+    'kickoff_ts', 'lock_ts', 'season_game_id',
+)
+
+
+class Game(namedtuple('Game', GAME_FIELDS)):
+    __slots__ = ()
+
+    # Rows are read as g['team1'] throughout the app and templates; keep that working.
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return getattr(self, key)
+        return super().__getitem__(key)
+
+
+class Schedule:
+    __slots__ = ('contest_id', 'version', 'games', 'by_id', 'picks_order', 'bracket')
+
+    def __init__(self, contest_id, version, games, links):
+        self.contest_id = contest_id
+        self.version = version
+        self.games = tuple(games)
+        self.by_id = {g.id: g for g in self.games}
+        # Bowls first, then the playoff, as the picks page lists them.
+        self.picks_order = tuple(sorted(self.games, key=lambda g: g.is_cfp))
+        self.bracket = Bracket(self.games, links)
+
+
+# contest_id -> Schedule, least recently used first.
+_cache = OrderedDict()
+_lock = threading.Lock()
+stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def bump_version(cur, contest_id):
+    # Call in the same transaction as any change to a contest's games, links
+    # or winners; every worker sees the new number on its next lookup.
+    cur.execute('UPDATE contests SET schedule_version=schedule_version+1 WHERE id=?', (contest_id,))
+
+
+def load_schedule(conn, contest_id, version):
+    cur = conn.cursor()
+    cur.execute(f'SELECT {", ".join(GAME_FIELDS)} FROM games WHERE contest_id=? ORDER BY game_date, id', (contest_id,))
+    games = [Game(*row) for row in cur.fetchall()]
+    cur.execute('SELECT game_id, slot, depends_on_game_id FROM cfp_links WHERE game_id IN (SELECT id FROM games WHERE contest_id=?)', (contest_id,))
+    return Schedule(contest_id, version, games, cur.fetchall())
+
+
+def get_schedule(conn, contest_id):
+    cur = conn.cursor()
+    cur.execute('SELECT schedule_version FROM contests WHERE id=?', (contest_id,))
+    row = cur.fetchone()
+    version = row['schedule_version'] if row else 0
+    with _lock:
+        cached = _cache.get(contest_id)
+        # A newer copy than asked for is fine: a read snapshot may lag the file.
+        if cached is not None and cached.version >= version:
+            _cache.move_to_end(contest_id)
+            stats['hits'] += 1
+            return cached
+        stats['misses'] += 1
+    schedule = load_schedule(conn, contest_id, version)
+    with _lock:
+        _cache[contest_id] = schedule
+        _cache.move_to_end(contest_id)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+            stats['evictions'] += 1
+    return schedule
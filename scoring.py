@@ -0,0 +1,116 @@
+import standings
+from bracket import SLOTS
+from schedule import bump_version, load_schedule
+
+
+def refresh_seats(cur, contest_id, bracket):
+    # Recomputes picks.seat for every player in the contest, e.g. after the
+    # bracket is relinked. Only rows whose seat moved are written.
+    cur.execute(
+        'SELECT p.id, p.user_id, p.game_id, p.pick, p.seat FROM picks p JOIN users u ON u.id=p.user_id '
+        'WHERE u.contest_id=? ORDER BY p.user_id',
+        (contest_id,),
+    )
+    by_user = {}
+    for r in cur.fetchall():
+        by_user.setdefault(r['user_id'], []).append(r)
+    updates = []
+    for rows in by_user.values():
+        seats = bracket.picked_seats({r['game_id']: r['pick'] for r in rows})
+        updates.extend((seats.get(r['game_id']), r['id']) for r in rows if seats.get(r['game_id']) != r['seat'])
+    cur.executemany('UPDATE picks SET seat=? WHERE id=?', updates)
+    return len(updates)
+
+
+def reseat(conn, contest_id):
+    # refresh_seats against the contest's stored bracket, after its links
+    # changed. Moved seats change what stored picks mean, so caches keyed on
+    # picks_version are dropped. Returns whether any seat moved.
+    cur = conn.cursor()
+    if not refresh_seats(cur, contest_id, load_schedule(conn, contest_id, None).bracket):
+        return False
+    cur.execute('UPDATE users SET picks_version=picks_version+1 WHERE contest_id=?', (contest_id,))
+    return True
+
+
+# Points a pick `p` earns against its row `b` of scoring_batch. A pick scores
+# when its seat is the seat that actually won; an unresolved actual seat (a
+# winner set before the game feeding it) falls back to matching the slot. A
+# pick without a seat backs its slot, as in bracket.pick_seat.
+AWARD = ('CASE WHEN (CASE WHEN b.seat IS NULL THEN {p}.pick = b.winner '
+         "ELSE COALESCE({p}.seat, {p}.game_id || ':' || {p}.pick) = b.seat END) "
+         'THEN b.points ELSE 0 END')
+
+
+def _plan(conn, contest_id, submitted, rescore):
+    # Returns (changed winners, scoring_batch rows) for one contest. rescore
+    # names games to score again even though their winner stands, e.g. after
+    # their points changed.
+    rows = conn.execute('SELECT id, winner, points_per_win, cfp_round FROM games WHERE contest_id=?',
+                        (contest_id,)).fetchall()
+    points = {r['id']: r['points_per_win'] for r in rows}
+    rounds = {r['id']: standings.round_key(r['cfp_round']) for r in rows}
+    winners = {r['id']: r['winner'] for r in rows if r['winner'] in SLOTS}
+    changed = {gid: w for gid, w in submitted.items() if gid in points and w in SLOTS and winners.get(gid) != w}
+    rescore = [gid for gid in rescore if gid in winners]
+    if not changed and not rescore:
+        return {}, []
+    winners.update(changed)
+
+    bracket = load_schedule(conn, contest_id, None).bracket
+    actual = bracket.resolve_seats(winners)
+    affected = [gid for gid in bracket.downstream(changed) | set(rescore) if gid in winners]
+    batch = [(gid, actual[gid][SLOTS.index(winners[gid])], winners[gid], points[gid], rounds[gid]) for gid in affected]
+    return changed, batch
+
+
+def apply_winners_batch(conn, submitted, rescore=None):
+    # submitted: {contest_id: {game_id: 'team1'|'team2'}}. Only winners that
+    # differ from the stored ones count as changes; those games and every
+    # later CFP game they feed are re-scored, for every contest at once, with
+    # one UPDATE ... FROM over a temp batch table, so a player who carried the
+    # wrong team into a CFP slot gets nothing there. Runs inside the caller's
+    # transaction; returns {contest_id: changed game ids}.
+    cur = conn.cursor()
+    rescore = rescore or {}
+    if not conn.in_transaction:
+        # Writing the temp table would open a deferred transaction that
+        # holds a read snapshot; upgrading it to write after another
+        # connection commits fails at once instead of waiting on busy_timeout.
+        cur.execute('BEGIN IMMEDIATE')
+    cur.execute('CREATE TEMP TABLE IF NOT EXISTS scoring_batch(game_id INTEGER PRIMARY KEY, seat TEXT, winner TEXT, points INTEGER, rnd TEXT)')
+    cur.execute('DELETE FROM scoring_batch')
+    result, touched = {}, []
+    for contest_id in submitted.keys() | rescore.keys():
+        changed, batch = _plan(conn, contest_id, submitted.get(contest_id, {}), rescore.get(contest_id, ()))
+        result[contest_id] = sorted(changed)
+        if not batch:
+            continue
+        touched.append(contest_id)
+        cur.executemany('UPDATE games SET winner=? WHERE id=?', [(w, gid) for gid, w in changed.items()])
+        cur.executemany('INSERT INTO scoring_batch (game_id, seat, winner, points, rnd) VALUES (?, ?, ?, ?, ?)', batch)
+    if not touched:
+        return result
+    # Standings move by the difference between the new and the stored awards,
+    # so take it before the picks are rewritten. The temp table has no stats;
+    # CROSS JOIN and the IN clause keep SQLite driving from the batch into
+    # idx_picks_game_pick instead of scanning every pick.
+    standings.apply_delta_query(cur, f"""
+        SELECT user_id, rnd, SUM(new - old), SUM((new > 0) - (old > 0)) FROM (
+            SELECT p.user_id, b.rnd, p.points_awarded AS old, {AWARD.format(p='p')} AS new
+            FROM scoring_batch b CROSS JOIN picks p ON p.game_id = b.game_id
+        ) GROUP BY user_id, rnd HAVING SUM(new - old) != 0 OR SUM((new > 0) - (old > 0)) != 0
+    """)
+    cur.execute(
+        f"UPDATE picks SET points_awarded = {AWARD.format(p='picks')} FROM scoring_batch b "
+        f"WHERE picks.game_id = b.game_id AND picks.game_id IN (SELECT game_id FROM scoring_batch) "
+        f"AND picks.points_awarded != {AWARD.format(p='picks')}"
+    )
+    for contest_id in touched:
+        bump_version(cur, contest_id)
+    return result
+
+
+def apply_winners(conn, contest_id, submitted):
+    # One contest's winners; returns the changed game ids.
+    return apply_winners_batch(conn, {contest_id: submitted})[contest_id]
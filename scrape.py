@@ -1,21 +1,38 @@
 
+import hashlib
+import math
+import os
 import re
 import requests
 from bs4 import BeautifulSoup
-import pandas as pd
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
+import bracket_templates
 from db import get_conn
-
-NCAA_URL = 'https://www.ncaa.com/news/football/article/2025-12-07/2025-26-college-football-bowl-game-schedule-scores-tv-channels-times'
-
-DATE_RE = re.compile(r'^(Monday|Tuesday|Wednesday|Thursday|Friday|Saturday|Sunday),\s+([A-Za-z]+)\s+(\d{1,2})')
+from metrics import scrape_phase
+import schedule
+import scoring
+import standings
+
+NCAA_URL = os.getenv('NCAA_URL', 'https://www.ncaa.com/news/football/article/2025-12-07/2025-26-college-football-bowl-game-schedule-scores-tv-channels-times')
+# Year bowl season starts in; dates from January on fall in the next year.
+SEASON_YEAR = int(os.getenv('SEASON_YEAR', '2025'))
+
+# "Friday, December 19", or "Friday, Dec. 20" on older pages.
+DATE_RE = re.compile(r'^(Monday|Tuesday|Wednesday|Thursday|Friday|Saturday|Sunday),\s+([A-Za-z]+)\.?\s+(\d{1,2})')
+# "Rose Bowl: Indiana vs. Alabama 4 p.m. | ESPN Pasadena, Calif."; the bowl
+# name is everything before the colon.
 LINE_RE = re.compile(
-    r'^(?P<bowl>[^\n]+?)\s+'
-    r'(?P<team1>[^\n]+?)\s+vs\.\s+(?P<team2>[^\n]+?)\s+'
+    r'^(?P<bowl>[^:|\n]+):\s+'
+    r'(?P<team1>[^|\n]+?)\s+vs\.\s+(?P<team2>[^|\n]+?)\s+'
     r'(?P<time>[0-9:.]+\s*(?:a|p)\.m\.)\s*\|\s*(?P<network>[^\n|]+)\s*(?P<location>.*)$'
 )
+# Lines LINE_RE rejects, e.g. with no bowl name before the teams.
+FALLBACK_RE = re.compile(r'(?P<team1>[^|]+?)\s+vs\.\s+(?P<team2>[^|]+?)\s+(?P<time>[0-9:.]+\s*(?:a|p)\.m\.)\s*\|\s*(?P<network>[^\n|]+)')
+# Both patterns above need a kickoff time and ' | network'; lines without one
+# are skipped before either runs, since failing LINE_RE tries every split.
+KICKOFF_RE = re.compile(r'[0-9:.]+\s*(?:a|p)\.m\.\s*\|')
 TIME_RE = re.compile(r'^(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<ap>[ap])\.m\.$', re.IGNORECASE)
 
 ET = ZoneInfo('America/New_York')
@@ -23,10 +40,23 @@ PT = ZoneInfo('America/Los_Angeles')
 
 CFP_POINTS = {'first': 1, 'quarter': 2, 'semi': 3, 'final': 4}
 
-def scrape_ncaa(url: str = NCAA_URL) -> pd.DataFrame:
+GAME_FIELDS = (
+    'bowl_name', 'team1', 'team2', 'game_date', 'game_time_et', 'network', 'location',
+    'is_cfp', 'cfp_round', 'points_per_win', 'kickoff_et', 'kickoff_pt', 'lock_pt',
+    'kickoff_ts', 'lock_ts',
+)
+
+def scrape_ncaa(url: str = NCAA_URL) -> 'pd.DataFrame':
+    # pandas is only needed here and in load_into_db, not for syncs.
+    import pandas as pd
     resp = requests.get(url, timeout=30)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, 'html.parser')
+    return pd.DataFrame(parse_schedule(resp.text))
+
+
+def page_lines(html: str) -> list:
+    # The article's headings, paragraphs and list items as whitespace-normalized text.
+    soup = BeautifulSoup(html, 'html.parser')
 
     container = soup.select_one('article') or soup.select_one('.field--name-body') or soup.select_one('main') or soup
     lines = []
@@ -34,10 +64,32 @@ def scrape_ncaa(url: str = NCAA_URL) -> pd.DataFrame:
         txt = ' '.join(el.get_text(' ', strip=True).split())
         if txt:
             lines.append(txt)
+    return lines
+
 
+def game_date(month, day, season=SEASON_YEAR):
+    if not (month and day):
+        return None
+    for fmt in ('%b','%B'):
+        try:
+            m = datetime.strptime(month, fmt).month
+        except ValueError:
+            continue
+        try:
+            return datetime(season + (m < 8), m, int(day)).strftime('%Y-%m-%d')
+        except ValueError:
+            return None
+    return None
+
+
+def parse_schedule(html: str, season: int = SEASON_YEAR) -> list:
+    return list(iter_records(page_lines(html), season))
+
+
+def iter_records(lines, season: int = SEASON_YEAR):
+    # Game records from page_lines() output, one per schedule line, in page order.
     current_month = None
     current_day = None
-    records = []
 
     for line in lines:
         dm = DATE_RE.match(line)
@@ -45,10 +97,10 @@ def scrape_ncaa(url: str = NCAA_URL) -> pd.DataFrame:
             current_month = dm.group(2)
             current_day = dm.group(3)
             continue
-        if 'vs.' in line:
+        if 'vs.' in line and KICKOFF_RE.search(line):
             m = LINE_RE.match(line)
             if not m:
-                m2 = re.search(r'(?P<team1>[^|]+?)\s+vs\.\s+(?P<team2>[^|]+?)\s+(?P<time>[0-9:.]+\s*(?:a|p)\.m\.)\s*\|\s*(?P<network>[^\n|]+)', line)
+                m2 = FALLBACK_RE.search(line)
                 bowl_name = line.split(' vs. ')[0].strip()
                 if m2:
                     team1 = m2.group('team1').strip()
@@ -67,15 +119,7 @@ def scrape_ncaa(url: str = NCAA_URL) -> pd.DataFrame:
                 location = (m.group('location') or '').strip() or None
 
             # Date
-            game_date = None
-            if current_month and current_day:
-                for fmt in ('%b','%B'):
-                    try:
-                        dt = datetime.strptime(f"{current_month} {current_day} 2025", f"{fmt} %d %Y")
-                        game_date = dt.strftime('%Y-%m-%d')
-                        break
-                    except ValueError:
-                        pass
+            date = game_date(current_month, current_day, season)
 
             # CFP round + points
             is_cfp = 0
@@ -95,7 +139,8 @@ def scrape_ncaa(url: str = NCAA_URL) -> pd.DataFrame:
 
             # ET -> PT
             kickoff_et = kickoff_pt = lock_pt = None
-            if game_date and time_et:
+            kickoff_ts = lock_ts = None
+            if date and time_et:
                 tm = TIME_RE.match(time_et)
                 if tm:
                     hour = int(tm.group('hour'))
@@ -105,17 +150,18 @@ def scrape_ncaa(url: str = NCAA_URL) -> pd.DataFrame:
                         hour += 12
                     if ap == 'a' and hour == 12:
                         hour = 0
-                    dt_et = datetime.fromisoformat(game_date).replace(hour=hour, minute=minute, tzinfo=ET)
+                    dt_et = datetime.fromisoformat(date).replace(hour=hour, minute=minute, tzinfo=ET)
                     kickoff_et = dt_et.isoformat()
                     dt_pt = dt_et.astimezone(PT)
                     kickoff_pt = dt_pt.isoformat()
                     lock_pt = kickoff_pt
+                    kickoff_ts = lock_ts = int(dt_et.timestamp())
 
-            records.append({
+            yield {
                 'bowl_name': bowl_name,
                 'team1': team1,
                 'team2': team2,
-                'game_date': game_date,
+                'game_date': date,
                 'game_time_et': time_et,
                 'network': network,
                 'location': location,
@@ -125,85 +171,226 @@ def scrape_ncaa(url: str = NCAA_URL) -> pd.DataFrame:
                 'kickoff_et': kickoff_et,
                 'kickoff_pt': kickoff_pt,
                 'lock_pt': lock_pt,
-            })
+                'kickoff_ts': kickoff_ts,
+                'lock_ts': lock_ts,
+            }
 
-    return pd.DataFrame(records)
 
-
-def load_into_db(contest_id: int, df: pd.DataFrame):
-    conn = get_conn()
-    cur = conn.cursor()
-    for _, r in df.iterrows():
-        cur.execute(
-            'INSERT INTO games (contest_id,bowl_name,team1,team2,game_date,game_time_et,network,location,is_cfp,cfp_round,points_per_win,kickoff_et,kickoff_pt,lock_pt,winner) '
-            'VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,NULL)',
-            (
-                contest_id,
-                r.get('bowl_name'), r.get('team1'), r.get('team2'),
-                r.get('game_date'), r.get('game_time_et'),
-                r.get('network'),   r.get('location'),
-                int(r.get('is_cfp') or 0), r.get('cfp_round'),
-                int(r.get('points_per_win') or 1),
-                r.get('kickoff_et'), r.get('kickoff_pt'), r.get('lock_pt')
-            )
+def _clean(value):
+    # DataFrame rows carry NaN for missing values; the DB wants NULL.
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def natural_keys(rows):
+    # Games are keyed on (bowl, date, n) where n counts earlier games with the
+    # same bowl and date, so the First Round games sharing a name and day stay
+    # distinct while team names fill in as the bracket settles.
+    seen = {}
+    keys = []
+    for r in rows:
+        base = (r['bowl_name'], r['game_date'])
+        keys.append(base + (seen.get(base, 0),))
+        seen[base] = seen.get(base, 0) + 1
+    return keys
+
+
+def _line_key(r):
+    # The date and words of the line a game was parsed from, however the
+    # line was divided into bowl and teams.
+    return r['game_date'], ' '.join(f"{r['bowl_name']} {r['team1']} vs. {r['team2']}".replace(':', ' ').split())
+
+
+def _teams_key(r):
+    return r['bowl_name'], r['team1'], r['team2']
+
+
+def diff_games(existing, records):
+    # existing: game rows in id order; records: parsed schedule in page order.
+    # Returns (inserts, updates, deletes) where updates are (game_id, record)
+    # and deletes are (game_id, surviving game_id or None).
+    current = dict(zip(natural_keys(existing), existing))
+    wanted = dict(zip(natural_keys(records), records))
+    per_group = {}
+    for bowl, date, n in wanted:
+        per_group[(bowl, date)] = max(per_group.get((bowl, date), 0), n + 1)
+
+    # A row whose key is gone is updated in place, keeping its picks, when
+    # its schedule line reappears under a new key (split differently by an
+    # older parser) or its bowl and teams reappear on another date (a game
+    # moved to another day).
+    by_line, by_teams = {}, {}
+    for key, row in current.items():
+        if key not in wanted:
+            by_line.setdefault(_line_key(row), row)
+            by_teams.setdefault(_teams_key(row), row)
+    inserts, updates, renamed = [], [], set()
+    for key, rec in wanted.items():
+        row = current.get(key)
+        if row is None:
+            row = next((r for r in (by_line.get(_line_key(rec)), by_teams.get(_teams_key(rec)))
+                        if r is not None and r['id'] not in renamed), None)
+            if row is None:
+                inserts.append(rec)
+                continue
+            renamed.add(row['id'])
+        if any(row[f] != rec[f] for f in GAME_FIELDS):
+            updates.append((row['id'], rec))
+    deletes = []
+    for (bowl, date, n), row in current.items():
+        if (bowl, date, n) in wanted or row['id'] in renamed:
+            continue
+        # Copies left behind by the old append-on-every-scrape loader fold
+        # into the game they duplicate.
+        count = per_group.get((bowl, date))
+        survivor = current[(bowl, date, n % count)]['id'] if count else None
+        deletes.append((row['id'], survivor))
+    return inserts, updates, deletes
+
+
+def clean_records(records) -> list:
+    records = [{f: _clean(r.get(f)) for f in GAME_FIELDS} for r in records]
+    if not records:
+        # A layout change that parses to nothing must not wipe the schedule.
+        raise ValueError('no games parsed; refusing to sync an empty schedule')
+    for r in records:
+        r['is_cfp'] = int(r['is_cfp'] or 0)
+        r['points_per_win'] = int(r['points_per_win'] or 1)
+        for f in ('kickoff_ts', 'lock_ts'):
+            if r[f] is not None:
+                r[f] = int(r[f])
+    return records
+
+
+def write_games(cur, table, fields, inserts, updates, **owner):
+    # Inserts records into games or season_games, with owner's columns (e.g.
+    # contest_id=3) on every new row, and updates (row id, record) pairs.
+    if inserts:
+        cols = list(owner) + list(fields)
+        cur.executemany(
+            f'INSERT INTO {table} ({", ".join(cols)}) VALUES ({", ".join("?" * len(cols))})',
+            [tuple(owner.values()) + tuple(r[f] for f in fields) for r in inserts],
+        )
+    if updates:
+        cur.executemany(
+            f'UPDATE {table} SET {", ".join(f + "=?" for f in fields)} WHERE id=?',
+            [tuple(r[f] for f in fields) + (gid,) for gid, r in updates],
         )
-    conn.commit()
-    conn.close()
 
 
-def build_cfp_links(contest_id: int):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('SELECT id,bowl_name,team1,team2,cfp_round FROM games WHERE contest_id=?', (contest_id,))
-    rows = cur.fetchall()
+def drop_games(cur, deletes):
+    # deletes: (game_id, surviving game_id or None). Picks move to the
+    # survivor where the player has none there; the rest go with the game
+    # and its links.
+    merges = [(survivor, gid) for gid, survivor in deletes if survivor is not None]
+    cur.executemany('UPDATE OR IGNORE picks SET game_id=? WHERE game_id=?', merges)
+    gone = [(gid,) for gid, _ in deletes]
+    cur.executemany('DELETE FROM picks WHERE game_id=?', gone)
+    cur.executemany('DELETE FROM cfp_links WHERE game_id=? OR depends_on_game_id=?', [(gid, gid) for gid, in gone])
+    cur.executemany('DELETE FROM games WHERE id=?', gone)
 
-    def find(pred):
-        for r in rows:
-            if pred(r):
-                return r
-        return None
 
-    # Identify First Round games by teams
-    fr_ou_ala = find(lambda r: r['cfp_round']=='first' and ('Oklahoma' in r['team1'] or 'Oklahoma' in r['team2']) and ('Alabama' in r['team1'] or 'Alabama' in r['team2']))
-    fr_tamu_mia = find(lambda r: r['cfp_round']=='first' and ('Texas A&M' in r['team1'] or 'Texas A&M' in r['team2']) and ('Miami' in r['team1'] or 'Miami' in r['team2']))
-    fr_om_tul  = find(lambda r: r['cfp_round']=='first' and ('Ole Miss' in r['team1'] or 'Ole Miss' in r['team2']) and ('Tulane' in r['team1'] or 'Tulane' in r['team2']))
-    fr_ore_jmu = find(lambda r: r['cfp_round']=='first' and ('Oregon' in r['team1'] or 'Oregon' in r['team2']) and ('James Madison' in r['team1'] or 'James Madison' in r['team2']))
+def sync_games(contest_id: int, records) -> dict:
+    records = clean_records(records)
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute(f'SELECT id, {", ".join(GAME_FIELDS)} FROM games WHERE contest_id=? ORDER BY id', (contest_id,))
+        inserts, updates, deletes = diff_games(cur.fetchall(), records)
+
+        write_games(cur, 'games', GAME_FIELDS, inserts, updates, contest_id=contest_id)
+        if deletes:
+            drop_games(cur, deletes)
+            standings.rebuild(cur, contest_id)
+        if inserts or updates or deletes:
+            schedule.bump_version(cur, contest_id)
+        conn.commit()
+    finally:
+        conn.close()
+    return {'inserted': len(inserts), 'updated': len(updates), 'deleted': len(deletes), 'games': len(records)}
 
-    # Quarterfinals by bowl name
-    qf_orange = find(lambda r: r['cfp_round']=='quarter' and 'Orange Bowl' in r['bowl_name'])
-    qf_rose   = find(lambda r: r['cfp_round']=='quarter' and 'Rose Bowl'   in r['bowl_name'])
-    qf_sugar  = find(lambda r: r['cfp_round']=='quarter' and 'Sugar Bowl'  in r['bowl_name'])
-    qf_cotton = find(lambda r: r['cfp_round']=='quarter' and 'Cotton Bowl' in r['bowl_name'])
 
-    # Semifinals
-    sf_fiesta = find(lambda r: r['cfp_round']=='semi' and 'Fiesta Bowl' in r['bowl_name'])
-    sf_peach  = find(lambda r: r['cfp_round']=='semi' and 'Peach Bowl'  in r['bowl_name'])
+def load_into_db(contest_id: int, df: 'pd.DataFrame') -> dict:
+    return sync_games(contest_id, df.to_dict('records'))
 
-    # Final
-    final     = find(lambda r: r['cfp_round']=='final')
 
-    def link(game, slot, dep):
-        if game and dep:
-            cur.execute('INSERT INTO cfp_links (game_id,slot,depends_on_game_id) VALUES (?,?,?)', (game['id'], slot, dep['id']))
+def sync_from_url(contest_id: int, url: str = NCAA_URL, force: bool = False, progress=None) -> dict:
+    # Conditional fetch; a 304 or an unchanged body skips parsing, the game
+    # sync and the link rebuild altogether.
+    progress = progress or (lambda message: None)
+    conn = get_conn()
+    # Closed on every path, or a failed fetch or sync in a background job
+    # would keep its pooled connection.
+    try:
+        cur = conn.cursor()
+        cur.execute('SELECT etag, last_modified, content_hash FROM scrape_state WHERE contest_id=? AND url=?', (contest_id, url))
+        state = cur.fetchone()
+        headers = {}
+        if state and not force:
+            if state['etag']:
+                headers['If-None-Match'] = state['etag']
+            if state['last_modified']:
+                headers['If-Modified-Since'] = state['last_modified']
+        progress('Fetching schedule page')
+        with scrape_phase('fetch'):
+            resp = requests.get(url, headers=headers, timeout=30)
+        if resp.status_code == 304:
+            return {'status': 'not_modified'}
+        resp.raise_for_status()
+
+        content_hash = hashlib.sha256(resp.content).hexdigest()
+        result = {'status': 'unchanged'}
+        if force or not state or state['content_hash'] != content_hash:
+            progress('Parsing schedule')
+            with scrape_phase('parse'):
+                records = parse_schedule(resp.text)
+            season_id = cur.execute('SELECT season_id FROM contests WHERE id=?', (contest_id,)).fetchone()['season_id']
+            if season_id is not None:
+                # Season contests share one catalog; syncing it updates them all.
+                import seasons
+                progress(f'Syncing {len(records)} games into season {season_id}')
+                with scrape_phase('load'):
+                    result = {'status': 'synced', **seasons.sync_season(conn, season_id, records)}
+            else:
+                progress(f'Syncing {len(records)} games')
+                with scrape_phase('load'):
+                    result = {'status': 'synced', **sync_games(contest_id, records)}
+                progress('Rebuilding CFP links')
+                with scrape_phase('link'):
+                    build_cfp_links(contest_id)
+        cur.execute(
+            'INSERT INTO scrape_state (contest_id, url, etag, last_modified, content_hash, checked_at) '
+            'VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP) ON CONFLICT(contest_id, url) DO UPDATE SET '
+            'etag=excluded.etag, last_modified=excluded.last_modified, content_hash=excluded.content_hash, checked_at=excluded.checked_at',
+            (contest_id, url, resp.headers.get('ETag'), resp.headers.get('Last-Modified'), content_hash),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return result
 
-    # Quarterfinal dependencies: team2 depends on First Round winners
-    link(qf_orange, 'team2', fr_ore_jmu)
-    link(qf_rose,   'team2', fr_ou_ala)
-    link(qf_sugar,  'team2', fr_om_tul)
-    link(qf_cotton, 'team2', fr_tamu_mia)
 
-    # Semifinal dependencies (crossing assumption)
-    link(sf_fiesta, 'team1', qf_orange)
-    link(sf_fiesta, 'team2', qf_cotton)
-    link(sf_peach,  'team1', qf_rose)
-    link(sf_peach,  'team2', qf_sugar)
+def cfp_link_rows(rows, template=None) -> list:
+    # rows: games with id, bowl_name, team1, team2, cfp_round. Returns the
+    # (game_id, slot, depends_on_game_id) edges of the bracket template
+    # (brackets/<BRACKET>.json unless given).
+    return (template or bracket_templates.load()).link_rows(rows)
 
-    # Final dependencies
-    link(final, 'team1', sf_fiesta)
-    link(final, 'team2', sf_peach)
 
-    conn.commit()
-    conn.close()
+def build_cfp_links(contest_id: int):
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute('DELETE FROM cfp_links WHERE game_id IN (SELECT id FROM games WHERE contest_id=?)', (contest_id,))
+        cur.execute('SELECT id,bowl_name,team1,team2,cfp_round FROM games WHERE contest_id=?', (contest_id,))
+        cur.executemany('INSERT INTO cfp_links (game_id,slot,depends_on_game_id) VALUES (?,?,?)', cfp_link_rows(cur.fetchall()))
+        if scoring.reseat(conn, contest_id):
+            standings.refresh_outlook(conn, contest_id, commit=False)
+        schedule.bump_version(cur, contest_id)
+        conn.commit()
+    finally:
+        conn.close()
 
 if __name__ == '__main__':
     from db import init_db
@@ -223,7 +410,8 @@ if __name__ == '__main__':
         contest_id = cur.lastrowid
         print(f'Created contest id={contest_id} (access_code=JOIN2025, admin_code=ADMIN2025)')
 
-    load_into_db(contest_id, df)
+    counts = load_into_db(contest_id, df)
     build_cfp_links(contest_id)
     df.to_csv('games.csv', index=False)
+    print(f"Synced games: {counts['inserted']} inserted, {counts['updated']} updated, {counts['deleted']} deleted")
     print('Loaded games, built CFP links, wrote games.csv')
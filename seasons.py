@@ -0,0 +1,229 @@
+import bracket_templates
+import scoring
+import standings
+from bracket import SLOTS
+from schedule import bump_version
+
+# Contest game columns copied from the catalog; points_per_win may be
+# overridden per contest. Winners are not copied on update: they only move
+# through set_winners so every contest is scored with them.
+CATALOG_FIELDS = (
+    'bowl_name', 'team1', 'team2', 'game_date', 'game_time_et', 'network', 'location',
+    'is_cfp', 'cfp_round', 'points_per_win', 'kickoff_et', 'kickoff_pt', 'lock_pt',
+    'kickoff_ts', 'lock_ts',
+)
+
+
+def create_season(cur, name):
+    cur.execute('INSERT INTO seasons (name) VALUES (?)', (name,))
+    return cur.lastrowid
+
+
+def contest_ids(conn, season_id):
+    return [r[0] for r in conn.execute('SELECT id FROM contests WHERE season_id=? ORDER BY id', (season_id,))]
+
+
+def sync_season(conn, season_id, records):
+    # Same natural-key diff as a contest sync, applied once to the catalog and
+    # then projected into every contest on the season. The caller commits.
+    from scrape import clean_records, diff_games, write_games, GAME_FIELDS
+
+    records = clean_records(records)
+    cur = conn.cursor()
+    cur.execute(f'SELECT id, {", ".join(GAME_FIELDS)} FROM season_games WHERE season_id=? ORDER BY id', (season_id,))
+    inserts, updates, deletes = diff_games(cur.fetchall(), records)
+    write_games(cur, 'season_games', GAME_FIELDS, inserts, updates, season_id=season_id)
+    merges = {sgid: survivor for sgid, survivor in deletes if survivor is not None}
+    if deletes:
+        gone = [(sgid,) for sgid, _ in deletes]
+        cur.executemany('DELETE FROM season_links WHERE season_game_id=? OR depends_on_season_game_id=?',
+                        [(sgid, sgid) for sgid, in gone])
+        cur.executemany('DELETE FROM contest_overrides WHERE season_game_id=?', gone)
+        cur.executemany('DELETE FROM season_games WHERE id=?', gone)
+    links = build_season_links(conn, season_id)
+    for contest_id in contest_ids(conn, season_id):
+        materialize(conn, contest_id, merges)
+    return {'inserted': len(inserts), 'updated': len(updates), 'deleted': len(deletes), 'games': len(records),
+            'links': links}
+
+
+def build_season_links(conn, season_id):
+    # Returns the number of links written, or None when the season has no
+    # bracket template (and so keeps no links).
+    name = conn.execute('SELECT name FROM seasons WHERE id=?', (season_id,)).fetchone()
+    template = bracket_templates.for_season(name['name'] if name else None)
+    conn.execute('DELETE FROM season_links WHERE season_game_id IN (SELECT id FROM season_games WHERE season_id=?)',
+                 (season_id,))
+    if template is None:
+        return None
+    rows = conn.execute('SELECT id, bowl_name, team1, team2, cfp_round FROM season_games WHERE season_id=?',
+                        (season_id,)).fetchall()
+    links = template.link_rows(rows)
+    conn.executemany('INSERT INTO season_links (season_game_id, slot, depends_on_season_game_id) VALUES (?, ?, ?)',
+                     links)
+    return len(links)
+
+
+def materialize(conn, contest_id, merges=None):
+    # Brings a contest's games and CFP links in line with its season's catalog
+    # and overrides: one game row per catalog game that is not excluded. Picks
+    # on a game merged away in the catalog move to its survivor; picks on
+    # games that disappear are dropped. Games whose points change are
+    # re-scored. The caller commits. Returns the number of rows changed.
+    from scrape import drop_games, write_games
+
+    season_id = conn.execute('SELECT season_id FROM contests WHERE id=?', (contest_id,)).fetchone()['season_id']
+    if season_id is None:
+        return 0
+    cur = conn.cursor()
+    cols = ', '.join(f'sg.{f}' for f in CATALOG_FIELDS if f != 'points_per_win')
+    wanted = {r['id']: r for r in cur.execute(
+        f'SELECT sg.id, {cols}, COALESCE(o.points_per_win, sg.points_per_win) AS points_per_win, sg.winner '
+        'FROM season_games sg LEFT JOIN contest_overrides o ON o.season_game_id=sg.id AND o.contest_id=? '
+        'WHERE sg.season_id=? AND NOT COALESCE(o.excluded, 0) ORDER BY sg.id',
+        (contest_id, season_id))}
+    current, orphans = {}, []
+    for r in cur.execute(f'SELECT id, season_game_id, {", ".join(CATALOG_FIELDS)} FROM games WHERE contest_id=?',
+                         (contest_id,)):
+        if r['season_game_id'] is None:
+            orphans.append((r['id'], None))
+        else:
+            current[r['season_game_id']] = r
+
+    inserts = [r for sgid, r in wanted.items() if sgid not in current]
+    updates = [(current[sgid]['id'], r) for sgid, r in wanted.items()
+               if sgid in current and any(current[sgid][f] != r[f] for f in CATALOG_FIELDS)]
+    rescore = [gid for gid, r in updates
+               if current[r['id']]['points_per_win'] != r['points_per_win']]
+    deletes = [(row['id'], sgid) for sgid, row in current.items() if sgid not in wanted] + orphans
+
+    # New rows also take the catalog game they copy and its winner.
+    write_games(cur, 'games', CATALOG_FIELDS + ('season_game_id', 'winner'),
+                [{**r, 'season_game_id': r['id']} for r in map(dict, inserts)], [], contest_id=contest_id)
+    write_games(cur, 'games', CATALOG_FIELDS, [], updates)
+    if deletes:
+        game_of = {sgid: row['id'] for sgid, row in current.items()}
+        moved_to = {sgid: game_of[to] for sgid, to in (merges or {}).items() if to in game_of and to in wanted}
+        drop_games(cur, [(gid, moved_to.get(sgid)) for gid, sgid in deletes])
+
+    relinked = _materialize_links(cur, contest_id, season_id)
+    if inserts or updates or deletes or relinked:
+        bump_version(cur, contest_id)
+    reseated = relinked and scoring.reseat(conn, contest_id)
+    if deletes:
+        standings.rebuild(cur, contest_id)
+    elif rescore or reseated:
+        if rescore:
+            scoring.apply_winners_batch(conn, {}, {contest_id: rescore})
+        standings.refresh_outlook(conn, contest_id, commit=False)
+    return len(inserts) + len(updates) + len(deletes)
+
+
+def _materialize_links(cur, contest_id, season_id):
+    # The season's links between games this contest has, in contest game ids.
+    wanted = {tuple(r) for r in cur.execute(
+        'SELECT g.id, l.slot, d.id FROM season_links l '
+        'JOIN games g ON g.season_game_id=l.season_game_id AND g.contest_id=? '
+        'JOIN games d ON d.season_game_id=l.depends_on_season_game_id AND d.contest_id=? '
+        'JOIN season_games sg ON sg.id=l.season_game_id WHERE sg.season_id=?',
+        (contest_id, contest_id, season_id))}
+    current = {tuple(r) for r in cur.execute(
+        'SELECT game_id, slot, depends_on_game_id FROM cfp_links WHERE game_id IN (SELECT id FROM games WHERE contest_id=?)',
+        (contest_id,))}
+    if wanted == current:
+        return False
+    cur.execute('DELETE FROM cfp_links WHERE game_id IN (SELECT id FROM games WHERE contest_id=?)', (contest_id,))
+    cur.executemany('INSERT INTO cfp_links (game_id, slot, depends_on_game_id) VALUES (?, ?, ?)', sorted(wanted))
+    return True
+
+
+def attach(conn, contest_id, season_id):
+    # Points an existing contest at a season. Its games are matched to the
+    # catalog on the scraper's natural key so picks carry over; anything the
+    # catalog lacks is dropped by materialize. The caller commits.
+    from scrape import natural_keys
+
+    conn.execute('UPDATE contests SET season_id=? WHERE id=?', (season_id, contest_id))
+    catalog = conn.execute('SELECT id, bowl_name, game_date FROM season_games WHERE season_id=? ORDER BY id',
+                           (season_id,)).fetchall()
+    games = conn.execute('SELECT id, bowl_name, game_date FROM games WHERE contest_id=? AND season_game_id IS NULL ORDER BY id',
+                         (contest_id,)).fetchall()
+    by_key = dict(zip(natural_keys(catalog), catalog))
+    conn.executemany('UPDATE games SET season_game_id=? WHERE id=?',
+                     [(by_key[key]['id'], g['id']) for key, g in zip(natural_keys(games), games) if key in by_key])
+    changed = materialize(conn, contest_id)
+    # Results already in the catalog win over whatever the contest had.
+    results = {r['id']: r['winner'] for r in conn.execute(
+        'SELECT g.id, sg.winner FROM games g JOIN season_games sg ON sg.id=g.season_game_id '
+        'WHERE g.contest_id=? AND sg.winner IS NOT NULL AND g.winner IS NOT sg.winner', (contest_id,))}
+    scoring.apply_winners_batch(conn, {contest_id: results})
+    return changed
+
+
+def set_override(conn, contest_id, season_game_id, points=None, excluded=False):
+    conn.execute(
+        'INSERT INTO contest_overrides (contest_id, season_game_id, points_per_win, excluded) VALUES (?, ?, ?, ?) '
+        'ON CONFLICT(contest_id, season_game_id) DO UPDATE SET points_per_win=excluded.points_per_win, excluded=excluded.excluded',
+        (contest_id, season_game_id, points, int(excluded)),
+    )
+    return materialize(conn, contest_id)
+
+
+def set_winners(conn, season_id, submitted):
+    # submitted: {season_game_id: 'team1'|'team2'}. Records the results in the
+    # catalog and scores every contest on the season in one batch. The caller
+    # commits. Returns {contest_id: changed game ids}.
+    submitted = {sgid: w for sgid, w in submitted.items() if w in SLOTS}
+    if not submitted:
+        return {}
+    marks = ','.join('?' * len(submitted))
+    conn.executemany('UPDATE season_games SET winner=? WHERE id=? AND season_id=?',
+                     [(w, sgid, season_id) for sgid, w in submitted.items()])
+    per_contest = {}
+    for gid, contest_id, sgid in conn.execute(
+            f'SELECT id, contest_id, season_game_id FROM games WHERE season_game_id IN ({marks})', list(submitted)):
+        per_contest.setdefault(contest_id, {})[gid] = submitted[sgid]
+    return scoring.apply_winners_batch(conn, per_contest)
+
+
+if __name__ == '__main__':
+    import argparse
+    from db import init_db, get_conn
+
+    parser = argparse.ArgumentParser(description='Manage season schedule catalogs shared by contests.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('create', help='create a season')
+    p.add_argument('name')
+    p = sub.add_parser('sync', help='scrape the schedule into a season and update its contests')
+    p.add_argument('season_id', type=int)
+    p.add_argument('--url')
+    p = sub.add_parser('attach', help='move a contest onto a season, keeping its picks')
+    p.add_argument('contest_id', type=int)
+    p.add_argument('season_id', type=int)
+    p = sub.add_parser('override', help="change one game's points in a contest, or leave it out")
+    p.add_argument('contest_id', type=int)
+    p.add_argument('season_game_id', type=int)
+    p.add_argument('--points', type=int)
+    p.add_argument('--exclude', action='store_true')
+    args = parser.parse_args()
+
+    init_db()
+    conn = get_conn()
+    cur = conn.cursor()
+    if args.command == 'create':
+        print(f'season id={create_season(cur, args.name)}')
+    elif args.command == 'sync':
+        from scrape import parse_schedule, NCAA_URL
+        import requests
+        resp = requests.get(args.url or NCAA_URL, timeout=30)
+        resp.raise_for_status()
+        counts = sync_season(conn, args.season_id, parse_schedule(resp.text))
+        print(f"Synced season {args.season_id}: {counts['inserted']} inserted, {counts['updated']} updated, "
+              f"{counts['deleted']} deleted, {len(contest_ids(conn, args.season_id))} contests"
+              + ('' if counts['links'] is not None else '; no bracket template, no CFP links'))
+    elif args.command == 'attach':
+        print(f'{attach(conn, args.contest_id, args.season_id)} game rows changed')
+    elif args.command == 'override':
+        print(f'{set_override(conn, args.contest_id, args.season_game_id, args.points, args.exclude)} game rows changed')
+    conn.commit()
+    conn.close()
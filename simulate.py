@@ -0,0 +1,255 @@
+import os
+import threading
+
+import numpy as np
+
+from bracket import SLOTS, pick_seat, seat
+from schedule import load_schedule
+import standings
+
+SIMULATIONS = int(os.getenv('SIM_RUNS', '2000'))
+# Simulated worlds scored per matmul; bounds the players x batch score matrix.
+BATCH = int(os.getenv('SIM_BATCH', '500'))
+# With at most this many undecided games, elimination is decided over every
+# outcome of them (2 ** n worlds); with more, against the top RIVALS alone.
+EXACT_GAMES = int(os.getenv('SIM_EXACT_GAMES', '12'))
+RIVALS = int(os.getenv('SIM_RIVALS', '8'))
+
+
+# contest_id -> (key, user_ids, seat matrix); see pick_matrix.
+_matrices = {}
+_lock = threading.Lock()
+
+
+def pick_matrix(conn, contest_id, game_ids):
+    # players x games int16 matrix of the seat each pick backs, coded as
+    # 2 * (game's column) + slot, -1 where there is no pick. Reading every
+    # pick costs far more than the simulation, and picks stop changing once
+    # games lock, so the matrix is kept until a player's picks_version moves
+    # or the contest's games change.
+    players, picks_version = conn.execute(
+        'SELECT COUNT(*), TOTAL(picks_version) FROM users WHERE contest_id=?', (contest_id,)).fetchone()
+    key = (tuple(game_ids), players, picks_version)
+    cached = _matrices.get(contest_id)
+    if cached is not None and cached[0] == key:
+        return cached[1], cached[2]
+    user_ids = np.array([r[0] for r in conn.execute('SELECT id FROM users WHERE contest_id=? ORDER BY id', (contest_id,))],
+                        dtype=np.int64)
+    col = {gid: j for j, gid in enumerate(game_ids)}
+    codes = {seat(gid, slot): 2 * j + i for gid, j in col.items() for i, slot in enumerate(SLOTS)}
+    row_of = {uid: i for i, uid in enumerate(user_ids.tolist())}
+    seats = np.full((len(user_ids), len(game_ids)), -1, dtype=np.int16)
+    rows, cols, vals = [], [], []
+    cur = conn.execute(
+        'SELECT p.user_id, p.game_id, p.pick, p.seat FROM users u JOIN picks p ON p.user_id=u.id WHERE u.contest_id=?',
+        (contest_id,))
+    for user_id, gid, pick, stored in cur:
+        code = codes.get(pick_seat(gid, pick, stored), -1)
+        if gid in col:
+            rows.append(row_of[user_id])
+            cols.append(col[gid])
+            vals.append(code)
+    seats[rows, cols] = vals
+    with _lock:
+        _matrices[contest_id] = (key, user_ids, seats)
+    return user_ids, seats
+
+
+class Outlook:
+    # Remaining-games picture for one contest. Every bracket slot's seat has
+    # an integer code; for each undecided game `cands` lists the seat codes
+    # that can still win it, and `picks` is a players x open-games int8
+    # matrix of each player's pick as an index into that list (-1 when the
+    # player has no pick there or backs a seat that is already out).
+
+    def __init__(self, conn, contest_id):
+        schedule = load_schedule(conn, contest_id, None)
+        bracket = schedule.bracket
+        game_ids = sorted(schedule.by_id)
+        code = {gid: 2 * j for j, gid in enumerate(game_ids)}
+        self.n_codes = 2 * len(game_ids)
+        self.order = bracket.order
+        self.winners = {g.id: g.winner for g in schedule.games if g.winner in SLOTS}
+        points = {g.id: g.points_per_win for g in schedule.games}
+
+        # Per game and slot either ('seat', code) for an entry slot or
+        # ('game', feeder) for one filled by an earlier game's winner.
+        self.slots = {}
+        for gid in self.order:
+            feeds = bracket.feeds.get(gid, {})
+            self.slots[gid] = [('game', feeds[slot]) if slot in feeds else ('seat', code[gid] + i)
+                               for i, slot in enumerate(SLOTS)]
+
+        # Seats that can still win each game, following decided results.
+        can_win = {}
+        for gid in self.order:
+            options = [{ref} if kind == 'seat' else can_win[ref] for kind, ref in self.slots[gid]]
+            w = self.winners.get(gid)
+            can_win[gid] = options[SLOTS.index(w)] if w else options[0] | options[1]
+        self.open = [gid for gid in self.order if gid not in self.winners]
+        self.cands = {gid: sorted(can_win[gid]) for gid in self.open}
+        self.points = np.array([points[gid] for gid in self.open], dtype=np.float32)
+        offsets = np.cumsum([0] + [len(self.cands[gid]) for gid in self.open])
+        self.offsets = offsets[:-1]
+        self.width = int(offsets[-1])
+
+        self.user_ids, seats = pick_matrix(conn, contest_id, game_ids)
+        totals = dict(conn.execute('SELECT user_id, points FROM standings WHERE contest_id=?', (contest_id,)).fetchall())
+        self.current = np.array([totals.get(uid, 0) for uid in self.user_ids.tolist()], dtype=np.float32)
+        self.picks = np.full((len(self.user_ids), len(self.open)), -1, dtype=np.int8)
+        col = {gid: j for j, gid in enumerate(game_ids)}
+        for j, gid in enumerate(self.open):
+            # Extra last entry so a missing pick (-1) looks up -1.
+            lookup = np.full(self.n_codes + 1, -1, dtype=np.int8)
+            lookup[self.cands[gid]] = np.arange(len(self.cands[gid]))
+            self.picks[:, j] = lookup[seats[:, col[gid]]]
+
+    def max_points(self):
+        # Every live pick coming true at once is one consistent outcome: a
+        # player's later picks follow from their own earlier ones.
+        return self.current + ((self.picks >= 0) * self.points).sum(axis=1)
+
+    def weights(self):
+        # players x (sum of candidates) matrix: the points a player earns if
+        # that candidate wins that game, one-hot over each game's block.
+        w = np.zeros((len(self.user_ids), self.width), dtype=np.float32)
+        u, j = np.nonzero(self.picks >= 0)
+        w[u, self.offsets[j] + self.picks[u, j]] = self.points[j]
+        return w
+
+    def sample(self, rng, runs):
+        # Simulated worlds: each undecided game a coin flip.
+        return self.worlds(rng.random((len(self.open), runs)) < 0.5)
+
+    def outcomes(self, start, stop):
+        # Worlds start..stop-1 of all 2 ** (open games): bit j of a world's
+        # number says which slot wins open game j.
+        n = np.arange(start, stop, dtype=np.int64)
+        return self.worlds(((n[None, :] >> np.arange(len(self.open))[:, None]) & 1) == 0)
+
+    def worlds(self, first):
+        # (sum of candidates) x runs one-hot matrix of winners, worked through
+        # the bracket in order; first is an open-games x runs bool matrix,
+        # True where the team1 slot wins.
+        runs = first.shape[1]
+        row = {gid: j for j, gid in enumerate(self.open)}
+        won = {}
+        for gid in self.order:
+            pair = [np.full(runs, ref) if kind == 'seat' else won[ref] for kind, ref in self.slots[gid]]
+            w = self.winners.get(gid)
+            if w:
+                won[gid] = pair[SLOTS.index(w)]
+            else:
+                won[gid] = np.where(first[row[gid]], pair[0], pair[1])
+        hot = np.zeros((self.width, runs), dtype=np.float32)
+        for j, gid in enumerate(self.open):
+            lookup = np.full(self.n_codes, -1)
+            lookup[self.cands[gid]] = np.arange(len(self.cands[gid]))
+            hot[self.offsets[j] + lookup[won[gid]], np.arange(runs)] = 1
+        return hot
+
+    def win_probability(self, runs=SIMULATIONS, seed=None):
+        # Share of simulated finishes in which each player ends on top; a tie
+        # for first splits that world between the tied players.
+        rng = np.random.default_rng(seed)
+        weights = self.weights()
+        wins = np.zeros(len(self.user_ids), dtype=np.float64)
+        done = 0
+        while done < runs:
+            batch = min(BATCH, runs - done)
+            scores = self.current[:, None] + weights @ self.sample(rng, batch)
+            top = (scores == scores.max(axis=0)).astype(np.float32)
+            wins += top @ (1 / top.sum(axis=0))
+            done += batch
+        return wins / runs
+
+    def eliminated(self, exact_games=EXACT_GAMES, rivals=RIVALS):
+        # A player is eliminated when no outcome of the undecided games puts
+        # them first, alone or tied, counting every other player's points in
+        # that same outcome.
+        if len(self.open) <= exact_games:
+            weights = self.weights()
+            alive = np.zeros(len(self.user_ids), dtype=bool)
+            worlds = 1 << len(self.open)
+            for start in range(0, worlds, BATCH):
+                scores = self.current[:, None] + weights @ self.outcomes(start, min(start + BATCH, worlds))
+                alive |= (scores == scores.max(axis=0)).any(axis=1)
+            return ~alive
+        # Too many outcomes to try: eliminated when some rival, among those
+        # with the highest totals, finishes ahead in every outcome.
+        out = np.zeros(len(self.user_ids), dtype=bool)
+        for rival in np.argsort(-self.current, kind='stable')[:rivals]:
+            out |= self.best_margin(rival) < 0
+        return out
+
+    def best_margin(self, rival):
+        # The most each player can finish ahead of player `rival` (a row
+        # index) over outcomes of the undecided games. Worked through the
+        # bracket: for each game, the best margin with each seat that can
+        # win it, given that seat's path through the games that feed it.
+        gain = self.weights()
+        gain -= gain[rival]
+        column = {gid: {c: self.offsets[j] + i for i, c in enumerate(self.cands[gid])}
+                  for j, gid in enumerate(self.open)}
+        zero = np.zeros(len(self.user_ids), dtype=np.float32)
+        best, fed = {}, set()
+        for gid in self.order:
+            sides = []
+            for kind, ref in self.slots[gid]:
+                if kind == 'seat':
+                    sides.append({ref: zero})
+                else:
+                    sides.append(best[ref])
+                    fed.add(ref)
+            free = [np.max(list(side.values()), axis=0) if side else zero for side in sides]
+            w = self.winners.get(gid)
+            best[gid] = {c: v + free[1 - i] + (gain[:, column[gid][c]] if gid in column else 0)
+                         for i, side in enumerate(sides) if not w or SLOTS[i] == w
+                         for c, v in side.items()}
+        margin = self.current - self.current[rival]
+        for gid in self.order:
+            if gid not in fed and best[gid]:
+                margin = margin + np.max(list(best[gid].values()), axis=0)
+        return margin
+
+
+def refresh(conn, contest_id, runs=SIMULATIONS):
+    # Stores max possible points, elimination (see Outlook.eliminated) and
+    # win probability on the contest's standings rows. The caller commits.
+    outlook = Outlook(conn, contest_id)
+    if not len(outlook.user_ids):
+        return 0
+    best = outlook.max_points()
+    version = conn.execute('SELECT standings_version FROM contests WHERE id=?', (contest_id,)).fetchone()[0]
+    # Seeded by contest and version so a refresh of unchanged standings
+    # reproduces the same numbers.
+    probability = outlook.win_probability(runs, seed=(contest_id, version))
+    eliminated = outlook.eliminated()
+    conn.executemany(
+        'UPDATE standings SET max_points=?, eliminated=?, win_prob=? WHERE user_id=?',
+        zip(best.astype(int).tolist(), eliminated.astype(int).tolist(),
+            probability.tolist(), outlook.user_ids.tolist()),
+    )
+    standings.bump_version(conn.cursor(), contest_id)
+    return len(outlook.user_ids)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    from db import init_db, get_conn
+
+    parser = argparse.ArgumentParser(description='Recompute max points, elimination and win odds.')
+    parser.add_argument('contest_ids', nargs='*', type=int)
+    parser.add_argument('--runs', type=int, default=SIMULATIONS)
+    args = parser.parse_args()
+
+    init_db()
+    conn = get_conn()
+    contest_ids = args.contest_ids or [r['id'] for r in conn.execute('SELECT id FROM contests').fetchall()]
+    for contest_id in contest_ids:
+        start = time.perf_counter()
+        players = refresh(conn, contest_id, args.runs)
+        conn.commit()
+        print(f'contest {contest_id}: {players} players, {args.runs} runs in {time.perf_counter() - start:.2f}s')
+    conn.close()
@@ -0,0 +1,167 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from flask import g
+
+from db import get_conn, pool
+
+ENABLED = os.getenv('READ_SNAPSHOT', '0') == '1'
+# Longest a read may lag the database by, plus the time one copy takes.
+MAX_AGE = float(os.getenv('SNAPSHOT_MAX_AGE', '2'))
+
+log = logging.getLogger(__name__)
+
+# What the read-only pages query, and all that is copied; None keeps every
+# column. Indexes on the copied columns come along. Picks, by far the
+# largest table, stay in the file: pool analytics reads them there and
+# caches the result until picks_version moves. Access codes, jobs and the
+# season catalog are never copied.
+TABLES = {
+    'contests': ('id', 'name', 'created_at', 'schedule_version', 'standings_version', 'picks_version'),
+    'games': None,
+    'cfp_links': None,
+    'users': ('id', 'contest_id', 'display_name'),
+    'standings': None,
+}
+
+
+class Snapshot:
+    # One per worker process: an in-memory copy of the TABLES the read-only
+    # pages use, for those pages. Readers never touch the file, so they
+    # neither wait on nor hold up pick and winner writes.
+    #
+    # Once the copy is MAX_AGE old the next read starts a refresh in the
+    # background and carries on with the current copy. The refresh first
+    # checks PRAGMA data_version on its own connection to the file, which
+    # only moves when some other connection has committed; unchanged data
+    # just marks the copy current again. A changed one is copied into a new
+    # in-memory database that replaces the old one when complete, so a
+    # reader mid-query keeps the copy it started with.
+
+    def __init__(self, max_age=MAX_AGE):
+        self.max_age = max_age
+        self._conn = None
+        self._verified = 0.0     # when the copy was last known to match the file
+        self._data_version = None
+        self._source = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.stats = {'copies': 0, 'unchanged': 0, 'copy_seconds': 0.0, 'errors': 0}
+
+    def connection(self):
+        with self._lock:
+            conn = self._conn
+            stale = time.monotonic() - self._verified >= self.max_age
+            start = stale and conn is not None and not self._refreshing
+            if start:
+                self._refreshing = True
+        if conn is None:
+            # First read in this process waits for the first copy.
+            self._refresh()
+            return self._conn
+        if start:
+            threading.Thread(target=self._refresh, name='read-snapshot', daemon=True).start()
+        return conn
+
+    def age(self):
+        return max(time.monotonic() - self._verified, 0.0) if self._conn is not None else None
+
+    def _refresh(self):
+        with self._refresh_lock:
+            self._copy()
+
+    def _copy(self):
+        if self._conn is not None and time.monotonic() - self._verified < self.max_age:
+            # Another thread refreshed it while this one waited.
+            with self._lock:
+                self._refreshing = False
+            return
+        started = time.monotonic()
+        try:
+            if self._source is None:
+                self._source = pool.acquire()
+            data_version = self._source.execute('PRAGMA data_version').fetchone()[0]
+            if self._conn is not None and data_version == self._data_version:
+                self.stats['unchanged'] += 1
+            else:
+                copy = _copy_tables(pool.path)
+                copy.execute('PRAGMA query_only=ON')
+                self._data_version = data_version
+                self._conn = copy
+                self.stats['copies'] += 1
+                self.stats['copy_seconds'] = round(time.monotonic() - started, 4)
+            # The copy reflects the file as of when this refresh began.
+            self._verified = started
+        except sqlite3.Error:
+            self.stats['errors'] += 1
+            log.exception('read snapshot refresh failed')
+            if self._conn is None:
+                raise
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def report(self):
+        age = self.age()
+        return {**self.stats, 'enabled': ENABLED, 'max_age': self.max_age,
+                'age': round(age, 3) if age is not None else None}
+
+
+def _copy_tables(path):
+    # A new in-memory database holding TABLES as of one read transaction on
+    # the file at path, with their keys and indexes.
+    copy = sqlite3.connect(':memory:', uri=True, check_same_thread=False)
+    copy.row_factory = sqlite3.Row
+    copy.execute('ATTACH DATABASE ? AS src', (Path(path).resolve().as_uri() + '?mode=ro',))
+    copy.execute('BEGIN')
+    for table, wanted in TABLES.items():
+        info = copy.execute(f'PRAGMA src.table_info({table})').fetchall()
+        cols = [c for c in info if wanted is None or c['name'] in wanted]
+        names = ', '.join(c['name'] for c in cols)
+        key = [c['name'] for c in sorted(cols, key=lambda c: c['pk']) if c['pk']]
+        copy.execute(f'CREATE TABLE main.{table} (' + ', '.join(f"{c['name']} {c['type']}" for c in cols)
+                     + (f', PRIMARY KEY ({", ".join(key)})' if key else '') + ')')
+        copy.execute(f'INSERT INTO main.{table} ({names}) SELECT {names} FROM src.{table}')
+        kept = {c['name'] for c in cols}
+        for name, sql in copy.execute("SELECT name, sql FROM src.sqlite_master WHERE type='index' AND tbl_name=? "
+                                      'AND sql IS NOT NULL', (table,)).fetchall():
+            if {c['name'] for c in copy.execute(f'PRAGMA src.index_info({name})')} <= kept:
+                copy.execute(sql)
+    copy.commit()
+    copy.execute('DETACH DATABASE src')
+    return copy
+
+
+snapshot = Snapshot()
+
+
+def read_conn():
+    # Connection for a read-only page: the worker's snapshot when
+    # READ_SNAPSHOT=1, otherwise the request's pooled connection. The age of
+    # what was read goes out in an X-Snapshot-Age header.
+    if not ENABLED:
+        return get_conn()
+    conn = snapshot.connection()
+    g.snapshot_age = snapshot.age()
+    return conn
+
+
+def _age_header(response):
+    age = g.pop('snapshot_age', None)
+    if age is not None:
+        response.headers['X-Snapshot-Age'] = f'{age:.3f}'
+    return response
+
+
+def gauges():
+    age = snapshot.age()
+    return {} if age is None else {'read_snapshot_age_seconds': age}
+
+
+def init_app(app):
+    app.after_request(_age_header)
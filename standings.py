@@ -0,0 +1,285 @@
+import json
+import logging
+import threading
+
+from db import get_conn, pool
+
+ROUND_ORDER = ('bowl', 'first', 'quarter', 'semi', 'final')
+
+log = logging.getLogger(__name__)
+
+# contest_id -> (standings_version, rows); filled by get_standings.
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def round_key(cfp_round):
+    return cfp_round or 'bowl'
+
+
+def _round_totals(cur, where, params):
+    cur.execute(
+        'SELECT p.user_id, COALESCE(g.cfp_round, \'bowl\') AS rnd, '
+        'SUM(p.points_awarded) AS pts, SUM(p.points_awarded > 0) AS correct '
+        f'FROM picks p JOIN games g ON g.id=p.game_id WHERE {where} GROUP BY p.user_id, rnd',
+        params,
+    )
+    return {(r['user_id'], r['rnd']): (r['pts'], r['correct']) for r in cur.fetchall()}
+
+
+def _rank(entries):
+    # Competition ranking: ties share a rank and the next rank skips ahead.
+    ordered = sorted(entries.items(), key=lambda kv: -kv[1]['points'])
+    rank, prev = 0, None
+    for i, (_, e) in enumerate(ordered, start=1):
+        if e['points'] != prev:
+            rank, prev = i, e['points']
+        e['rank'] = rank
+
+
+def _rerank(cur, contest_id):
+    # Same ordering as _rank, done by SQLite; only rows whose rank moved are written.
+    cur.execute(
+        'UPDATE standings SET rank=r.new_rank FROM ('
+        '  SELECT user_id, RANK() OVER (ORDER BY points DESC) AS new_rank FROM standings WHERE contest_id=?'
+        ') AS r WHERE standings.user_id=r.user_id AND standings.rank != r.new_rank',
+        (contest_id,),
+    )
+
+
+def _load(cur, contest_id):
+    cur.execute('SELECT user_id, points, correct, round_points, rank FROM standings WHERE contest_id=?', (contest_id,))
+    return {
+        r['user_id']: {'points': r['points'], 'correct': r['correct'],
+                       'round_points': json.loads(r['round_points']), 'rank': r['rank']}
+        for r in cur.fetchall()
+    }
+
+
+def _write(cur, contest_id, entries):
+    cur.executemany(
+        'INSERT INTO standings (user_id, contest_id, points, correct, round_points, rank) VALUES (?, ?, ?, ?, ?, ?) '
+        'ON CONFLICT(user_id) DO UPDATE SET points=excluded.points, correct=excluded.correct, '
+        'round_points=excluded.round_points, rank=excluded.rank',
+        [(uid, contest_id, e['points'], e['correct'], json.dumps(e['round_points'], sort_keys=True), e['rank'])
+         for uid, e in entries.items()],
+    )
+
+
+def bump_version(cur, contest_id):
+    cur.execute('UPDATE contests SET standings_version=standings_version+1 WHERE id=?', (contest_id,))
+
+
+def apply_delta_query(cur, sql, params=()):
+    # sql selects (user_id, round, points, correct) deltas, typically grouped
+    # over the picks being re-scored, for players in one contest or several.
+    # Totals move in place for those users only, without the rows leaving
+    # SQLite; ranks are then re-derived once per contest touched. Returns the
+    # ids of those contests.
+    cur.execute('CREATE TEMP TABLE IF NOT EXISTS standings_delta(user_id INTEGER NOT NULL, rnd TEXT NOT NULL, points INTEGER NOT NULL, correct INTEGER NOT NULL)')
+    cur.execute('DELETE FROM standings_delta')
+    cur.execute(f'INSERT INTO standings_delta (user_id, rnd, points, correct) {sql}', params)
+    if not cur.rowcount:
+        return []
+    contest_ids = [r[0] for r in cur.execute(
+        'SELECT DISTINCT u.contest_id FROM users u WHERE u.id IN (SELECT user_id FROM standings_delta)').fetchall()]
+    cur.execute(
+        'INSERT OR IGNORE INTO standings (user_id, contest_id) '
+        'SELECT u.id, u.contest_id FROM users u WHERE u.id IN (SELECT user_id FROM standings_delta)'
+    )
+    # One pass per round keeps each player to a single delta row per UPDATE.
+    rounds = [r[0] for r in cur.execute('SELECT DISTINCT rnd FROM standings_delta').fetchall()]
+    for rnd in rounds:
+        cur.execute(
+            'UPDATE standings SET points=standings.points+d.points, correct=standings.correct+d.correct, '
+            "round_points=json_set(standings.round_points, '$.' || d.rnd, "
+            "COALESCE(json_extract(standings.round_points, '$.' || d.rnd), 0) + d.points) "
+            'FROM standings_delta d WHERE d.rnd=? AND standings.user_id=d.user_id',
+            (rnd,),
+        )
+    for contest_id in contest_ids:
+        _rerank(cur, contest_id)
+        bump_version(cur, contest_id)
+    return contest_ids
+
+
+def add_player(cur, contest_id, user_id):
+    cur.execute('SELECT COUNT(*) FROM standings WHERE contest_id=? AND points > 0', (contest_id,))
+    rank = cur.fetchone()[0] + 1
+    cur.execute(
+        'INSERT OR IGNORE INTO standings (user_id, contest_id, points, correct, round_points, rank) VALUES (?, ?, 0, 0, \'{}\', ?)',
+        (user_id, contest_id, rank),
+    )
+    bump_version(cur, contest_id)
+
+
+def compute(cur, contest_id):
+    # From-scratch standings for one contest, straight from picks.
+    cur.execute('SELECT id FROM users WHERE contest_id=?', (contest_id,))
+    entries = {r['id']: {'points': 0, 'correct': 0, 'round_points': {}, 'rank': 0} for r in cur.fetchall()}
+    totals = _round_totals(cur, 'g.contest_id=?', (contest_id,))
+    for (uid, rnd), (pts, correct) in totals.items():
+        e = entries.get(uid)
+        if e is None:
+            continue
+        e['points'] += pts
+        e['correct'] += correct
+        e['round_points'][rnd] = pts
+    _rank(entries)
+    return entries
+
+
+def rebuild(cur, contest_id):
+    # Rows are rewritten in place, then the outlook columns recomputed from
+    # the new totals; the caller commits.
+    entries = compute(cur, contest_id)
+    cur.execute('DELETE FROM standings WHERE contest_id=? AND user_id NOT IN (SELECT id FROM users WHERE contest_id=?)',
+                (contest_id, contest_id))
+    _write(cur, contest_id, entries)
+    bump_version(cur, contest_id)
+    refresh_outlook(cur.connection, contest_id, commit=False)
+    return entries
+
+
+def refresh_outlook(conn, contest_id, commit=True):
+    # Max points / elimination / win odds for the scoreboard, once the contest
+    # has a result; cleared while it has none. numpy is only needed here, so a
+    # deploy without it still scores winners.
+    decided = conn.execute('SELECT EXISTS(SELECT 1 FROM games WHERE contest_id=? AND winner IS NOT NULL)',
+                           (contest_id,)).fetchone()[0]
+    if not decided:
+        cleared = conn.execute('UPDATE standings SET max_points=NULL, eliminated=0, win_prob=NULL '
+                               'WHERE contest_id=? AND (max_points IS NOT NULL OR eliminated)', (contest_id,)).rowcount
+        if cleared:
+            bump_version(conn.cursor(), contest_id)
+    else:
+        try:
+            import simulate
+        except ImportError:
+            log.warning('numpy not installed; skipping standings outlook')
+            return
+        simulate.refresh(conn, contest_id)
+    if commit:
+        conn.commit()
+
+
+class OutlookQueue:
+    # Contests whose outlook went stale outside a winner update, e.g. picks
+    # saved after the first results. One thread per process refreshes them in
+    # turn so requests never wait on the simulation; a contest marked again
+    # while it is being refreshed is refreshed once more afterwards.
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._stale = []
+        self._thread = None
+        self.stats = {'refreshes': 0, 'errors': 0}
+
+    def mark(self, *contest_ids):
+        with self._cond:
+            self._stale.extend(cid for cid in contest_ids if cid not in self._stale)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='standings-outlook', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._stale:
+                    self._cond.wait()
+                contest_id = self._stale.pop(0)
+            conn = pool.acquire()
+            try:
+                refresh_outlook(conn, contest_id)
+                self.stats['refreshes'] += 1
+            except Exception:
+                log.exception('outlook refresh failed for contest %s', contest_id)
+                self.stats['errors'] += 1
+            finally:
+                conn.close()
+
+
+outlook = OutlookQueue()
+
+
+def rebuild_all(conn):
+    cur = conn.cursor()
+    cur.execute('SELECT id FROM contests')
+    for row in cur.fetchall():
+        rebuild(cur, row['id'])
+
+
+def verify(cur, contest_id):
+    # Returns {user_id: (stored, recomputed)} for every row that disagrees.
+    stored = _load(cur, contest_id)
+    fresh = compute(cur, contest_id)
+    mismatches = {}
+    for uid in stored.keys() | fresh.keys():
+        s, f = stored.get(uid), fresh.get(uid)
+        if s is None or f is None:
+            mismatches[uid] = (s, f)
+            continue
+        s_rounds = {k: v for k, v in s['round_points'].items() if v}
+        f_rounds = {k: v for k, v in f['round_points'].items() if v}
+        if (s['points'], s['correct'], s['rank'], s_rounds) != (f['points'], f['correct'], f['rank'], f_rounds):
+            mismatches[uid] = (s, f)
+    return mismatches
+
+
+def get_standings(conn, contest_id):
+    # Served from the process cache until the contest's standings_version moves,
+    # so a repeat view costs one primary-key lookup.
+    cur = conn.cursor()
+    cur.execute('SELECT standings_version FROM contests WHERE id=?', (contest_id,))
+    row = cur.fetchone()
+    if not row:
+        return ()
+    version = row['standings_version']
+    cached = _cache.get(contest_id)
+    # >= for the same reason as in schedule.get_schedule.
+    if cached and cached[0] >= version:
+        return cached[1]
+    cur.execute(
+        'SELECT s.user_id, u.display_name, s.points, s.correct, s.round_points, s.rank, '
+        's.max_points, s.eliminated, s.win_prob '
+        'FROM standings s JOIN users u ON u.id=s.user_id WHERE s.contest_id=? ORDER BY s.rank, u.display_name',
+        (contest_id,),
+    )
+    rows = tuple(
+        {'user_id': r['user_id'], 'display_name': r['display_name'], 'points': r['points'],
+         'correct': r['correct'], 'round_points': json.loads(r['round_points']), 'rank': r['rank'],
+         'max_points': r['max_points'], 'eliminated': bool(r['eliminated']), 'win_prob': r['win_prob']}
+        for r in cur.fetchall()
+    )
+    with _cache_lock:
+        _cache[contest_id] = (version, rows)
+    return rows
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    from db import init_db
+
+    parser = argparse.ArgumentParser(description='Rebuild standings from picks and report drift from the incremental table.')
+    parser.add_argument('contest_ids', nargs='*', type=int)
+    parser.add_argument('--check', action='store_true', help='only compare, do not rewrite')
+    args = parser.parse_args()
+
+    init_db()
+    conn = get_conn()
+    cur = conn.cursor()
+    contest_ids = args.contest_ids or [r['id'] for r in cur.execute('SELECT id FROM contests').fetchall()]
+    drift = 0
+    for contest_id in contest_ids:
+        mismatches = verify(cur, contest_id)
+        drift += len(mismatches)
+        for uid, (stored, fresh) in sorted(mismatches.items()):
+            print(f'contest {contest_id} user {uid}: stored={stored} recomputed={fresh}')
+        if not args.check:
+            rebuild(cur, contest_id)
+        print(f'contest {contest_id}: {len(mismatches)} mismatched rows' + ('' if args.check else ', rebuilt'))
+    conn.commit()
+    conn.close()
+    sys.exit(1 if args.check and drift else 0)
@@ -0,0 +1,32 @@
+import pytest
+
+import analytics
+import db
+import schedule
+import simulate
+import standings
+import users
+
+
+@pytest.fixture
+def conn(tmp_path):
+    # A migrated database of its own, behind the shared pool, with the
+    # per-process caches emptied: their version keys restart in every file.
+    path = db.pool.path
+    db.pool.clear()
+    db.pool.path = tmp_path / 'test.db'
+    for cache in (analytics._cache, schedule._cache, simulate._matrices, standings._cache):
+        cache.clear()
+    users.invalidate()
+    conn = db.get_conn()
+    db.migrate(conn)
+    yield conn
+    conn.close()
+    db.pool.clear()
+    db.pool.path = path
+
+
+@pytest.fixture
+def client(conn):
+    import app as appmod
+    return appmod.create_app().test_client()
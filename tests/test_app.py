@@ -0,0 +1,42 @@
+import users
+
+
+def player(conn):
+    conn.execute("INSERT INTO contests (id, name, access_code, admin_code) VALUES (1, 'Office', 'play', 'admin')")
+    conn.execute("INSERT INTO users (id, contest_id, display_name) VALUES (1, 1, 'Ann')")
+    conn.commit()
+
+
+def test_only_routes_that_use_the_user_look_it_up(conn, client, monkeypatch):
+    player(conn)
+    lookups = []
+    get_user = users.get_user
+    monkeypatch.setattr(users, 'get_user', lambda *args: lookups.append(args[1]) or get_user(*args))
+    with client.session_transaction() as s:
+        s.update(user_id=1, contest_id=1, role='player')
+
+    for path in ('/scoreboard', '/healthz', '/api/v1/contests/1/standings'):
+        assert client.get(path).status_code == 200, path
+    assert lookups == []
+
+    assert client.get('/picks').status_code == 200
+    assert client.get('/api/v1/me/picks').status_code == 200
+    assert lookups == [1, 1]
+
+
+def test_old_session_gets_contest_and_role_filled_in(conn, client):
+    player(conn)
+    with client.session_transaction() as s:
+        s['user_id'] = 1
+    client.get('/healthz')
+    with client.session_transaction() as s:
+        assert (s['contest_id'], s['role']) == (1, 'player')
+
+
+def test_session_of_a_deleted_user_is_dropped(conn, client):
+    player(conn)
+    with client.session_transaction() as s:
+        s.update(user_id=99, contest_id=1, role='player')
+    assert client.get('/picks').status_code == 302
+    with client.session_transaction() as s:
+        assert 'user_id' not in s
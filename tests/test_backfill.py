@@ -0,0 +1,43 @@
+from pathlib import Path
+
+import backfill
+
+FIXTURES = Path(__file__).resolve().parent.parent / 'bench' / 'fixtures'
+PAGES = [str(FIXTURES / 'schedule-2024-25.html'), str(FIXTURES / 'schedule-2025-26.html')]
+
+
+def run(conn, workers=2):
+    jobs = [(path, backfill.season_year(path)) for path in PAGES]
+    return {r['season']: r for r in backfill.backfill(conn, jobs, workers, progress=lambda r: None)}
+
+
+def test_backfill_loads_each_season_with_its_own_bracket(conn):
+    results = run(conn)
+
+    assert {s: (r['games'], r['inserted'], r['updated'], r['deleted'], r['links'], r.get('error'))
+            for s, r in results.items()} == {
+        '2024-25': (46, 46, 0, 0, 10, None),
+        '2025-26': (51, 51, 0, 0, 10, None),
+    }
+    first, last = conn.execute('SELECT MIN(game_date), MAX(game_date) FROM season_games WHERE season_id=?',
+                               (results['2024-25']['season_id'],)).fetchone()
+    assert (first, last) == ('2024-12-14', '2025-01-20')
+    # The older page's quarterfinals are found by sponsor-prefixed bowl names
+    # and its first round by seeded team names.
+    fed = conn.execute(
+        'SELECT g.bowl_name, l.slot, d.team1, d.team2 FROM season_links l '
+        'JOIN season_games g ON g.id=l.season_game_id JOIN season_games d ON d.id=l.depends_on_season_game_id '
+        "WHERE g.season_id=? AND g.bowl_name LIKE 'Rose Bowl%'", (results['2024-25']['season_id'],)).fetchall()
+    assert [tuple(r) for r in fed] == [
+        ('Rose Bowl Game presented by Prudential (College Football Playoff Quarterfinal)', 'team2',
+         'No. 9 Tennessee', 'No. 8 Ohio State'),
+    ]
+
+
+def test_backfill_again_changes_nothing(conn):
+    run(conn)
+    again = run(conn, workers=1)
+    assert {s: (r['inserted'], r['updated'], r['deleted'], r['links']) for s, r in again.items()} == {
+        '2024-25': (0, 0, 0, 10),
+        '2025-26': (0, 0, 0, 10),
+    }
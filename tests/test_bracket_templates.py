@@ -0,0 +1,42 @@
+from pathlib import Path
+
+import bracket_templates
+import seasons
+from scrape import iter_records, page_lines
+
+FIXTURES = Path(__file__).resolve().parent.parent / 'bench' / 'fixtures'
+
+
+def records(page, year):
+    return list(iter_records(page_lines((FIXTURES / page).read_text(encoding='utf-8')), year))
+
+
+def link_count(template):
+    return sum(len(g['feeds']) for g in template.games)
+
+
+def season_links(conn, season_id):
+    return conn.execute('SELECT COUNT(*) FROM season_links l JOIN season_games g ON g.id=l.season_game_id '
+                        'WHERE g.season_id=?', (season_id,)).fetchone()[0]
+
+
+def test_contests_without_a_season_use_the_default():
+    assert bracket_templates.for_season(None) is bracket_templates.load(bracket_templates.DEFAULT_BRACKET)
+
+
+def test_season_uses_its_own_template(conn):
+    season_id = seasons.create_season(conn.cursor(), '2025-26')
+    result = seasons.sync_season(conn, season_id, records('schedule-2025-26.html', 2025))
+    want = link_count(bracket_templates.load('2025-26'))
+    assert result['links'] == want
+    assert season_links(conn, season_id) == want
+
+
+def test_unknown_season_gets_no_links_from_another_year(conn):
+    # The 2025-26 page under another season's name would link up completely
+    # if the default template were used.
+    assert bracket_templates.for_season('1999-00') is None
+    season_id = seasons.create_season(conn.cursor(), '1999-00')
+    result = seasons.sync_season(conn, season_id, records('schedule-2025-26.html', 1999))
+    assert result['links'] is None
+    assert season_links(conn, season_id) == 0
@@ -0,0 +1,11 @@
+import db
+
+
+def test_hot_queries_use_indexes_on_a_fresh_database(conn):
+    assert db.schema_version(conn) == db.LATEST_VERSION
+    assert db.check_query_plans(conn) == {}
+
+
+def test_a_missing_index_is_reported(conn):
+    conn.execute('DROP INDEX idx_standings_contest')
+    assert list(db.check_query_plans(conn)) == ['scoreboard']
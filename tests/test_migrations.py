@@ -0,0 +1,62 @@
+import json
+import sqlite3
+
+import db
+import standings
+
+
+def baseline_db(path):
+    # The schema the app shipped with before versioned migrations, with data.
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    for sql in db.MIGRATIONS[0][2]:
+        conn.execute(sql)
+    conn.execute("INSERT INTO contests (id, name, access_code, admin_code) VALUES (1, 'Office', 'play', 'admin')")
+    conn.executemany(
+        'INSERT INTO games (id, contest_id, bowl_name, team1, team2, game_date, is_cfp, cfp_round, '
+        'points_per_win, kickoff_pt, lock_pt, winner) VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [
+            (1, 'Rose Bowl', 'Indiana', 'Alabama', '2025-01-01', 1, 'quarter', 2,
+             '2025-01-01T13:00:00-08:00', '2025-01-01T12:55:00-08:00', 'team1'),
+            (2, 'Sugar Bowl', 'Georgia', 'Ole Miss', '2025-01-01', 1, 'quarter', 2,
+             '2025-01-01T17:00:00-08:00', '2025-01-01T16:55:00-08:00', None),
+            (3, 'Peach Bowl', 'TBD', 'TBD', '2025-01-09', 1, 'semi', 3, None, None, None),
+            (4, 'Gator Bowl', 'Duke', 'Ole Miss', '2024-12-28', 0, None, 1, 'not a time', None, 'team2'),
+        ],
+    )
+    conn.executemany('INSERT INTO cfp_links (game_id, slot, depends_on_game_id) VALUES (3, ?, ?)',
+                     [('team1', 1), ('team2', 2)])
+    conn.executemany("INSERT INTO users (id, contest_id, display_name) VALUES (?, 1, ?)", [(1, 'Ann'), (2, 'Bo')])
+    conn.executemany(
+        'INSERT INTO picks (user_id, game_id, pick, points_awarded) VALUES (?, ?, ?, ?)',
+        [(1, 1, 'team1', 2), (1, 2, 'team2', 0), (1, 3, 'team2', 0), (1, 4, 'team2', 1),
+         (2, 1, 'team2', 0), (2, 3, 'team2', 0)],
+    )
+    conn.commit()
+    return conn
+
+
+def test_baseline_database_with_data_migrates(tmp_path):
+    conn = baseline_db(tmp_path / 'old.db')
+    applied = db.migrate(conn)
+
+    assert applied == [v for v, _, _ in db.MIGRATIONS]
+    assert db.schema_version(conn) == db.LATEST_VERSION
+
+    seats = {(r['user_id'], r['game_id']): r['seat'] for r in conn.execute('SELECT user_id, game_id, seat FROM picks')}
+    assert seats == {
+        (1, 1): '1:team1', (1, 2): '2:team2', (1, 3): '2:team2', (1, 4): '4:team2',
+        (2, 1): '1:team2', (2, 3): None,  # Bo's semifinal team came from a game not picked
+    }
+
+    rows = {r['user_id']: r for r in conn.execute('SELECT * FROM standings')}
+    assert (rows[1]['points'], rows[1]['correct'], rows[1]['rank']) == (3, 2, 1)
+    assert json.loads(rows[1]['round_points']) == {'bowl': 1, 'quarter': 2, 'semi': 0}
+    assert (rows[2]['points'], rows[2]['correct'], rows[2]['rank']) == (0, 0, 2)
+    assert standings.verify(conn.cursor(), 1) == {}
+
+    locks = {r['id']: (r['kickoff_ts'], r['lock_ts']) for r in conn.execute('SELECT id, kickoff_ts, lock_ts FROM games')}
+    assert locks[1] == (1735765200, 1735764900)
+    assert locks[4] == (None, None)
+
+    assert db.migrate(conn) == []
@@ -0,0 +1,103 @@
+import sqlite3
+import time
+from concurrent.futures import Future
+
+import pick_journal
+from pickset import ACCEPTED, LOCKED
+from schedule import get_schedule
+
+KICKOFF = int(time.time()) + 3600
+
+
+class Clock:
+    # Stands in for the time module in pick_journal: time() returns the
+    # given instants in turn, then keeps returning the last.
+    perf_counter = staticmethod(time.perf_counter)
+
+    def __init__(self, *instants):
+        self.instants = list(instants)
+
+    def time(self):
+        return self.instants.pop(0) if len(self.instants) > 1 else self.instants[0]
+
+
+def contest(conn):
+    conn.execute("INSERT INTO contests (id, name, access_code, admin_code) VALUES (1, 'Office', 'play', 'admin')")
+    conn.executemany("INSERT INTO games (id, contest_id, bowl_name, team1, team2, game_date, lock_ts) "
+                     "VALUES (?, 1, ?, 'A', 'B', '2025-12-20', ?)",
+                     [(1, 'Early Bowl', KICKOFF + 2), (2, 'Late Bowl', None)])
+    conn.execute("INSERT INTO users (id, contest_id, display_name) VALUES (1, 1, 'Ann')")
+    conn.commit()
+
+
+def stored(conn):
+    conn.rollback()
+    return dict(conn.execute('SELECT game_id, pick FROM picks WHERE user_id=1'))
+
+
+def journal(monkeypatch):
+    monkeypatch.setattr(pick_journal, 'ENABLED', True)
+    monkeypatch.setattr(pick_journal, 'journal', pick_journal.Journal())
+    return pick_journal.journal
+
+
+def test_game_that_locks_before_the_commit_is_rejected(conn, monkeypatch):
+    contest(conn)
+    writer = journal(monkeypatch)
+    # Game 1 is open when the batch is validated and locked by the time it
+    # would commit.
+    monkeypatch.setattr(pick_journal, 'time', Clock(KICKOFF, KICKOFF + 5))
+
+    accepted, report = pick_journal.save(conn, get_schedule(conn, 1), 1, {1: 'team1', 2: 'team2'})
+
+    assert report == {1: LOCKED, 2: ACCEPTED}
+    assert accepted == {2: 'team2'}
+    assert stored(conn) == {2: 'team2'}
+    assert writer.stats['revalidated'] == 1
+
+
+def test_game_still_open_at_commit_is_saved(conn, monkeypatch):
+    contest(conn)
+    writer = journal(monkeypatch)
+    monkeypatch.setattr(pick_journal, 'time', Clock(KICKOFF, KICKOFF + 1))
+
+    accepted, report = pick_journal.save(conn, get_schedule(conn, 1), 1, {1: 'team1'})
+
+    assert report == {1: ACCEPTED}
+    assert stored(conn) == {1: 'team1'}
+    assert writer.stats['revalidated'] == 0
+
+
+def put_picks(client):
+    with client.session_transaction() as s:
+        s.update(user_id=1, contest_id=1, role='player')
+    return client.put('/api/v1/me/picks', json={'picks': {'2': 'team1'}})
+
+
+def test_unconfirmed_save_is_a_503(conn, client, monkeypatch):
+    contest(conn)
+    writer = journal(monkeypatch)
+    monkeypatch.setattr(pick_journal, 'ACK_TIMEOUT', 0.01)
+    monkeypatch.setattr(writer, 'submit', lambda *args: Future())
+
+    resp = put_picks(client)
+
+    assert resp.status_code == 503
+    assert 'not confirmed' in resp.json['error']
+    assert writer.stats['timeouts'] == 1
+    assert stored(conn) == {}
+
+
+def test_failed_batch_is_a_503(conn, client, monkeypatch):
+    contest(conn)
+    writer = journal(monkeypatch)
+    failed = Future()
+    failed.set_exception(sqlite3.OperationalError('disk I/O error'))
+    monkeypatch.setattr(writer, 'submit', lambda *args: failed)
+
+    resp = put_picks(client)
+
+    assert resp.status_code == 503
+    assert 'could not be saved' in resp.json['error']
+    assert writer.stats['failed'] == 1
+    assert stored(conn) == {}
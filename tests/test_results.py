@@ -0,0 +1,87 @@
+import json
+from pathlib import Path
+
+import results
+import seasons
+from scrape import iter_records, page_lines
+
+FIXTURES = Path(__file__).resolve().parent.parent / 'bench' / 'fixtures'
+
+SCORES = """<html><body><article>
+<h3>Friday, Dec. 20</h3>
+<ul>
+<li>Cure Bowl: Ohio 30, Jacksonville State 27</li>
+</ul>
+<h3>Saturday, Dec. 28</h3>
+<ul>
+<li>Pop-Tarts Bowl: Iowa State 42, Miami 41</li>
+</ul>
+<h3>Thursday, Jan. 2</h3>
+<ul>
+<li>Sugar Bowl: Notre Dame 23, Georgia 10</li>
+</ul>
+</article></body></html>"""
+
+
+class Response:
+    def __init__(self, text, content_type='text/html'):
+        self.status_code = 200
+        self.text = text
+        self.content = text.encode()
+        self.headers = {'Content-Type': content_type}
+
+    def raise_for_status(self):
+        pass
+
+
+def serve(monkeypatch, text, content_type='text/html'):
+    monkeypatch.setattr(results.requests, 'get', lambda *args, **kwargs: Response(text, content_type))
+
+
+def season_contest(conn):
+    cur = conn.cursor()
+    season_id = seasons.create_season(cur, '2024-25')
+    page = (FIXTURES / 'schedule-2024-25.html').read_text(encoding='utf-8')
+    seasons.sync_season(conn, season_id, list(iter_records(page_lines(page), 2024)))
+    cur.execute("INSERT INTO contests (id, name, access_code, admin_code) VALUES (1, 'Office', 'play', 'admin')")
+    seasons.attach(conn, 1, season_id)
+    conn.commit()
+
+
+def test_json_entries_that_are_not_games_are_skipped():
+    body = json.dumps({'games': [None, 'Cure Bowl', 3,
+                                 {'bowl_name': 'Cure Bowl', 'team1': 'Ohio', 'team2': 'Jacksonville State',
+                                  'winner': 'team1'}]})
+    assert [r['winner'] for r in results.parse(body, 'application/json')] == ['Ohio']
+
+
+def test_unreadable_feed_fails_the_poll_not_the_poller(conn, monkeypatch):
+    poller = results.Poller('https://example.test/scores', interval=1)
+    for body in ('{"games": {"Cure Bowl": 1}}', '[{"bowl_name": "Cure Bowl", "team1": "Ohio", "team2": "JSU", '
+                                                '"team1_score": "thirty", "team2_score": 27, "status": "final"}]'):
+        serve(monkeypatch, body, 'application/json')
+        summary, error = poller.run(once=True)
+        assert summary is None
+        assert isinstance(error, results.FeedError)
+    assert poller.content_hash is None
+
+
+def test_html_results_are_dated_in_the_contests_season(conn, monkeypatch):
+    season_contest(conn)
+    assert results.season_year(conn) == 2024
+    serve(monkeypatch, SCORES)
+
+    summary, error = results.Poller('https://example.test/scores').run(once=True)
+
+    assert error is None
+    conn.rollback()
+    won = dict(conn.execute('SELECT bowl_name, winner FROM games WHERE contest_id=1 AND winner IS NOT NULL'))
+    assert won == {'Cure Bowl': 'team1', 'Pop-Tarts Bowl': 'team1'}
+    # Notre Dame's first-round game is undecided, so the Sugar Bowl waits,
+    # reported under its 2024-25 date.
+    assert [(r['bowl_name'], r['game_date']) for r in summary['unmatched']] == [('Sugar Bowl', '2025-01-02')]
+
+
+def test_html_dates_follow_the_given_season():
+    dates = [r['game_date'] for r in results.parse_html(SCORES, 2024)]
+    assert dates == ['2024-12-20', '2024-12-28', '2025-01-02']
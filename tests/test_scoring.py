@@ -0,0 +1,83 @@
+import random
+
+import scoring
+import standings
+from bench.synth import generate_contest
+from schedule import load_schedule
+
+
+def bracket_contest(conn):
+    # Two first-round games feeding a semifinal, and a bowl game. Ann and
+    # Bo both take team1 in the semifinal, but Ann carried game 1's team1
+    # there and Bo its team2.
+    conn.execute("INSERT INTO contests (id, name, access_code, admin_code) VALUES (1, 'Office', 'play', 'admin')")
+    conn.executemany(
+        "INSERT INTO games (id, contest_id, bowl_name, team1, team2, game_date, is_cfp, cfp_round, points_per_win) "
+        "VALUES (?, 1, ?, ?, ?, '2025-12-20', ?, ?, ?)",
+        [(1, 'College Football Playoff First Round', 'Oregon', 'Tulane', 1, 'first', 1),
+         (2, 'College Football Playoff First Round', 'Georgia', 'Miami', 1, 'first', 1),
+         (3, 'College Football Playoff Semifinal', 'TBD', 'TBD', 1, 'semi', 3),
+         (4, 'Gator Bowl', 'Duke', 'Ole Miss', 0, None, 1)])
+    conn.executemany('INSERT INTO cfp_links (game_id, slot, depends_on_game_id) VALUES (3, ?, ?)',
+                     [('team1', 1), ('team2', 2)])
+    conn.executemany("INSERT INTO users (id, contest_id, display_name) VALUES (?, 1, ?)", [(1, 'Ann'), (2, 'Bo')])
+    conn.executemany('INSERT INTO picks (user_id, game_id, pick) VALUES (?, ?, ?)',
+                     [(1, 1, 'team1'), (1, 2, 'team1'), (1, 3, 'team1'),
+                      (2, 1, 'team2'), (2, 2, 'team1'), (2, 3, 'team1')])
+    scoring.reseat(conn, 1)
+    standings.rebuild(conn.cursor(), 1)
+    conn.commit()
+
+
+def awarded(conn, game_id):
+    return dict(conn.execute('SELECT user_id, points_awarded FROM picks WHERE game_id=? ORDER BY user_id', (game_id,)))
+
+
+def test_changed_winner_rescores_the_game_it_feeds(conn):
+    bracket_contest(conn)
+    assert scoring.apply_winners(conn, 1, {1: 'team1', 2: 'team1', 3: 'team1'}) == [1, 2, 3]
+    assert awarded(conn, 3) == {1: 3, 2: 0}
+
+    # Game 1 corrected: Bo's team, not Ann's, is the semifinal's team1 now.
+    assert scoring.apply_winners(conn, 1, {1: 'team2', 2: 'team1', 3: 'team1'}) == [1]
+    assert awarded(conn, 1) == {1: 0, 2: 1}
+    assert awarded(conn, 3) == {1: 0, 2: 3}
+    assert standings.verify(conn.cursor(), 1) == {}
+
+
+def test_winner_before_its_feeder_scores_by_slot(conn):
+    bracket_contest(conn)
+    # The semifinal's team1 is not known yet, so both team1 picks score.
+    scoring.apply_winners(conn, 1, {3: 'team1'})
+    assert awarded(conn, 3) == {1: 3, 2: 3}
+
+    # Once game 1 is decided only the pick carrying its winner keeps them.
+    scoring.apply_winners(conn, 1, {1: 'team1'})
+    assert awarded(conn, 3) == {1: 3, 2: 0}
+    assert standings.verify(conn.cursor(), 1) == {}
+
+
+def test_pick_without_a_seat_scores_by_slot(conn):
+    bracket_contest(conn)
+    # As stored before seats existed.
+    conn.execute("INSERT INTO picks (user_id, game_id, pick, seat) VALUES (1, 4, 'team2', NULL)")
+    conn.execute("INSERT INTO picks (user_id, game_id, pick, seat) VALUES (2, 4, 'team1', NULL)")
+    scoring.apply_winners(conn, 1, {4: 'team2'})
+    assert awarded(conn, 4) == {1: 1, 2: 0}
+    assert standings.verify(conn.cursor(), 1) == {}
+
+
+def test_incremental_standings_match_a_rebuild(conn):
+    rng = random.Random(7)
+    contest_id = generate_contest(conn, players=60, bowls=8, seed=7)
+    order = load_schedule(conn, contest_id, None).bracket.order
+    cur = conn.cursor()
+    # Winners set, corrected and set again in batches, out of bracket order.
+    for _ in range(12):
+        batch = {gid: rng.choice(('team1', 'team2')) for gid in rng.sample(order, 5)}
+        scoring.apply_winners(conn, contest_id, batch)
+        stored = {r['user_id']: (r['points'], r['correct'], r['rank']) for r in conn.execute(
+            'SELECT user_id, points, correct, rank FROM standings WHERE contest_id=?', (contest_id,))}
+        fresh = {uid: (e['points'], e['correct'], e['rank']) for uid, e in standings.compute(cur, contest_id).items()}
+        assert stored == fresh
+        assert standings.verify(cur, contest_id) == {}
@@ -0,0 +1,86 @@
+from pathlib import Path
+
+import pytest
+import requests
+
+import db
+import scrape
+
+PAGE = (Path(__file__).resolve().parent.parent / 'bench' / 'fixtures' / 'schedule-2025-26.html').read_text(encoding='utf-8')
+
+
+def games(conn):
+    conn.rollback()
+    return {r['bowl_name']: r for r in conn.execute('SELECT * FROM games WHERE contest_id=1')}
+
+
+def loaded(conn):
+    conn.execute("INSERT INTO contests (id, name, access_code, admin_code) VALUES (1, 'Office', 'play', 'admin')")
+    conn.execute("INSERT INTO users (id, contest_id, display_name) VALUES (1, 1, 'Ann')")
+    conn.commit()
+    scrape.sync_games(1, scrape.parse_schedule(PAGE))
+    scrape.build_cfp_links(1)
+    return games(conn)
+
+
+def test_rescrape_keeps_picks_on_changed_and_moved_games(conn):
+    before = loaded(conn)
+    picked = ['LA Bowl', 'Hawaii Bowl', 'College Football Playoff Quarterfinal at the Rose Bowl']
+    conn.executemany("INSERT INTO picks (user_id, game_id, pick) VALUES (1, ?, 'team1')",
+                     [(before[name]['id'],) for name in picked])
+    conn.commit()
+
+    # A kickoff time moves, a TBD team is filled in, and one game moves to
+    # the next day.
+    hawaii = '<li>Hawaii Bowl: Kansas State vs. Iowa 3:30 p.m. | TNT Annapolis, Md.</li>\n'
+    page = (PAGE.replace('LA Bowl: Iowa State vs. Northwestern 7 p.m.', 'LA Bowl: Iowa State vs. Northwestern 8:30 p.m.')
+                .replace('Rose Bowl: Indiana vs. TBD', 'Rose Bowl: Indiana vs. Oklahoma')
+                .replace(hawaii, '')
+                .replace('<h3>Thursday, December 18</h3>\n<ul>\n', '<h3>Thursday, December 18</h3>\n<ul>\n' + hawaii))
+    assert page.count('Hawaii Bowl') == 1 and page != PAGE
+
+    result = scrape.sync_games(1, scrape.parse_schedule(page))
+
+    assert (result['inserted'], result['updated'], result['deleted']) == (0, 3, 0)
+    after = games(conn)
+    assert after['LA Bowl']['game_time_et'] == '8:30 p.m.'
+    assert after['College Football Playoff Quarterfinal at the Rose Bowl']['team2'] == 'Oklahoma'
+    assert after['Hawaii Bowl']['game_date'] == '2025-12-18'
+    assert {name: after[name]['id'] for name in picked} == {name: before[name]['id'] for name in picked}
+    kept = {r[0] for r in conn.execute('SELECT game_id FROM picks WHERE user_id=1')}
+    assert kept == {before[name]['id'] for name in picked}
+
+
+class Response:
+    def __init__(self, status_code, text=''):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode()
+        self.headers = {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} error')
+
+
+def failing_get(error):
+    def get(*args, **kwargs):
+        raise error
+    return get
+
+
+@pytest.mark.parametrize('get, error', [
+    (failing_get(requests.ConnectionError('refused')), requests.ConnectionError),
+    (lambda *args, **kwargs: Response(500), requests.HTTPError),
+    (lambda *args, **kwargs: Response(200, '<html><body><p>Moved</p></body></html>'), ValueError),
+])
+def test_failed_sync_returns_its_connection(conn, monkeypatch, get, error):
+    loaded(conn)
+    monkeypatch.setattr(scrape.requests, 'get', get)
+    before = db.pool.stats()
+    with pytest.raises(error):
+        scrape.sync_from_url(1, 'https://example.test/schedule')
+    after = db.pool.stats()
+    # Every connection checked out went back: new ones add to the idle list.
+    assert after['idle'] - before['idle'] == after['misses'] - before['misses']
+    assert after['hits'] + after['misses'] > before['hits'] + before['misses']
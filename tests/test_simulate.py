@@ -0,0 +1,61 @@
+import standings
+import simulate
+
+
+def contest(conn, games, picks):
+    # games: (id, points, winner); picks: {display name: {game id: pick}}.
+    conn.execute("INSERT INTO contests (id, name, access_code, admin_code) VALUES (1, 'Office', 'play', 'admin')")
+    conn.executemany("INSERT INTO games (id, contest_id, bowl_name, team1, team2, game_date, points_per_win, winner) "
+                     "VALUES (?, 1, ?, 'A', 'B', '2025-12-20', ?, ?)",
+                     [(gid, f'Bowl {gid}', points, winner) for gid, points, winner in games])
+    won = {gid: (points, winner) for gid, points, winner in games}
+    for uid, (name, chosen) in enumerate(picks.items(), 1):
+        conn.execute('INSERT INTO users (id, contest_id, display_name) VALUES (?, 1, ?)', (uid, name))
+        conn.executemany('INSERT INTO picks (user_id, game_id, pick, seat, points_awarded) VALUES (?, ?, ?, ?, ?)',
+                         [(uid, gid, pick, f'{gid}:{pick}', won[gid][0] if won[gid][1] == pick else 0)
+                          for gid, pick in chosen.items()])
+    standings.rebuild(conn.cursor(), 1)
+    conn.commit()
+
+
+def eliminated(conn):
+    return {r['display_name']: bool(r['eliminated']) for r in standings.get_standings(conn, 1)}
+
+
+def test_leader_with_the_same_open_pick_eliminates(conn):
+    # Pat's best case (3) beats Lee's current 2, but Lee picked the same
+    # team in the only open game, so Pat can never catch up.
+    contest(conn, [(1, 2, 'team1'), (2, 3, None)], {
+        'Lee': {1: 'team1', 2: 'team1'},
+        'Pat': {1: 'team2', 2: 'team1'},
+    })
+    outlook = simulate.Outlook(conn, 1)
+    assert (outlook.max_points() >= outlook.current.max()).all()
+
+    assert eliminated(conn) == {'Lee': False, 'Pat': True}
+    # Checked against the leader alone, too many games to try them all.
+    assert outlook.eliminated(exact_games=0).tolist() == [False, True]
+
+
+def test_elimination_counts_every_player_in_the_same_outcome(conn):
+    # Pat can finish ahead of each rival in some outcome, but in every
+    # outcome one of them finishes ahead.
+    contest(conn, [(1, 1, 'team1'), (2, 1, None), (3, 1, None)], {
+        'Pat': {2: 'team1'},
+        'Lee': {2: 'team2'},
+        'Ray': {2: 'team1', 3: 'team1'},
+        'Sam': {2: 'team1', 3: 'team2'},
+    })
+    assert eliminated(conn) == {'Pat': True, 'Lee': False, 'Ray': False, 'Sam': False}
+    outlook = simulate.Outlook(conn, 1)
+    assert not outlook.eliminated(exact_games=0).any()
+
+
+def test_nobody_with_a_chance_is_eliminated(conn):
+    contest(conn, [(1, 1, 'team1'), (2, 1, None), (3, 2, None)], {
+        'Pat': {1: 'team1', 2: 'team1'},
+        'Lee': {3: 'team2'},
+    })
+    rows = {r['display_name']: r for r in standings.get_standings(conn, 1)}
+    assert not any(r['eliminated'] for r in rows.values())
+    assert all(r['win_prob'] > 0 for r in rows.values())
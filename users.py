@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, session
+
+CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '1024'))
+CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '300'))
+
+# user_id -> (expires_at, user dict), least recently used first.
+_cache = OrderedDict()
+_lock = threading.Lock()
+stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def _store(user_id, user):
+    with _lock:
+        _cache[user_id] = (time.monotonic() + CACHE_TTL, user)
+        _cache.move_to_end(user_id)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+            stats['evictions'] += 1
+
+
+def cached(user_id):
+    with _lock:
+        entry = _cache.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            _cache.move_to_end(user_id)
+            stats['hits'] += 1
+            return entry[1]
+        stats['misses'] += 1
+    return None
+
+
+def get_user(get_conn, user_id):
+    # get_conn is only called on a miss, so a warm lookup never checks out a
+    # connection. Missing users are not cached; the caller drops the session.
+    user = cached(user_id)
+    if user is not None:
+        return user
+    row = get_conn().execute('SELECT * FROM users WHERE id=?', (user_id,)).fetchone()
+    if row is None:
+        return None
+    user = dict(row)
+    _store(user_id, user)
+    return user
+
+
+def current_user(get_conn):
+    # The signed-in user, looked up on the first call in a request and kept
+    # in g; requests that never call it cost no identity query. A session
+    # whose user is gone is dropped.
+    if 'user' not in g:
+        g.user = None
+        uid = session.get('user_id')
+        if uid:
+            g.user = get_user(get_conn, uid)
+            if g.user is None:
+                session.clear()
+    return g.user
+
+
+def invalidate(user_id=None):
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)